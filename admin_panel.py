@@ -1,46 +1,70 @@
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+import asyncio
+import os
+import tempfile
+import time
+from itertools import groupby
+from operator import itemgetter
+from aiogram import Bot, Router, F
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from database import Database
-from keyboards import get_admin_keyboard, get_main_menu
+from database import AsyncDatabase
+from callbacks import AdminNominationCallback, AdminDeleteParticipantCallback, VotersPageCallback
+from keyboards import get_admin_keyboard, get_main_menu, cached_keyboard
+from transfer import FORMATS, GZIP_SUFFIX, MAX_DOCUMENT_SIZE, detect_format, gzip_file, is_gzip
+from results import LiveResults, get_statistics_text
+from backup import BackupManager
 from config import ADMINS
 
 class AdminStates(StatesGroup):
     waiting_for_nomination_add = State()
     waiting_for_participant_name = State()
     waiting_for_nomination_delete = State()
+    waiting_for_import_file = State()
 
 router = Router()
 
-def get_nominations_keyboard_admin(action):
+# Отчет "Кто голосовал" листается страницами по VOTERS_PAGE_SIZE пользователей
+VOTERS_PAGE_SIZE = 20
+MESSAGE_LIMIT = 4096
+VOTERS_HEADER = "👥 <b>Информация о голосующих:</b>\n\n"
+
+# Что можно выгрузить через /export
+EXPORT_KINDS = ("votes", "participants", "results")
+
+async def get_nominations_keyboard_admin(db, action):
     """Клавиатура номинаций для админ-панели"""
-    db = Database()
-    nominations = db.get_nominations()
-    keyboard = []
-    
-    for nom_id, name in nominations:
-        keyboard.append([InlineKeyboardButton(text=name, callback_data=f"admin_{action}_{nom_id}")])
+    async def build():
+        nominations = await db.get_nominations()
+        keyboard = []
+        
+        for nom_id, name in nominations:
+            keyboard.append([InlineKeyboardButton(text=name, callback_data=AdminNominationCallback(action=action, nomination_id=nom_id).pack())])
+        
+        keyboard.append([InlineKeyboardButton(text="🔙 Назад в админ-панель", callback_data="admin_back")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
-    keyboard.append([InlineKeyboardButton(text="🔙 Назад в админ-панель", callback_data="admin_back")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return await cached_keyboard(db, ("admin_nominations", action), db.catalogue.full_version, build)
 
-def get_participants_for_deletion(nomination_id):
+async def get_participants_for_deletion(db, nomination_id):
     """Получить список участников для удаления"""
-    db = Database()
-    participants = db.get_participants(nomination_id)
-    
-    if not participants:
-        return None
-    
-    keyboard = []
-    for part_id, name in participants:
-        keyboard.append([InlineKeyboardButton(text=name, callback_data=f"admin_delete_part_{part_id}")])
+    async def build():
+        participants = await db.get_participants(nomination_id)
+        
+        if not participants:
+            return None
+        
+        keyboard = []
+        for part_id, name in participants:
+            keyboard.append([InlineKeyboardButton(text=name, callback_data=AdminDeleteParticipantCallback(participant_id=part_id).pack())])
+        
+        keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_back_to_delete")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
-    keyboard.append([InlineKeyboardButton(text="🔙 Назад", callback_data="admin_back_to_delete")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    version = db.catalogue.nomination_version(nomination_id)
+    return await cached_keyboard(db, ("admin_delete_participants", nomination_id), version, build)
 
 @router.message(Command("admin"))
 async def admin_panel(message: Message):
@@ -54,24 +78,22 @@ async def admin_panel(message: Message):
     )
 
 @router.message(F.text == "➕ Добавить участника")
-async def add_participant_start(message: Message, state: FSMContext):
+async def add_participant_start(message: Message, state: FSMContext, db: AsyncDatabase):
     if message.from_user.id not in ADMINS:
         return
     
     await message.answer(
         "Выберите номинацию для добавления участника:",
-        reply_markup=get_nominations_keyboard_admin("add")
+        reply_markup=await get_nominations_keyboard_admin(db, "add")
     )
     await state.set_state(AdminStates.waiting_for_nomination_add)
 
-@router.callback_query(F.data.startswith("admin_add_"))
-async def select_nomination_for_add(callback: CallbackQuery, state: FSMContext):
-    nomination_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminNominationCallback.filter(F.action == "add"))
+async def select_nomination_for_add(callback: CallbackQuery, callback_data: AdminNominationCallback, state: FSMContext, db: AsyncDatabase):
+    nomination_id = callback_data.nomination_id
     await state.update_data(nomination_id=nomination_id)
     
-    db = Database()
-    nominations = db.get_nominations()
-    nomination_name = next((name for id, name in nominations if id == nomination_id), "Неизвестная номинация")
+    nomination_name = await db.get_nomination_name(nomination_id, "Неизвестная номинация")
     
     await callback.message.edit_text(
         f"Номинация: <b>{nomination_name}</b>\n\nВведите имя участника:"
@@ -79,7 +101,7 @@ async def select_nomination_for_add(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AdminStates.waiting_for_participant_name)
 
 @router.message(AdminStates.waiting_for_participant_name)
-async def add_participant_finish(message: Message, state: FSMContext):
+async def add_participant_finish(message: Message, state: FSMContext, db: AsyncDatabase):
     data = await state.get_data()
     nomination_id = data['nomination_id']
     participant_name = message.text.strip()
@@ -88,13 +110,11 @@ async def add_participant_finish(message: Message, state: FSMContext):
         await message.answer("❌ Имя участника не может быть пустым. Попробуйте еще раз:")
         return
     
-    db = Database()
     try:
-        db.add_participant(nomination_id, participant_name)
+        await db.add_participant(nomination_id, participant_name)
         
         # Получаем название номинации для красивого сообщения
-        nominations = db.get_nominations()
-        nomination_name = next((name for id, name in nominations if id == nomination_id), "")
+        nomination_name = await db.get_nomination_name(nomination_id)
         
         await message.answer(
             f"✅ Участник <b>'{participant_name}'</b> успешно добавлен в номинацию <b>'{nomination_name}'</b>!",
@@ -109,138 +129,322 @@ async def add_participant_finish(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(F.text == "🗑️ Удалить участника")
-async def delete_participant_start(message: Message, state: FSMContext):
+async def delete_participant_start(message: Message, state: FSMContext, db: AsyncDatabase):
     if message.from_user.id not in ADMINS:
         return
     
     await message.answer(
         "Выберите номинацию для удаления участника:",
-        reply_markup=get_nominations_keyboard_admin("delete")
+        reply_markup=await get_nominations_keyboard_admin(db, "delete")
     )
     await state.set_state(AdminStates.waiting_for_nomination_delete)
 
-@router.callback_query(F.data.startswith("admin_delete_"))
-async def select_nomination_for_deletion(callback: CallbackQuery, state: FSMContext):
-    # Проверяем, это номинация или участник
-    data_parts = callback.data.split("_")
+@router.callback_query(AdminNominationCallback.filter(F.action == "delete"))
+async def select_nomination_for_deletion(callback: CallbackQuery, callback_data: AdminNominationCallback, db: AsyncDatabase):
+    nomination_id = callback_data.nomination_id
     
-    if len(data_parts) == 3:  # admin_delete_X
-        nomination_id = int(data_parts[2])
-        
-        db = Database()
-        participants = db.get_participants(nomination_id)
-        nominations = db.get_nominations()
-        nomination_name = next((name for id, name in nominations if id == nomination_id), "")
-        
-        if not participants:
-            await callback.message.edit_text(
-                f"❌ В номинации <b>'{nomination_name}'</b> пока нет участников для удаления.",
-                reply_markup=get_nominations_keyboard_admin("delete")
-            )
-            return
-        
-        keyboard = get_participants_for_deletion(nomination_id)
+    participants = await db.get_participants(nomination_id)
+    nomination_name = await db.get_nomination_name(nomination_id)
+    
+    if not participants:
         await callback.message.edit_text(
-            f"Номинация: <b>{nomination_name}</b>\n\nВыберите участника для удаления:",
-            reply_markup=keyboard
+            f"❌ В номинации <b>'{nomination_name}'</b> пока нет участников для удаления.",
+            reply_markup=await get_nominations_keyboard_admin(db, "delete")
         )
+        return
     
-    elif len(data_parts) == 4 and data_parts[2] == "part":  # admin_delete_part_X
-        participant_id = int(data_parts[3])
-        
-        db = Database()
-        participant_info = db.get_participant_info(participant_id)
-        
-        if participant_info:
-            participant_name, nomination_name, nomination_id = participant_info
-            db.delete_participant(participant_id)
-            
-            # Используем answer вместо edit_text для ReplyKeyboardMarkup
-            await callback.message.delete()
-            await callback.message.answer(
-                f"✅ Участник <b>'{participant_name}'</b> успешно удален из номинации <b>'{nomination_name}'</b>!",
-                reply_markup=get_admin_keyboard()
-            )
-        else:
-            await callback.message.delete()
-            await callback.message.answer(
-                "❌ Участник не найден!",
-                reply_markup=get_admin_keyboard()
-            )
+    keyboard = await get_participants_for_deletion(db, nomination_id)
+    await callback.message.edit_text(
+        f"Номинация: <b>{nomination_name}</b>\n\nВыберите участника для удаления:",
+        reply_markup=keyboard
+    )
+
+@router.callback_query(AdminDeleteParticipantCallback.filter())
+async def delete_participant_finish(callback: CallbackQuery, callback_data: AdminDeleteParticipantCallback, state: FSMContext, db: AsyncDatabase):
+    participant_id = callback_data.participant_id
+    
+    participant_info = await db.get_participant_info(participant_id)
+    
+    if participant_info:
+        participant_name, nomination_name, nomination_id = participant_info
+        await db.delete_participant(participant_id)
         
-        await state.clear()
+        # Используем answer вместо edit_text для ReplyKeyboardMarkup
+        await callback.message.delete()
+        await callback.message.answer(
+            f"✅ Участник <b>'{participant_name}'</b> успешно удален из номинации <b>'{nomination_name}'</b>!",
+            reply_markup=get_admin_keyboard()
+        )
+    else:
+        await callback.message.delete()
+        await callback.message.answer(
+            "❌ Участник не найден!",
+            reply_markup=get_admin_keyboard()
+        )
+    
+    await state.clear()
 
 @router.message(F.text == "📊 Статистика")
-async def show_statistics(message: Message):
+async def show_statistics(message: Message, db: AsyncDatabase):
     if message.from_user.id not in ADMINS:
         return
     
-    db = Database()
-    results = db.get_vote_results()
+    text = await get_statistics_text(db)
     
-    if not results:
+    if text is None:
         await message.answer("📊 Голосов пока нет")
         return
     
-    current_nomination = ""
-    text = "📊 <b>Результаты голосования:</b>\n\n"
+    await message.answer(text)
+
+@router.message(Command("live"))
+async def live_results_command(message: Message, command: CommandObject, bot: Bot, live_results: LiveResults):
+    """/live - закрепить обновляемые результаты, /live stop - перестать обновлять"""
+    if message.from_user.id not in ADMINS:
+        return
+    
+    if (command.args or "").strip() == "stop":
+        if await live_results.stop(bot, message.chat.id):
+            await message.answer("⏹ Результаты больше не обновляются")
+        else:
+            await message.answer("Обновляемых результатов в этом чате нет")
+        return
     
-    for nom_name, part_name, votes in results:
-        if nom_name != current_nomination:
-            text += f"<b>{nom_name}:</b>\n"
-            current_nomination = nom_name
-        
-        if part_name:
-            text += f"  {part_name}: {votes} голосов\n"
+    await live_results.start(bot, message.chat.id)
+
+@router.message(Command("backup"))
+async def backup_command(message: Message, backups: BackupManager):
+    """Резервная копия базы по запросу, голосование при этом не останавливается"""
+    if message.from_user.id not in ADMINS:
+        return
+    
+    await message.answer("⏳ Делаю резервную копию...")
+    try:
+        info = await backups.backup()
+    except Exception as e:
+        await message.answer(f"❌ Резервная копия не удалась: {e}")
+        return
+    
+    await message.answer(
+        f"✅ Резервная копия <code>{info.path}</code>\n"
+        f"{info.size / 2 ** 20:.1f} МиБ за {info.seconds:.2f} с, integrity_check: ok\n"
+        f"WAL вырос за время копии на {info.wal_growth / 2 ** 20:.1f} МиБ\n"
+        f"Хранится копий: {len(backups.backups())}"
+    )
+
+@router.message(Command("check_tally"))
+async def check_tally(message: Message, db: AsyncDatabase):
+    """Сверка подсчета голосов в памяти с агрегатом из базы"""
+    if message.from_user.id not in ADMINS:
+        return
+    
+    mismatches = await db.check_tally()
+    
+    if not mismatches:
+        await message.answer("✅ Подсчет голосов совпадает с базой")
+        return
+    
+    text = "⚠️ <b>Подсчет голосов расходится с базой:</b>\n\n"
+    for nomination_id, participant_id, in_memory, in_db in mismatches:
+        if nomination_id is None:
+            text += f"• Всего голосов: в памяти {in_memory}, в базе {in_db}\n"
         else:
-            text += "  Нет участников\n"
+            text += f"• Номинация {nomination_id}, участник {participant_id}: в памяти {in_memory}, в базе {in_db}\n"
     
-    total_votes = db.get_total_votes_count()
-    text += f"\n<b>Всего голосов:</b> {total_votes}"
+    await message.answer(text)
+
+@router.message(Command("query_plans"))
+async def check_query_plans(message: Message, db: AsyncDatabase):
+    """Проверка, что запросы базы не сканируют таблицы целиком"""
+    if message.from_user.id not in ADMINS:
+        return
+    
+    offenders = await db.find_full_scans()
+    
+    if not offenders:
+        await message.answer("✅ Все запросы используют индексы")
+        return
+    
+    text = "⚠️ <b>Полное сканирование таблиц:</b>\n\n"
+    for name, detail in offenders:
+        text += f"• {name}: {detail}\n"
     
     await message.answer(text)
 
+def _text_length(text):
+    # Telegram считает длину сообщения в UTF-16: эмодзи занимают две позиции
+    return len(text.encode('utf-16-le')) // 2
+
+def _render_voter(user_id, rows):
+    """Блок отчета об одном пользователе; блоки не разрываются между сообщениями"""
+    _, _, _, first_name, last_name, username = rows[0]
+    name = f"{first_name or ''} {last_name or ''}".strip() or 'Неизвестно'
+    
+    lines = [
+        f"🆔 ID: {user_id}",
+        f"👤 Имя: {name}",
+        f"📱 Username: {f'@{username}' if username else 'нет username'}",
+        "🗳️ Голоса:",
+    ]
+    lines.extend(f"  • {nomination}: {participant}" for _, nomination, participant, _, _, _ in rows)
+    lines.append("─" * 30)
+    return "\n".join(lines) + "\n\n"
+
+async def render_voters_page(db, cursor=None, backward=False):
+    """Страница отчета о голосующих: текст и кнопки листания, или (None, None), если голосов нет.
+    
+    В страницу попадает не больше VOTERS_PAGE_SIZE пользователей и целых блоков,
+    пока текст помещается в одно сообщение.
+    """
+    rows = await db.get_voters_page(cursor, VOTERS_PAGE_SIZE, backward)
+    
+    if not rows:
+        return None, None
+    
+    blocks = []
+    user_ids = []
+    length = _text_length(VOTERS_HEADER)
+    for user_id, user_rows in groupby(rows, key=itemgetter(0)):
+        block = _render_voter(user_id, list(user_rows))
+        block_length = _text_length(block)
+        if blocks and length + block_length > MESSAGE_LIMIT:
+            break
+        blocks.append(block)
+        user_ids.append(user_id)
+        length += block_length
+    
+    # Назад страница читается от курсора к началу - возвращаем обычный порядок
+    if backward:
+        blocks.reverse()
+        user_ids.reverse()
+    
+    buttons = []
+    if await db.has_voters(user_ids[0], before=True):
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=VotersPageCallback(direction="prev", user_id=user_ids[0]).pack()))
+    if await db.has_voters(user_ids[-1]):
+        buttons.append(InlineKeyboardButton(text="Далее ➡️", callback_data=VotersPageCallback(direction="next", user_id=user_ids[-1]).pack()))
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return VOTERS_HEADER + "".join(blocks), keyboard
+
+@router.message(Command("export"))
+async def export_data(message: Message, command: CommandObject, db: AsyncDatabase):
+    """/export [votes|participants|results] [csv|ndjson] [gz] - выгрузка в файл"""
+    if message.from_user.id not in ADMINS:
+        return
+    
+    args = (command.args or "").split()
+    kind = args[0] if args else "votes"
+    fmt = args[1] if len(args) > 1 else "csv"
+    compress = args[2:] == ["gz"]
+    
+    if kind not in EXPORT_KINDS or fmt not in FORMATS or (len(args) > 2 and not compress):
+        await message.answer(
+            "Использование: /export [votes|participants|results] [csv|ndjson] [gz]"
+        )
+        return
+    
+    suffix = f".{fmt}" + (GZIP_SUFFIX if compress else "")
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    paths = [path]
+    try:
+        started = time.perf_counter()
+        count = await db.export(kind, path, fmt)
+        
+        # Большую выгрузку Telegram не примет, сжатый CSV обычно в 5-10 раз меньше
+        if os.path.getsize(path) > MAX_DOCUMENT_SIZE and not compress:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(None, gzip_file, path)
+            paths.append(path)
+            suffix += GZIP_SUFFIX
+        elapsed = time.perf_counter() - started
+        
+        size = os.path.getsize(path)
+        if size > MAX_DOCUMENT_SIZE:
+            await message.answer(
+                f"❌ Выгрузка {kind}: {count} строк, {size / 2 ** 20:.1f} МБ даже в сжатом виде - "
+                f"больше лимита Telegram {MAX_DOCUMENT_SIZE // 2 ** 20} МБ"
+            )
+            return
+        
+        await message.answer_document(
+            FSInputFile(path, filename=f"{kind}{suffix}"),
+            caption=f"📤 {kind}: {count} строк за {elapsed:.1f} с"
+        )
+    finally:
+        for path in paths:
+            os.remove(path)
+
+@router.message(Command("import"))
+async def import_start(message: Message, state: FSMContext):
+    if message.from_user.id not in ADMINS:
+        return
+    
+    await message.answer(
+        "Отправьте файл участников (.csv или .ndjson, можно сжатый .gz) с колонками "
+        "<b>nomination</b> (название или id номинации) и <b>name</b>.\n"
+        "Подойдет и выгрузка /export participants."
+    )
+    await state.set_state(AdminStates.waiting_for_import_file)
+
+@router.message(AdminStates.waiting_for_import_file, F.document)
+async def import_finish(message: Message, state: FSMContext, bot: Bot, db: AsyncDatabase):
+    fmt = detect_format(message.document.file_name)
+    
+    if fmt is None:
+        await message.answer("❌ Нужен файл .csv или .ndjson. Попробуйте еще раз:")
+        return
+    
+    # Суффикс .gz нужен read_rows, чтобы распаковать файл
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}" + (GZIP_SUFFIX if is_gzip(message.document.file_name) else ""))
+    os.close(fd)
+    try:
+        await bot.download(message.document, destination=path)
+        
+        started = time.perf_counter()
+        added, skipped = await db.import_participants(path, fmt)
+        elapsed = time.perf_counter() - started
+        
+        await message.answer(
+            f"📥 Добавлено участников: {added}, пропущено строк: {skipped} ({elapsed:.1f} с)",
+            reply_markup=get_admin_keyboard()
+        )
+    except Exception as e:
+        await message.answer(
+            f"❌ Ошибка при загрузке участников: {str(e)}",
+            reply_markup=get_admin_keyboard()
+        )
+    finally:
+        os.remove(path)
+    
+    await state.clear()
+
 @router.message(F.text == "👥 Кто голосовал")
-async def show_voters(message: Message):
+async def show_voters(message: Message, db: AsyncDatabase):
     if message.from_user.id not in ADMINS:
         return
     
-    db = Database()
-    votes = db.get_voters_info()
+    text, keyboard = await render_voters_page(db)
     
-    if not votes:
+    if text is None:
         await message.answer("📝 Голосов пока нет")
         return
     
-    # Группируем по пользователям
-    voters = {}
-    for user_id, nomination, participant, first_name, last_name, username in votes:
-        if user_id not in voters:
-            voters[user_id] = {
-                'name': f"{first_name or ''} {last_name or ''}".strip() or 'Неизвестно',
-                'username': f"@{username}" if username else "нет username",
-                'votes': []
-            }
-        voters[user_id]['votes'].append(f"{nomination}: {participant}")
-    
-    # Формируем сообщение
-    text = "👥 <b>Информация о голосующих:</b>\n\n"
-    for user_id, data in voters.items():
-        text += f"🆔 ID: {user_id}\n"
-        text += f"👤 Имя: {data['name']}\n"
-        text += f"📱 Username: {data['username']}\n"
-        text += "🗳️ Голоса:\n"
-        for vote in data['votes']:
-            text += f"  • {vote}\n"
-        text += "─" * 30 + "\n\n"
-    
-    # Разбиваем на части если сообщение слишком длинное
-    if len(text) > 4096:
-        parts = [text[i:i+4096] for i in range(0, len(text), 4096)]
-        for part in parts:
-            await message.answer(part)
-    else:
-        await message.answer(text)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(VotersPageCallback.filter())
+async def show_voters_page(callback: CallbackQuery, callback_data: VotersPageCallback, db: AsyncDatabase):
+    if callback.from_user.id not in ADMINS:
+        return
+    
+    text, keyboard = await render_voters_page(db, callback_data.user_id, backward=callback_data.direction == "prev")
+    
+    if text is None:
+        await callback.message.edit_text("📝 Голосов больше нет")
+        return
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
 
 @router.callback_query(F.data == "admin_back")
 async def admin_back(callback: CallbackQuery, state: FSMContext):
@@ -253,10 +457,10 @@ async def admin_back(callback: CallbackQuery, state: FSMContext):
     )
 
 @router.callback_query(F.data == "admin_back_to_delete")
-async def admin_back_to_delete(callback: CallbackQuery, state: FSMContext):
+async def admin_back_to_delete(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     await callback.message.edit_text(
         "Выберите номинацию для удаления участника:",
-        reply_markup=get_nominations_keyboard_admin("delete")
+        reply_markup=await get_nominations_keyboard_admin(db, "delete")
     )
     await state.set_state(AdminStates.waiting_for_nomination_delete)
 
@@ -0,0 +1,223 @@
+"""Резервные копии базы без остановки голосования.
+
+Копия снимается SQLite online backup API небольшими шагами (pages страниц),
+между шагами поток копирования засыпает на pause секунд. Источник читается
+в одной транзакции чтения: в WAL писатели ее не ждут, а копия соответствует
+одному моменту и не начинается заново после каждого голоса. Пока транзакция
+открыта, checkpoint не может перенести WAL в базу дальше ее начала, поэтому
+во время копии -wal растет; насколько - пишется в лог и в /backup. Каждая копия
+проверяется PRAGMA integrity_check и появляется в каталоге целиком
+(backups/20261017-120000/voting.db); старые копии сверх keep удаляются.
+
+    python backup.py now voting.db backups/
+
+Задержку голосов во время копирования меряет bench/backup_latency.py.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """Копия не прошла PRAGMA integrity_check"""
+
+
+class BackupInfo(NamedTuple):
+    path: str
+    size: int
+    seconds: float
+    steps: int
+    # На сколько байт выросли -wal источников, пока снималась копия
+    wal_growth: int = 0
+
+
+def _wal_size(path):
+    try:
+        return os.path.getsize(path + "-wal")
+    except OSError:
+        return 0
+
+
+def backup_file(source, target, pages=256, pause=0.005, busy_timeout_ms=5000):
+    """Копирует базу source в новый файл target и проверяет его.
+
+    Возвращает (число шагов, рост -wal источника в байтах за время копии).
+    """
+    src = sqlite3.connect(source, timeout=busy_timeout_ms / 1000)
+    dst = sqlite3.connect(target)
+    steps = 0
+    wal_before = _wal_size(source)
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        # Пауза между шагами: писатели в WAL проходят и без нее, она лишь отдает им
+        # диск и GIL. Транзакция чтения при этом открыта до конца копии, и checkpoint
+        # не переносит в базу страницы, записанные после ее начала - -wal растет
+        if remaining and pause:
+            time.sleep(pause)
+
+    try:
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+        src.rollback()
+        wal_growth = max(_wal_size(source) - wal_before, 0)
+        if wal_growth:
+            logger.info("%s-wal вырос на %.1f МиБ за время копии: checkpoint ждал ее транзакцию чтения",
+                        source, wal_growth / 2 ** 20)
+
+        # Копия - один самодостаточный файл, без -wal рядом
+        dst.execute('PRAGMA journal_mode=DELETE')
+        problems = [row[0] for row in dst.execute('PRAGMA integrity_check')]
+        if problems != ["ok"]:
+            raise BackupError(f"{target}: " + "; ".join(problems[:5]))
+    finally:
+        dst.close()
+        src.close()
+    return steps, wal_growth
+
+
+class BackupManager:
+    """Копии файлов базы по расписанию и по команде /backup.
+
+    paths - файлы базы (основной и, если включены, шарды голосов); каждая
+    копия - подкаталог directory с копиями всех файлов. interval - секунды
+    между копиями по расписанию, 0 - только по команде.
+    """
+
+    def __init__(self, paths, directory="backups", interval=0, keep=10, pages=256, pause=0.005):
+        self.paths = list(paths)
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.completed = 0
+        self.failed = 0
+        self.last = None
+
+    def backups(self):
+        """Готовые копии, от старых к новым"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = []
+        for name in os.listdir(self.directory):
+            try:
+                datetime.datetime.strptime(name, STAMP_FORMAT)
+            except ValueError:
+                continue
+            names.append(name)
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    def prune(self):
+        """Удаляет копии сверх keep, начиная со старых"""
+        backups = self.backups()
+        removed = backups[:max(len(backups) - self.keep, 0)]
+        for path in removed:
+            shutil.rmtree(path, ignore_errors=True)
+        return removed
+
+    def _run_backup(self):
+        started = time.perf_counter()
+        stamp = datetime.datetime.now().strftime(STAMP_FORMAT)
+        target = os.path.join(self.directory, stamp)
+        # Недоделанная копия лежит под временным именем и в backups() не попадает
+        tmp_dir = os.path.join(self.directory, f".{stamp}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            steps = wal_growth = 0
+            for path in self.paths:
+                file_steps, file_wal_growth = backup_file(
+                    path, os.path.join(tmp_dir, os.path.basename(path)), self.pages, self.pause
+                )
+                steps += file_steps
+                wal_growth += file_wal_growth
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(tmp_dir, target)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        size = sum(os.path.getsize(os.path.join(target, name)) for name in os.listdir(target))
+        self.prune()
+        return BackupInfo(target, size, time.perf_counter() - started, steps, wal_growth)
+
+    async def backup(self):
+        """Делает копию в отдельном потоке; одновременно идет не больше одной"""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            try:
+                info = await loop.run_in_executor(None, self._run_backup)
+            except Exception:
+                self.failed += 1
+                raise
+            self.completed += 1
+            self.last = info
+            logger.info("Резервная копия %s: %.1f МиБ за %.2f с", info.path, info.size / 2 ** 20, info.seconds)
+            return info
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._schedule())
+
+    async def _schedule(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.backup()
+            except Exception:
+                logger.exception("Резервная копия по расписанию не удалась")
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        # Начатая копия доделывается в своем потоке
+        async with self._lock:
+            pass
+
+    def stats(self):
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "kept": len(self.backups()),
+            "last_seconds": self.last.seconds if self.last else 0,
+            "last_bytes": self.last.size if self.last else 0,
+            "last_wal_growth_bytes": self.last.wal_growth if self.last else 0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии базы голосования")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    now_parser = commands.add_parser("now", help="сделать копию сейчас")
+    now_parser.add_argument("db_path")
+    now_parser.add_argument("directory")
+    now_parser.add_argument("--keep", type=int, default=10)
+
+    args = parser.parse_args()
+    info = asyncio.run(BackupManager([args.db_path], args.directory, keep=args.keep).backup())
+    print(f"{info.path}: {info.size / 2 ** 20:.1f} МиБ за {info.seconds:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Задержка хендлеров голосования, пока админ смотрит "👥 Кто голосовал".
+
+Голоса приходят с постоянной частотой (--rate в секунду), задержка голоса
+считается от момента, когда он должен был прийти: так в нее попадает и время,
+которое апдейт простоял в event loop. Сначала голосование идет без админа,
+затем параллельно в цикле выполняется медленный get_voters_info по базе
+с --votes голосами. Прогон делается дважды: с синхронным Database, который
+вызывается прямо из корутин (как до AsyncDatabase), и с AsyncDatabase.
+
+    python bench/async_db.py --votes 300000 --rate 500
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+
+from common import add_common_arguments, make_database, print_summary, random_vote
+
+
+class BlockingDatabase:
+    """Database с методами-корутинами, которые выполняются прямо в event loop"""
+
+    def __init__(self, db_path):
+        from database import Database
+        self.sync = Database(db_path)
+
+    async def add_vote(self, *vote):
+        return self.sync.add_vote(*vote)
+
+    async def get_voters_info(self):
+        return self.sync.get_voters_info()
+
+    async def close(self):
+        self.sync.close()
+
+
+async def run(db, args, catalogue):
+    rnd = random.Random(args.seed)
+    latencies = {"без отчета": [], "с get_voters_info": []}
+    reports = []
+    tasks = set()
+
+    async def handle(phase, arrival):
+        await db.add_vote(*random_vote(rnd, catalogue, args.users))
+        latencies[phase].append(time.perf_counter() - arrival)
+
+    async def admin(stop):
+        while not stop.is_set():
+            started = time.perf_counter()
+            await db.get_voters_info()
+            reports.append(time.perf_counter() - started)
+            await asyncio.sleep(args.admin_pause_ms / 1000)
+
+    async def arrivals(phase, seconds):
+        started = time.perf_counter()
+        for i in range(int(seconds * args.rate)):
+            arrival = started + i / args.rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(handle(phase, arrival))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    await arrivals("без отчета", args.seconds)
+    stop = asyncio.Event()
+    admin_task = asyncio.create_task(admin(stop))
+    await arrivals("с get_voters_info", args.seconds)
+    stop.set()
+    await admin_task
+    await asyncio.gather(*tasks)
+    await db.close()
+    return latencies, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p99 хендлеров голосования во время медленного отчета")
+    add_common_arguments(parser)
+    parser.add_argument("--votes", type=int, default=300000, help="синтетических голосов в базе")
+    parser.add_argument("--users", type=int, default=10000, help="сколько пользователей голосуют")
+    parser.add_argument("--rate", type=float, default=500, help="голосов в секунду")
+    parser.add_argument("--seconds", type=float, default=3, help="длительность каждой фазы")
+    parser.add_argument("--admin-pause-ms", type=float, default=50, help="пауза между отчетами админа")
+    args = parser.parse_args()
+
+    from database import AsyncDatabase
+
+    workdir = tempfile.mkdtemp(prefix="bench-async-", dir=args.dir)
+    try:
+        for name, factory in (("Database в event loop", BlockingDatabase), ("AsyncDatabase", AsyncDatabase)):
+            db_path, catalogue = make_database(args.db, workdir, f"{factory.__name__}.db", args.votes, args.seed)
+            latencies, reports = asyncio.run(run(factory(db_path), args, catalogue))
+            print(f"{name}:")
+            for phase, values in latencies.items():
+                print_summary(f"голос, {phase}", values)
+            print_summary("get_voters_info", reports)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Общее для бенчмарков в bench/: путь к модулям бота и копия базы с голосами.
+
+Скрипты запускаются из корня репозитория (python bench/pooling.py) и работают
+только с копиями базы во временном каталоге. Каталог и синтетические голоса
+берутся из loadtest.py - оттуда же их берут тесты.
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Без config.py и config_token.py модули бота берут тестовые из tests/settings
+sys.path.append(os.path.join(ROOT, "tests", "settings"))
+
+from loadtest import (  # noqa: E402,F401
+    SYNTHETIC_USER_ID_BASE,
+    inflate_votes,
+    load_catalogue,
+    prepare_database,
+    random_vote,
+    summarize,
+)
+
+
+def add_common_arguments(parser):
+    parser.add_argument("--db", default=os.path.join(ROOT, "voting.db"), help="исходная база; прогон идет на ее копии")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="каталог для файлов (по умолчанию временный)")
+
+
+def make_database(source, workdir, name="bench.db", votes=0, seed=1):
+    """Копия source в workdir, дополненная votes синтетическими голосами.
+
+    Возвращает путь к копии и каталог номинаций (см. load_catalogue).
+    """
+    if not os.path.exists(source):
+        raise SystemExit(f"Нет базы {source}")
+    path = os.path.join(workdir, name)
+    os.replace(prepare_database(source, workdir), path)
+    catalogue = load_catalogue(path)
+    if votes:
+        inflate_votes(path, catalogue, votes, seed)
+    return path, catalogue
+
+
+def time_per_call(func, number):
+    """Среднее время одного вызова func() в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number * 10 ** 6
+
+
+async def time_per_await(func, number):
+    """Среднее время одного await func() в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(number):
+        await func()
+    return (time.perf_counter() - started) / number * 10 ** 6
+
+
+def print_summary(name, latencies):
+    summary = summarize(latencies)
+    print(f"  {name}: {summary['count']} запросов, p50 {summary['p50_ms']} мс, "
+          f"p99 {summary['p99_ms']} мс, max {summary['max_ms']} мс")
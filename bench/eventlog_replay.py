@@ -0,0 +1,86 @@
+"""Скорость записи журнала событий, проигрывания его в VoteTally и сборки базы.
+
+Журнал начинается со снимка каталога копии базы без голосов, затем в него
+пишутся --events голосов пачками по 1000 событий. Пользователей примерно
+треть от числа событий, поэтому часть голосов - изменения. Потом журнал
+проигрывается, как при запуске бота (load_tally), и по нему собирается
+новая база (rebuild).
+
+    python bench/eventlog_replay.py --events 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from common import add_common_arguments, make_database, random_vote
+
+from database import NOMINATIONS_SQL, PARTICIPANTS_SQL
+from eventlog import EventLog, rebuild, vote_event
+from tally import VoteTally
+
+
+def write_log(log, db_path, catalogue, args):
+    """Пишет снимок каталога и --events голосов, возвращает {(user_id, nomination_id): participant_id}"""
+    conn = sqlite3.connect(db_path)
+    try:
+        log.write_snapshot(0, [], conn.execute(NOMINATIONS_SQL).fetchall(), conn.execute(PARTICIPANTS_SQL).fetchall(), [])
+    finally:
+        conn.close()
+
+    rnd = random.Random(args.seed)
+    choices = {}
+    for _ in range(0, args.events, 1000):
+        batch = []
+        for _ in range(1000):
+            user_id, nomination_id, participant_id = random_vote(rnd, catalogue, args.events // 3 + 1)
+            previous = choices.get((user_id, nomination_id))
+            if previous == participant_id:
+                continue
+            choices[(user_id, nomination_id)] = participant_id
+            batch.append(vote_event((user_id, nomination_id, participant_id, "Load", None, None), previous))
+        log.append(batch)
+    log.close()
+    return choices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость записи и проигрывания журнала событий")
+    add_common_arguments(parser)
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-eventlog-", dir=args.dir)
+    try:
+        db_path, catalogue = make_database(args.db, workdir, seed=args.seed)
+        log = EventLog(os.path.join(workdir, "events"))
+
+        started = time.perf_counter()
+        choices = write_log(log, db_path, catalogue, args)
+        written = time.perf_counter() - started
+        events = log.seq
+
+        tally = VoteTally()
+        started = time.perf_counter()
+        replayed = log.load_tally(tally)
+        replay_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rebuild(log, os.path.join(workdir, "rebuilt.db"))
+        rebuild_time = time.perf_counter() - started
+
+        size = sum(os.path.getsize(path) for _, path in log.segments())
+        print(f"Событий: {events}, журнал {size / 2 ** 20:.1f} МиБ ({size / max(events, 1):.0f} байт на событие)")
+        print(f"  запись:          {events / written:,.0f} событий/с")
+        print(f"  проигрывание:    {replayed / replay_time:,.0f} событий/с ({replay_time:.2f} с)")
+        print(f"  сборка базы:     {replayed / rebuild_time:,.0f} событий/с ({rebuild_time:.2f} с)")
+        print(f"  голосов в итоге: {tally.total} (ожидалось {len(choices)})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
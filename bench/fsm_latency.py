@@ -0,0 +1,67 @@
+"""Задержка get/set FSM-хранилища: SQLiteStorage против MemoryStorage aiogram.
+
+Для --users пользователей повторяется то, что делает голосование: set_state,
+set_data с nomination_id, get_state и get_data. SQLiteStorage меряется дважды:
+с кэшем горячих ключей и с cache_ttl=0 (режим нескольких процессов, каждое
+чтение идет в файл).
+
+    python bench/fsm_latency.py --users 5000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from common import add_common_arguments, print_summary
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from fsm_storage import SQLiteStorage
+
+STATE = "VotingStates:waiting_for_participant"
+
+
+async def run(storage, users):
+    latencies = {"set_state": [], "set_data": [], "get_state": [], "get_data": []}
+
+    async def timed(name, call):
+        started = time.perf_counter()
+        await call
+        latencies[name].append(time.perf_counter() - started)
+
+    for user_id in range(1, users + 1):
+        key = StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+        await timed("set_state", storage.set_state(key, STATE))
+        await timed("set_data", storage.set_data(key, {"nomination_id": user_id % 11}))
+        await timed("get_state", storage.get_state(key))
+        await timed("get_data", storage.get_data(key))
+    await storage.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка get/set FSM-хранилищ")
+    add_common_arguments(parser)
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-fsm-", dir=args.dir)
+    try:
+        storages = (
+            ("MemoryStorage", lambda: MemoryStorage()),
+            ("SQLiteStorage", lambda: SQLiteStorage(os.path.join(workdir, "fsm.db"))),
+            ("SQLiteStorage, cache_ttl=0", lambda: SQLiteStorage(os.path.join(workdir, "fsm-nocache.db"), cache_ttl=0)),
+        )
+        for name, factory in storages:
+            latencies = asyncio.run(run(factory(), args.users))
+            print(f"{name}:")
+            for operation, values in latencies.items():
+                print_summary(operation, values)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
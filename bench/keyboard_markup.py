@@ -0,0 +1,80 @@
+"""Стоимость клавиатур на один хендлер: собранных заново и взятых из кэша.
+
+"Без кэша" - перед каждым вызовом кэш клавиатур очищается, как будто разметка
+собирается на каждое сообщение; "с кэшем" - обычная работа keyboards.py.
+Каталог берется из копии базы через AsyncDatabase.
+
+    python bench/keyboard_markup.py --number 20000
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+
+from common import add_common_arguments, make_database, time_per_await
+
+import keyboards
+from admin_panel import get_nominations_keyboard_admin
+from database import AsyncDatabase
+from keyboards import get_admin_keyboard, get_main_menu, get_nominations_keyboard, get_participants_keyboard
+
+STATIC_KEYBOARDS = (
+    keyboards.get_main_menu,
+    keyboards.get_admin_main_menu,
+    keyboards.get_admin_keyboard,
+    keyboards.back_to_main_inline_keyboard,
+)
+
+
+def clear_caches(db):
+    db.catalogue.keyboards.clear()
+    for func in STATIC_KEYBOARDS:
+        func.cache_clear()
+
+
+async def run(db, catalogue, number):
+    nomination_id = max(catalogue, key=lambda item: len(item[1]))[0]
+
+    async def vote_menu():
+        get_main_menu()
+        await get_nominations_keyboard(db)
+
+    async def vote_nomination():
+        await get_participants_keyboard(db, nomination_id)
+
+    async def admin_panel():
+        get_admin_keyboard()
+        await get_nominations_keyboard_admin(db, "add")
+
+    handlers = (
+        ("🗳️ Голосовать", vote_menu),
+        (f"номинация {nomination_id}", vote_nomination),
+        ("админ-панель", admin_panel),
+    )
+    for name, handler in handlers:
+        async def uncached():
+            clear_caches(db)
+            await handler()
+
+        before = await time_per_await(uncached, number)
+        after = await time_per_await(handler, number)
+        print(f"{name}: без кэша {before:.1f} мкс, с кэшем {after:.1f} мкс ({before / after:.0f}x)")
+    await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость сборки клавиатур с кэшем и без")
+    add_common_arguments(parser)
+    parser.add_argument("--number", type=int, default=20000, help="вызовов каждого хендлера")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-keyboards-", dir=args.dir)
+    try:
+        db_path, catalogue = make_database(args.db, workdir, seed=args.seed)
+        asyncio.run(run(AsyncDatabase(db_path), catalogue, args.number))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Голосов в секунду с пулом соединений и без него.
+
+"До": новое sqlite3.connect на каждый вызов, журнал отката и pragma
+по умолчанию (соединение закрывается после вызова). "После": Database с пулом,
+WAL и CONNECTION_PRAGMAS. В обоих прогонах --writers потоков пишут голоса,
+а --readers потоков в это время листают страницы "👥 Кто голосовал".
+
+    python bench/pooling.py --votes 20000 --writers 4 --readers 2
+"""
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from common import add_common_arguments, make_database, random_vote
+
+from database import BUSY_TIMEOUT_MS, Database
+
+
+class UnpooledDatabase(Database):
+    """Database без пула: соединение на каждый вызов, pragma не применяются"""
+
+    def _acquire(self):
+        return sqlite3.connect(self.db_path, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+
+    def _release(self, conn):
+        conn.close()
+
+
+def run(db, args, catalogue):
+    stop = threading.Event()
+    reads = [0] * args.readers
+    per_writer = args.votes // args.writers
+
+    def writer(index):
+        rnd = random.Random(args.seed + index)
+        for _ in range(per_writer):
+            db.add_vote(*random_vote(rnd, catalogue, args.users))
+
+    def reader(index):
+        while not stop.is_set():
+            db.get_voters_page(limit=20)
+            reads[index] += 1
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    writers = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    for thread in readers:
+        thread.start()
+    started = time.perf_counter()
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in readers:
+        thread.join()
+    db.close()
+    return per_writer * args.writers / elapsed, sum(reads) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Голосов в секунду с пулом соединений и без него")
+    add_common_arguments(parser)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=10000, help="сколько пользователей голосуют")
+    parser.add_argument("--writers", type=int, default=4, help="потоков, записывающих голоса")
+    parser.add_argument("--readers", type=int, default=2, help="потоков, читающих страницы голосов")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-pool-", dir=args.dir)
+    try:
+        before, catalogue = make_database(args.db, workdir, "unpooled.db", seed=args.seed)
+        with sqlite3.connect(before) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')
+        after, _ = make_database(args.db, workdir, "pooled.db", seed=args.seed)
+
+        runs = (
+            ("соединение на вызов, журнал отката", UnpooledDatabase(before, pool_size=1)),
+            ("пул, WAL", Database(after, pool_size=args.writers + args.readers)),
+        )
+        for name, db in runs:
+            votes_per_s, reads_per_s = run(db, args, catalogue)
+            print(f"{name}: {votes_per_s:.0f} голосов/с, {reads_per_s:.0f} страниц голосов/с")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Пропускная способность записи голосов в зависимости от числа шардов.
+
+--votes голосов отправляются через AsyncDatabase.add_vote, не больше
+--concurrency одновременно; каждый голос - новый (свой пользователь в каждой
+из --nominations номинаций). Первая строка - один процесс с групповым
+коммитом, дальше AsyncDatabase(shards=N) для каждого N из --shards. Каждый
+прогон идет на своей копии базы.
+
+    python bench/sharding_scaling.py --shards 1 2 4 --votes 200000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from common import SYNTHETIC_USER_ID_BASE, add_common_arguments, make_database
+
+from database import AsyncDatabase
+
+
+async def run(db_path, shards, catalogue, votes, concurrency):
+    db = AsyncDatabase(db_path, readers=2, write_behind=not shards, shards=shards)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def vote(i):
+        nomination_id, participants = catalogue[i % len(catalogue)]
+        async with semaphore:
+            await db.add_vote(SYNTHETIC_USER_ID_BASE + i // len(catalogue), nomination_id, participants[i % len(participants)])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(vote(i) for i in range(votes)))
+    elapsed = time.perf_counter() - started
+
+    mismatches = await db.check_tally()
+    await db.close()
+    return elapsed, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность записи голосов в зависимости от числа шардов")
+    add_common_arguments(parser)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4], help="числа шардов для сравнения")
+    parser.add_argument("--votes", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=2000, help="сколько голосов ждут записи одновременно")
+    parser.add_argument("--nominations", type=int, default=5, help="в скольких номинациях голосует пользователь")
+    args = parser.parse_args()
+
+    print(f"Ядер: {os.cpu_count()}, голосов: {args.votes}")
+    workdir = tempfile.mkdtemp(prefix="bench-shards-", dir=args.dir)
+    try:
+        # 0 - один процесс с групповым коммитом, для сравнения
+        for shards in [0] + args.shards:
+            # Шарды лежат рядом с базой (voting.shardN.db): у каждого прогона свой каталог
+            rundir = os.path.join(workdir, str(shards))
+            os.mkdir(rundir)
+            db_path, catalogue = make_database(args.db, rundir, "voting.db", seed=args.seed)
+            elapsed, mismatches = asyncio.run(
+                run(db_path, shards, catalogue[:args.nominations], args.votes, args.concurrency)
+            )
+            label = f"{shards} шард(ов)" if shards else "без шардов"
+            print(f"  {label}: {args.votes / elapsed:,.0f} голосов/с ({elapsed:.2f} с), расхождений: {len(mismatches)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
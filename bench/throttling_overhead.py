@@ -0,0 +1,86 @@
+"""Накладные расходы ThrottlingMiddleware на один апдейт.
+
+Хендлер-заглушка вызывается напрямую и через middleware для сообщений и
+callback от --users разных пользователей: без группы лимита, в пределах лимита,
+сверх лимита (лишнее сообщение отбрасывается) и при заполненном maxsize, когда
+каждая новая корзина вытесняет старую.
+
+    python bench/throttling_overhead.py --number 200000
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+
+from common import time_per_await
+
+from aiogram.types import CallbackQuery, Chat, Message, User
+from throttling import RateLimiter, ThrottlingMiddleware
+
+UNLIMITED = {"vote": (10 ** 9, 10 ** 9), "results": (10 ** 9, 10 ** 9), "admin": (10 ** 9, 10 ** 9)}
+EXHAUSTED = {"vote": (10 ** -9, 1), "results": (10 ** -9, 1), "admin": (10 ** -9, 1)}
+
+
+def make_message(user_id, text):
+    return Message(
+        message_id=1,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="user"),
+        text=text,
+    )
+
+
+def make_callback(user_id, data):
+    user = User(id=user_id, is_bot=False, first_name="user")
+    return CallbackQuery(id=str(user_id), from_user=user, chat_instance="bench", data=data,
+                         message=make_message(user_id, "menu"))
+
+
+async def handler(event, data):
+    return True
+
+
+async def run(args):
+    users = range(1, args.users + 1)
+    votes = [make_message(user_id, "🗳️ Голосовать") for user_id in users]
+    callbacks = [make_callback(user_id, "vote_part:1:2") for user_id in users]
+    other = [make_message(user_id, "привет") for user_id in users]
+
+    def cycle(events, middleware=None):
+        events = itertools.cycle(events)
+        if middleware is None:
+            return lambda: handler(next(events), {})
+        return lambda: middleware(handler, next(events), {})
+
+    def throttling(limits, maxsize=100000):
+        return ThrottlingMiddleware(RateLimiter(limits, maxsize=maxsize))
+
+    runs = (
+        ("хендлер без middleware", cycle(votes)),
+        ("сообщение без группы лимита", cycle(other, throttling(UNLIMITED))),
+        ("сообщение в пределах лимита", cycle(votes, throttling(UNLIMITED))),
+        ("callback в пределах лимита", cycle(callbacks, throttling(UNLIMITED))),
+        ("сообщение сверх лимита", cycle(votes, throttling(EXHAUSTED))),
+        (f"вытеснение корзин (maxsize={args.users // 2})", cycle(votes, throttling(UNLIMITED, args.users // 2))),
+    )
+    baseline = None
+    for name, call in runs:
+        per_update = await time_per_await(call, args.number)
+        if baseline is None:
+            baseline = per_update
+            print(f"{name}: {per_update:.2f} мкс на апдейт")
+        else:
+            print(f"{name}: {per_update:.2f} мкс на апдейт (+{per_update - baseline:.2f} мкс)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы ограничения частоты на апдейт")
+    parser.add_argument("--users", type=int, default=10000, help="разных пользователей в потоке апдейтов")
+    parser.add_argument("--number", type=int, default=200000, help="апдейтов в каждом прогоне")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
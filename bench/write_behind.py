@@ -0,0 +1,69 @@
+"""Пропускная способность голосования в зависимости от размера пачки write-behind.
+
+--concurrency корутин, как хендлеры vote_part_, отправляют --votes голосов
+через AsyncDatabase.add_vote. Первая строка - без write-behind (коммит на
+каждый голос), дальше VoteWriteBehind с каждым размером пачки из --batch-sizes.
+Каждый прогон идет на своей копии базы.
+
+    python bench/write_behind.py --votes 20000 --batch-sizes 1,10,50,200,1000
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+
+from common import add_common_arguments, make_database, random_vote, summarize
+
+from database import AsyncDatabase
+
+
+async def run(db, args, catalogue):
+    rnd = random.Random(args.seed)
+    latencies = []
+    failed = 0
+    per_task = args.votes // args.concurrency
+
+    async def voter():
+        nonlocal failed
+        for _ in range(per_task):
+            started = time.perf_counter()
+            result = await db.add_vote(*random_vote(rnd, catalogue, args.users))
+            failed += not result.ok
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(voter() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    await db.close()
+    return per_task * args.concurrency / elapsed, summarize(latencies), failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Голосов в секунду в зависимости от размера пачки write-behind")
+    add_common_arguments(parser)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=10000, help="сколько пользователей голосуют")
+    parser.add_argument("--concurrency", type=int, default=500, help="одновременных хендлеров")
+    parser.add_argument("--batch-sizes", default="1,10,50,200,1000")
+    parser.add_argument("--flush-interval-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    runs = [("без write-behind", {})]
+    runs += [(f"пачка {size}", {"write_behind": True, "batch_size": size, "flush_interval_ms": args.flush_interval_ms})
+             for size in map(int, args.batch_sizes.split(","))]
+
+    workdir = tempfile.mkdtemp(prefix="bench-batch-", dir=args.dir)
+    try:
+        for index, (name, options) in enumerate(runs):
+            db_path, catalogue = make_database(args.db, workdir, f"batch{index}.db", seed=args.seed)
+            votes_per_s, summary, failed = asyncio.run(run(AsyncDatabase(db_path, **options), args, catalogue))
+            print(f"{name}: {votes_per_s:.0f} голосов/с, p50 {summary['p50_ms']} мс, p99 {summary['p99_ms']} мс, "
+                  f"ошибок: {failed}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
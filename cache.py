@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+
+
+async def cached(store, key, version, build):
+    """Значение из store (ключ -> (версия, значение)) или await build(), если версия изменилась"""
+    entry = store.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    value = await build()
+    store[key] = (version, value)
+    return value
+
+
+class Catalogue:
+    """Снимок номинаций и участников со словарями id -> имя"""
+
+    def __init__(self, nominations, participants):
+        # nominations: [(id, name)] по id, participants: [(id, nomination_id, name)] по id
+        self.nominations = list(nominations)
+        self.nomination_names = dict(self.nominations)
+        self.participants = {nomination_id: [] for nomination_id, _ in self.nominations}
+        self.participant_info = {}
+
+        for participant_id, nomination_id, name in participants:
+            self.participants.setdefault(nomination_id, []).append((participant_id, name))
+            self.participant_info[participant_id] = (name, nomination_id)
+
+
+class CatalogueCache:
+    """Read-through кэш каталога номинаций и участников.
+
+    Каталог меняется только из админки (добавление и удаление участников),
+    поэтому он читается из базы один раз и держится в памяти, пока его не
+    сбросит invalidate(). Каждый сброс увеличивает version. Если известно,
+    какая номинация изменилась, растет и ее собственная версия: по ней
+    клавиатуры понимают, что пересобрать нужно только ее.
+    """
+
+    def __init__(self, loader):
+        # loader() -> (nominations, participants) в формате Catalogue
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._catalogue = None
+        self.version = 0
+        # Растет при сбросе без указания номинации (меняется весь каталог)
+        self.full_version = 0
+        self._nomination_versions = {}
+        # Собранные клавиатуры keyboards.cached_keyboard: ключ -> (версия каталога, разметка).
+        # Версии свои у каждого экземпляра, поэтому и клавиатуры хранятся при нем
+        self.keyboards = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def loaded(self):
+        return self._catalogue is not None
+
+    def get(self):
+        # Счетчики меняются под блокировкой: get вызывают потоки чтения одновременно
+        with self._lock:
+            if self._catalogue is None:
+                self.misses += 1
+                self._catalogue = Catalogue(*self._loader())
+            else:
+                self.hits += 1
+            return self._catalogue
+
+    def invalidate(self, nomination_id=None):
+        with self._lock:
+            self._catalogue = None
+            self.version += 1
+            if nomination_id is None:
+                self.full_version += 1
+            else:
+                self._nomination_versions[nomination_id] = self._nomination_versions.get(nomination_id, 0) + 1
+
+    def nomination_version(self, nomination_id):
+        """Версия участников одной номинации"""
+        return self.full_version, self._nomination_versions.get(nomination_id, 0)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "version": self.version}
+
+
+class UserVotesCache:
+    """LRU кэш текущих голосов пользователей: user_id -> {nomination_id: participant_id}.
+
+    Голос после коммита записывается в кэш сразу (record_vote), удаление участника
+    убирает его из всех записей. Пользователь, которого нет в кэше, загружается
+    из базы целиком: load_started() перед запросом и put() после него, в том числе
+    put(user_id, None), если запрос не удался. Если пока шел запрос, пользователь
+    успел проголосовать, put() ничего не сохраняет - прочитанные голоса могли устареть.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        # user_id -> голосовал ли пользователь, пока его голоса читались из базы
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, user_id):
+        return user_id in self._users
+
+    def get(self, user_id):
+        """Копия голосов пользователя или None, если его нет в кэше"""
+        with self._lock:
+            votes = self._users.get(user_id)
+            if votes is None:
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return dict(votes)
+
+    def _store(self, user_id, votes):
+        self._users[user_id] = votes
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+            self.evictions += 1
+
+    def load_started(self, user_id):
+        with self._lock:
+            self._loading.setdefault(user_id, False)
+
+    def put(self, user_id, votes):
+        """Сохраняет голоса, прочитанные из базы после load_started(); None - загрузка не удалась"""
+        with self._lock:
+            # Нет отметки - ее уже забрала параллельная загрузка того же пользователя
+            if self._loading.pop(user_id, True) or votes is None:
+                return
+            self._store(user_id, dict(votes))
+
+    def record_vote(self, user_id, nomination_id, participant_id):
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id] = True
+            votes = self._users.get(user_id)
+            if votes is not None:
+                votes[nomination_id] = participant_id
+                self._users.move_to_end(user_id)
+
+    def remove_participant(self, participant_id):
+        with self._lock:
+            for votes in self._users.values():
+                for nomination_id, voted_for in list(votes.items()):
+                    if voted_for == participant_id:
+                        del votes[nomination_id]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._users)}
+
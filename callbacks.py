@@ -0,0 +1,29 @@
+from aiogram.filters.callback_data import CallbackData
+
+
+class VoteNominationCallback(CallbackData, prefix="vote_nom"):
+    """Выбор номинации при голосовании"""
+    nomination_id: int
+
+
+class VoteParticipantCallback(CallbackData, prefix="vote_part"):
+    """Голос за участника: номинация передается вместе с участником, FSM не нужен"""
+    nomination_id: int
+    participant_id: int
+
+
+class AdminNominationCallback(CallbackData, prefix="admin_nom"):
+    """Выбор номинации в админ-панели; action - "add" или "delete" """
+    action: str
+    nomination_id: int
+
+
+class AdminDeleteParticipantCallback(CallbackData, prefix="admin_del_part"):
+    """Удаление участника из админ-панели"""
+    participant_id: int
+
+
+class VotersPageCallback(CallbackData, prefix="voters"):
+    """Листание отчета "Кто голосовал": страница после (next) или до (prev) user_id"""
+    direction: str
+    user_id: int
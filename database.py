@@ -1,59 +1,443 @@
+import asyncio
+import enum
+import functools
+import logging
+import queue
+import re
 import sqlite3
 import os
-from config import NOMINATIONS
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: второй процесс на той же базе не отсекается
+    fcntl = None
+
+from migrations import SCHEMA_VERSION, get_version, migrate, seed_nominations
+from transfer import read_rows, write_rows
+from eventlog import (
+    GET_EVENT_SEQ_SQL,
+    SET_EVENT_SEQ_SQL,
+    SNAPSHOT_VOTES_SQL,
+    add_participant_event,
+    delete_participant_event,
+    vote_event,
+)
+from tally import VoteTally
+from cache import CatalogueCache, UserVotesCache
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать блокировку базы, прежде чем вернуть "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# Настройки, которые применяются к каждому новому соединению пула
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+    'PRAGMA cache_size=-16000',  # 16 МБ страничного кэша
+    'PRAGMA mmap_size=268435456',  # 256 МБ
+)
+
+# Голос записывается одним UPSERT. Прежний выбор пользователя сохраняется
+# в previous_participant_id и возвращается через RETURNING, поэтому понять,
+# новый это голос или измененный, можно без отдельного SELECT.
+# Текст запроса постоянный, так что sqlite3 берет уже подготовленный statement
+# из кэша соединения, а соединения живут в пуле.
+UPSERT_VOTE_SQL = '''
+    INSERT INTO votes
+    (user_id, nomination_id, participant_id, first_name, last_name, username)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, nomination_id) DO UPDATE SET
+        previous_participant_id = votes.participant_id,
+        participant_id = excluded.participant_id,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        username = excluded.username
+    RETURNING previous_participant_id
+'''
+
+NOMINATIONS_SQL = 'SELECT id, name FROM nominations ORDER BY id'
+
+PARTICIPANTS_SQL = 'SELECT id, nomination_id, name FROM participants ORDER BY id'
+
+COUNT_VOTES_SQL = '''
+    SELECT nomination_id, participant_id, COUNT(*)
+    FROM votes
+    GROUP BY nomination_id, participant_id
+'''
+
+TOTAL_VOTES_SQL = 'SELECT COUNT(*) FROM votes'
+
+DELETE_PARTICIPANT_SQL = 'DELETE FROM participants WHERE id = ?'
+
+DELETE_PARTICIPANT_VOTES_SQL = 'DELETE FROM votes WHERE participant_id = ?'
+
+# Голоса пользователя для UserVotesCache; имена берутся из каталога
+USER_VOTES_SQL = 'SELECT nomination_id, participant_id FROM votes WHERE user_id = ?'
+
+VOTERS_INFO_SQL = '''
+    SELECT v.user_id, n.name as nomination, p.name as participant, 
+           v.first_name, v.last_name, v.username
+    FROM votes v
+    JOIN nominations n ON v.nomination_id = n.id
+    JOIN participants p ON v.participant_id = p.id
+    ORDER BY v.user_id, n.name
+'''
+
+# Страница отчета о голосующих: keyset-пагинация по user_id, в странице не больше
+# limit пользователей со всеми их голосами. Назад - те же запросы в обратном порядке.
+VOTERS_PAGE_SQL = '''
+    SELECT v.user_id, n.name as nomination, p.name as participant,
+           v.first_name, v.last_name, v.username
+    FROM votes v
+    JOIN nominations n ON v.nomination_id = n.id
+    JOIN participants p ON v.participant_id = p.id
+    WHERE v.user_id IN (
+        SELECT DISTINCT user_id FROM votes WHERE user_id > ? ORDER BY user_id LIMIT ?
+    )
+    ORDER BY v.user_id, n.name
+'''
+
+VOTERS_PAGE_BACKWARD_SQL = '''
+    SELECT v.user_id, n.name as nomination, p.name as participant,
+           v.first_name, v.last_name, v.username
+    FROM votes v
+    JOIN nominations n ON v.nomination_id = n.id
+    JOIN participants p ON v.participant_id = p.id
+    WHERE v.user_id IN (
+        SELECT DISTINCT user_id FROM votes WHERE user_id < ? ORDER BY user_id DESC LIMIT ?
+    )
+    ORDER BY v.user_id DESC, n.name
+'''
+
+# Выгрузки для /export: SQL и колонки файла. Таблицы читаются целиком
+EXPORT_VOTES_SQL = '''
+    SELECT v.user_id, v.first_name, v.last_name, v.username,
+           v.nomination_id, n.name, v.participant_id, p.name
+    FROM votes v
+    JOIN nominations n ON v.nomination_id = n.id
+    JOIN participants p ON v.participant_id = p.id
+    ORDER BY v.id
+'''
+EXPORT_PARTICIPANTS_SQL = '''
+    SELECT p.id, p.nomination_id, n.name, p.name
+    FROM participants p
+    JOIN nominations n ON p.nomination_id = n.id
+    ORDER BY p.id
+'''
+EXPORTS = {
+    "votes": (EXPORT_VOTES_SQL, ("user_id", "first_name", "last_name", "username",
+                                 "nomination_id", "nomination", "participant_id", "participant")),
+    "participants": (EXPORT_PARTICIPANTS_SQL, ("id", "nomination_id", "nomination", "name")),
+}
+# Итоги собираются из кэша каталога и подсчета в памяти, без запроса
+RESULTS_COLUMNS = ("nomination", "participant", "votes")
+
+# Загрузка участников: одинаковое имя в той же номинации повторно не добавляется
+IMPORT_PARTICIPANT_SQL = '''
+    INSERT INTO participants (nomination_id, name)
+    SELECT ?, ?
+    WHERE NOT EXISTS (SELECT 1 FROM participants WHERE nomination_id = ? AND name = ?)
+'''
+
+# Участники, добавленные загрузкой: id больше последнего до нее (пишет один поток)
+LAST_PARTICIPANT_ID_SQL = 'SELECT COALESCE(MAX(id), 0) FROM participants'
+PARTICIPANTS_AFTER_SQL = 'SELECT id, nomination_id, name FROM participants WHERE id > ? ORDER BY id'
+
+VOTERS_AFTER_SQL = 'SELECT EXISTS (SELECT 1 FROM votes WHERE user_id > ?)'
+VOTERS_BEFORE_SQL = 'SELECT EXISTS (SELECT 1 FROM votes WHERE user_id < ?)'
+
+# Запросы для проверки планов: (имя, SQL, пример параметров, можно ли полное сканирование).
+# Полное сканирование допустимо только там, где таблица действительно читается целиком.
+QUERY_PLAN_CHECKS = (
+    ("catalogue_nominations", NOMINATIONS_SQL, (), True),
+    ("catalogue_participants", PARTICIPANTS_SQL, (), True),
+    ("upsert_vote", UPSERT_VOTE_SQL, (1, 1, 1, None, None, None), False),
+    # Агрегаты по всей таблице: только при запуске и в /check_tally, обход покрывающего индекса
+    ("count_votes", COUNT_VOTES_SQL, (), True),
+    ("total_votes", TOTAL_VOTES_SQL, (), True),
+    ("delete_participant", DELETE_PARTICIPANT_SQL, (1,), False),
+    ("delete_participant_votes", DELETE_PARTICIPANT_VOTES_SQL, (1,), False),
+    ("user_votes", USER_VOTES_SQL, (1,), False),
+    # Полный отчет о голосующих читает все голоса (постранично - voters_page)
+    ("voters_info", VOTERS_INFO_SQL, (), True),
+    ("voters_page", VOTERS_PAGE_SQL, (0, 20), False),
+    ("voters_page_backward", VOTERS_PAGE_BACKWARD_SQL, (0, 20), False),
+    ("voters_after", VOTERS_AFTER_SQL, (0,), False),
+    ("voters_before", VOTERS_BEFORE_SQL, (0,), False),
+    ("export_votes", EXPORT_VOTES_SQL, (), True),
+    ("export_participants", EXPORT_PARTICIPANTS_SQL, (), True),
+    ("import_participant", IMPORT_PARTICIPANT_SQL, (1, "", 1, ""), False),
+    ("last_participant_id", LAST_PARTICIPANT_ID_SQL, (), False),
+    ("participants_after", PARTICIPANTS_AFTER_SQL, (0,), False),
+    ("snapshot_votes", SNAPSHOT_VOTES_SQL, (), True),
+)
+
+# Полный проход по таблице в плане: "SCAN <таблица>" и обход всего индекса
+# "SCAN <таблица> USING [COVERING] INDEX <индекс>" (без условия, в отличие от SEARCH).
+# "SCAN CONSTANT ROW" сюда не попадает
+_FULL_SCAN_RE = re.compile(r'^SCAN (\S+)(?: AS \S+)?(?: USING (?:COVERING )?INDEX \S+)?$')
+
+class DatabaseInUseError(RuntimeError):
+    """С этим файлом базы уже работает другой AsyncDatabase (процесс бота)"""
+
+def _lock_database(db_path):
+    """Эксклюзивная блокировка db_path + ".lock": открытый файл или None без fcntl.
+    
+    Подсчет голосов, кэши каталога и голосов пользователей, тексты результатов,
+    клавиатуры и процессы шардов живут в памяти процесса и не видят записей
+    другого, поэтому с базой работает один процесс бота. Блокировка снимается,
+    когда файл закрыт (и когда процесс завершился).
+    """
+    if fcntl is None:
+        return None
+    lock_file = open(db_path + ".lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise DatabaseInUseError(
+            f"{db_path} уже открыта другим процессом бота: несколько процессов на одной базе не поддерживаются"
+        ) from None
+    return lock_file
+
+class VoteStatus(enum.Enum):
+    NEW = "new"
+    CHANGED = "changed"
+    UNCHANGED = "unchanged"
+    FAILED = "failed"
+
+class VoteResult(NamedTuple):
+    """Результат add_vote: что произошло с голосом и за кого голосовали раньше"""
+    status: VoteStatus
+    previous_participant_id: Optional[int] = None
+    
+    @property
+    def ok(self):
+        return self.status is not VoteStatus.FAILED
 
 class Database:
-    def __init__(self, db_path="voting.db"):
+    """Синхронный доступ к базе через пул соединений.
+    
+    event_log - eventlog.EventLog: каждое изменение голосов и каталога дописывается
+    в журнал, а номер события сохраняется в той же транзакции (event_log_state).
+    Писать в базу с журналом должен один поток.
+    """
+    
+    def __init__(self, db_path="voting.db", pool_size=5, online_migrations=False,
+                 event_log=None, snapshot_every=100000, user_votes_cache=10000):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.online_migrations = online_migrations
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        self._closed = False
         self.init_db()
+        
+        self.catalogue = CatalogueCache(self._load_catalogue)
+        self.user_votes = UserVotesCache(user_votes_cache)
+        self.tally = VoteTally()
+        self.event_log = event_log
+        self.snapshot_every = snapshot_every
+        # Кто снимает снимок, когда журнал дорос до snapshot_every; None - сразу,
+        # в потоке записи (AsyncDatabase переносит снимок в поток чтения)
+        self.schedule_snapshot = None
+        self._snapshot_lock = threading.Lock()
+        if event_log is None:
+            self.tally.load(self._count_votes())
+        elif not self._recover_tally():
+            self.tally.load(self._count_votes())
+            self._align_event_seq()
+            self.snapshot_event_log()
     
+    def _connect(self):
+        """Открывает новое соединение и применяет к нему pragma"""
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Database is closed")
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._pool_lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        
+        # Пул исчерпан - ждем, пока кто-нибудь вернет соединение
+        return self._pool.get()
+    
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        self._pool.put_nowait(conn)
+    
+    @contextmanager
     def get_connection(self):
-        """Создает новое соединение с базой данных"""
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+        """Берет соединение из пула: коммитит при успехе, откатывает при ошибке"""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(conn)
+    
+    def close(self):
+        """Закрывает все соединения пула"""
+        if self.event_log is not None:
+            self.event_log.close()
+        self._closed = True
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    
+    def get_schema_version(self):
+        """Текущая версия схемы из PRAGMA user_version"""
+        with self.get_connection() as conn:
+            return get_version(conn)
     
     def init_db(self):
+        """Применяет недостающие миграции схемы (см. migrations.py) и добавляет новые номинации из config"""
+        if self.get_schema_version() < SCHEMA_VERSION:
+            # Отдельное соединение в autocommit: транзакциями управляет migrate
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+            try:
+                conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+                migrate(conn, online=self.online_migrations)
+            finally:
+                conn.close()
+        
+        # Миграция 1 заводит номинации только в новой базе, поэтому новые номинации
+        # из config.NOMINATIONS добавляются при каждом запуске (INSERT OR IGNORE)
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Таблица номинаций
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS nominations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL
-                )
-            ''')
-            
-            # Таблица участников
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS participants (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nomination_id INTEGER,
-                    name TEXT NOT NULL,
-                    FOREIGN KEY (nomination_id) REFERENCES nominations (id)
-                )
-            ''')
-            
-            # Таблица голосов с информацией о пользователях
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS votes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    first_name TEXT,
-                    last_name TEXT,
-                    username TEXT,
-                    nomination_id INTEGER NOT NULL,
-                    participant_id INTEGER NOT NULL,
-                    FOREIGN KEY (nomination_id) REFERENCES nominations (id),
-                    FOREIGN KEY (participant_id) REFERENCES participants (id),
-                    UNIQUE(user_id, nomination_id)
-                )
-            ''')
-            
-            # Добавляем номинации по умолчанию
-            for nomination in NOMINATIONS:
-                cursor.execute('INSERT OR IGNORE INTO nominations (name) VALUES (?)', (nomination,))
-            
-            conn.commit()
+            seed_nominations(conn)
+    
+    def _load_catalogue(self):
+        """Номинации и участники целиком, для CatalogueCache"""
+        with self.get_connection() as conn:
+            nominations = conn.execute(NOMINATIONS_SQL).fetchall()
+            participants = conn.execute(PARTICIPANTS_SQL).fetchall()
+        return nominations, participants
+    
+    def _catalogue_changed(self, nomination_id=None):
+        # Сбрасываем кэш и сразу прогреваем его заново, чтобы чтения не ходили в базу
+        self.catalogue.invalidate(nomination_id)
+        self.catalogue.get()
+    
+    def _recover_tally(self):
+        """Подсчет из снимка и хвоста журнала; False - журнал не совпадает с базой"""
+        with self.get_connection() as conn:
+            db_seq = conn.execute(GET_EVENT_SEQ_SQL).fetchone()[0]
+        snapshot = self.event_log.latest_snapshot()
+        if snapshot is None and db_seq == self.event_log.seq == 0:
+            logger.info("Снимка журнала событий еще нет, считаем голоса по базе и делаем первый снимок")
+            return False
+        if snapshot is None:
+            logger.warning("В журнале событий (seq=%s) нет снимка, пересчитываем голоса и делаем снимок",
+                           self.event_log.seq)
+            return False
+        if db_seq != self.event_log.seq:
+            logger.warning(
+                "Журнал событий (seq=%s) не совпадает с базой (seq=%s), пересчитываем голоса и делаем снимок",
+                self.event_log.seq, db_seq
+            )
+            return False
+        
+        started = time.perf_counter()
+        replayed = self.event_log.load_tally(self.tally)
+        logger.info("Подсчет восстановлен из снимка и %s событий журнала за %.3f с",
+                    replayed, time.perf_counter() - started)
+        return True
+    
+    def _log_events(self, conn, events):
+        # Номер последнего события фиксируется в транзакции изменения;
+        # сами события дописываются в журнал после коммита (_append_events)
+        if self.event_log is not None and events:
+            conn.execute(SET_EVENT_SEQ_SQL, (self.event_log.seq + len(events),))
+    
+    def _append_events(self, events):
+        if self.event_log is None or not events:
+            return
+        self.event_log.append(events)
+        self._snapshot_if_due()
+    
+    def _snapshot_if_due(self):
+        if self.event_log.seq - self.event_log.snapshot_seq >= self.snapshot_every:
+            if self.schedule_snapshot is not None:
+                self.schedule_snapshot()
+            else:
+                self.snapshot_event_log()
+    
+    def _align_event_seq(self):
+        """Выравнивает номер события в базе и журнале по большему из двух.
+        
+        Нужен перед снимком при расхождении: если журнал отстал от базы (сбой между
+        коммитом и записью), снимок его догоняет; если журнал впереди базы
+        (база из старой копии), снимок закрывает его хвост.
+        """
+        with self.get_connection() as conn:
+            seq = max(self.event_log.seq, conn.execute(GET_EVENT_SEQ_SQL).fetchone()[0])
+            conn.execute(SET_EVENT_SEQ_SQL, (seq,))
+    
+    def write_event_snapshot(self):
+        """Пишет снимок подсчета, каталога и голосов, возвращает (путь, seq).
+        
+        Все читается на соединении чтения в одной транзакции: номер последнего
+        события из event_log_state и голоса соответствуют одному состоянию базы,
+        а писатель в это время продолжает коммитить (WAL). Журнал не трогается,
+        покрытое снимком удаляет compact_event_log в потоке записи.
+        """
+        # Два снимка с одним seq писали бы один и тот же временный файл
+        with self._snapshot_lock, self.get_connection() as conn:
+            conn.execute('BEGIN')
+            seq = conn.execute(GET_EVENT_SEQ_SQL).fetchone()[0]
+            path = self.event_log.write_snapshot(
+                seq,
+                conn.execute(COUNT_VOTES_SQL).fetchall(),
+                conn.execute(NOMINATIONS_SQL).fetchall(),
+                conn.execute(PARTICIPANTS_SQL).fetchall(),
+                conn.execute(SNAPSHOT_VOTES_SQL),
+            )
+        return path, seq
+    
+    def compact_event_log(self, seq):
+        """Удаляет сегменты журнала, покрытые снимком seq; выполняется в потоке записи"""
+        self.event_log.compact(seq)
+    
+    def snapshot_event_log(self):
+        """Снимок журнала и удаление покрытых им сегментов подряд, в этом потоке"""
+        if self.event_log is None:
+            return None
+        started = time.perf_counter()
+        path, seq = self.write_event_snapshot()
+        self.compact_event_log(seq)
+        logger.info("Снимок журнала %s записан за %.3f с", path, time.perf_counter() - started)
+        return path
     
     def add_participant(self, nomination_id, name):
         with self.get_connection() as conn:
@@ -62,117 +446,632 @@ class Database:
                 'INSERT INTO participants (nomination_id, name) VALUES (?, ?)',
                 (nomination_id, name)
             )
+            events = []
+            if self.event_log is not None:
+                events = [add_participant_event(cursor.lastrowid, nomination_id, name)]
+            self._log_events(conn, events)
             conn.commit()
-            return cursor.lastrowid
+        self._append_events(events)
+        self._catalogue_changed(nomination_id)
+        return cursor.lastrowid
     
-    def get_nominations(self):
+    def _resolve_nomination(self, catalogue, record):
+        # Номинация по nomination_id, если он есть в каталоге, иначе по названию
+        nomination_id = str(record.get("nomination_id") or "").strip()
+        if nomination_id.isdigit() and int(nomination_id) in catalogue.nomination_names:
+            return int(nomination_id)
+        
+        nomination = str(record.get("nomination") or "").strip()
+        if nomination.isdigit() and int(nomination) in catalogue.nomination_names:
+            return int(nomination)
+        for nom_id, nom_name in catalogue.nominations:
+            if nom_name == nomination:
+                return nom_id
+        return None
+    
+    def import_participants(self, path, fmt="csv"):
+        """Загружает участников из файла (колонки nomination или nomination_id и name).
+        
+        Файл читается построчно и пишется одним executemany в одной транзакции.
+        Возвращает (добавлено, пропущено): пропускаются строки без имени, с неизвестной
+        номинацией и участники, которые в номинации уже есть.
+        """
+        catalogue = self.catalogue.get()
+        accepted = 0
+        rejected = 0
+        
+        def rows():
+            nonlocal accepted, rejected
+            for record in read_rows(path, fmt):
+                if not isinstance(record, dict):
+                    rejected += 1
+                    continue
+                nomination_id = self._resolve_nomination(catalogue, record)
+                name = str(record.get("name") or "").strip()
+                if nomination_id is None or not name:
+                    rejected += 1
+                    continue
+                accepted += 1
+                yield nomination_id, name, nomination_id, name
+        
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name FROM nominations ORDER BY id')
-            return cursor.fetchall()
+            last_id = conn.execute(LAST_PARTICIPANT_ID_SQL).fetchone()[0]
+            changes_before = conn.total_changes
+            conn.executemany(IMPORT_PARTICIPANT_SQL, rows())
+            added = conn.total_changes - changes_before
+            if self.event_log is not None and added:
+                conn.execute(SET_EVENT_SEQ_SQL, (self.event_log.seq + added,))
+        
+        if self.event_log is not None and added:
+            # По событию на участника; читаются курсором после коммита, без списка в памяти
+            with self.get_connection() as conn:
+                self.event_log.append(
+                    add_participant_event(*row) for row in conn.execute(PARTICIPANTS_AFTER_SQL, (last_id,))
+                )
+            self._snapshot_if_due()
+        self._catalogue_changed()
+        return added, rejected + accepted - added
     
-    def get_participants(self, nomination_id):
+    def _fetch_batches(self, cursor, batch_size):
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    
+    def export(self, kind, path, fmt="csv", batch_size=1000):
+        """Выгружает votes, participants или results в файл, возвращает число строк.
+        
+        Строки читаются курсором пачками по batch_size, поэтому память не зависит
+        от размера таблицы; вся выгрузка читается из одного снимка базы.
+        """
+        if kind == "results":
+            return write_rows(path, RESULTS_COLUMNS, [self.get_vote_results()], fmt)
+        
+        sql, columns = EXPORTS[kind]
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT id, name FROM participants WHERE nomination_id = ? ORDER BY id',
-                (nomination_id,)
-            )
-            return cursor.fetchall()
+            cursor = conn.execute(sql)
+            return write_rows(path, columns, self._fetch_batches(cursor, batch_size), fmt)
     
-    def add_vote(self, user_id, nomination_id, participant_id, first_name=None, last_name=None, username=None):
+    def get_nominations(self):
+        return self.catalogue.get().nominations
+    
+    def get_nomination_name(self, nomination_id, default=""):
+        return self.catalogue.get().nomination_names.get(nomination_id, default)
+    
+    def get_participants(self, nomination_id):
+        return self.catalogue.get().participants.get(nomination_id, [])
+    
+    def _upsert_vote(self, conn, vote):
+        previous_participant_id, = conn.execute(UPSERT_VOTE_SQL, vote).fetchone()
+        participant_id = vote[2]
+        
+        if previous_participant_id is None:
+            return VoteResult(VoteStatus.NEW)
+        if previous_participant_id == participant_id:
+            return VoteResult(VoteStatus.UNCHANGED, previous_participant_id)
+        return VoteResult(VoteStatus.CHANGED, previous_participant_id)
+    
+    def _vote_events(self, votes, results):
+        # Повторный голос за того же участника тоже пишется: он обновляет имя пользователя,
+        # подсчет при проигрывании он не меняет
+        if self.event_log is None:
+            return []
+        return [
+            vote_event(vote, result.previous_participant_id)
+            for vote, result in zip(votes, results)
+            if result.ok
+        ]
+    
+    def _apply_to_tally(self, vote, result):
+        user_id, nomination_id, participant_id = vote[:3]
+        if result.status is VoteStatus.NEW or result.status is VoteStatus.CHANGED:
+            self.tally.apply_vote(nomination_id, participant_id, result.previous_participant_id)
+            self.user_votes.record_vote(user_id, nomination_id, participant_id)
+    
+    def _in_catalogue(self, vote):
+        info = self.catalogue.get().participant_info.get(vote[2])
+        return info is not None and info[1] == vote[1]
+    
+    def add_vote(self, user_id, nomination_id, participant_id, first_name=None, last_name=None, username=None,
+                 check_catalogue=False):
+        """Записывает или меняет голос пользователя в номинации, возвращает VoteResult.
+        
+        check_catalogue - голос за участника, которого нет в каталоге (например, удален,
+        пока голос ждал записи), не пишется и возвращается как FAILED.
+        """
+        vote = (user_id, nomination_id, participant_id, first_name, last_name, username)
+        if check_catalogue and not self._in_catalogue(vote):
+            logger.warning("Голос user_id=%s за участника %s, которого нет в номинации %s, не записан",
+                           user_id, participant_id, nomination_id)
+            return VoteResult(VoteStatus.FAILED)
+        try:
+            with self.get_connection() as conn:
+                result = self._upsert_vote(conn, vote)
+                events = self._vote_events((vote,), (result,))
+                self._log_events(conn, events)
+        except sqlite3.Error:
+            logger.exception("Ошибка при добавлении голоса user_id=%s nomination_id=%s", user_id, nomination_id)
+            return VoteResult(VoteStatus.FAILED)
+        
+        # Подсчет и журнал обновляются только после коммита; подсчет раньше журнала,
+        # чтобы снимок после этого события уже его учитывал
+        self._apply_to_tally(vote, result)
+        self._append_events(events)
+        return result
+    
+    def add_votes(self, votes, check_catalogue=False):
+        """Записывает пачку голосов одной транзакцией (один commit на всю пачку).
+        
+        votes - кортежи (user_id, nomination_id, participant_id, first_name, last_name, username).
+        Если транзакция не прошла, голоса записываются по одному, чтобы один
+        плохой голос не испортил результат остальным. check_catalogue - как у add_vote.
+        """
+        if check_catalogue:
+            known = [self._in_catalogue(vote) for vote in votes]
+            if not all(known):
+                written = iter(self.add_votes([vote for vote, ok in zip(votes, known) if ok]))
+                return [next(written) if ok else self.add_vote(*vote, check_catalogue=True)
+                        for vote, ok in zip(votes, known)]
+        try:
+            with self.get_connection() as conn:
+                results = [self._upsert_vote(conn, vote) for vote in votes]
+                events = self._vote_events(votes, results)
+                self._log_events(conn, events)
+        except sqlite3.Error:
+            logger.exception("Ошибка при записи пачки из %s голосов, пишем по одному", len(votes))
+            return [self.add_vote(*vote, check_catalogue=check_catalogue) for vote in votes]
+        
+        for vote, result in zip(votes, results):
+            self._apply_to_tally(vote, result)
+        self._append_events(events)
+        return results
+    
+    def _count_votes(self):
+        """Агрегат голосов из базы: (nomination_id, participant_id, votes)"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                # Сначала проверяем, есть ли уже голос от этого пользователя в этой номинации
-                cursor.execute(
-                    'SELECT id FROM votes WHERE user_id = ? AND nomination_id = ?',
-                    (user_id, nomination_id)
-                )
-                existing_vote = cursor.fetchone()
-                
-                if existing_vote:
-                    # Обновляем существующий голос
-                    cursor.execute('''
-                        UPDATE votes 
-                        SET participant_id = ?, first_name = ?, last_name = ?, username = ?
-                        WHERE user_id = ? AND nomination_id = ?
-                    ''', (participant_id, first_name, last_name, username, user_id, nomination_id))
-                else:
-                    # Добавляем новый голос
-                    cursor.execute('''
-                        INSERT INTO votes 
-                        (user_id, nomination_id, participant_id, first_name, last_name, username)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (user_id, nomination_id, participant_id, first_name, last_name, username))
-                
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Ошибка при добавлении голоса: {e}")
-                return False
+            return conn.execute(COUNT_VOTES_SQL).fetchall()
     
     def get_vote_results(self):
+        """Результаты (номинация, участник, голоса) из кэша каталога и подсчета в памяти"""
+        catalogue = self.catalogue.get()
+        counts, _ = self.tally.snapshot()
+        
+        results = []
+        for nom_id, nom_name in catalogue.nominations:
+            participants = catalogue.participants[nom_id]
+            if not participants:
+                results.append((nom_name, None, 0))
+            for part_id, part_name in participants:
+                results.append((nom_name, part_name, counts.get((nom_id, part_id), 0)))
+        
+        results.sort(key=lambda row: (row[0], -row[2]))
+        return results
+    
+    def check_tally(self):
+        """Сверяет подсчет в памяти с агрегатом SQL.
+        
+        Возвращает список расхождений (nomination_id, participant_id, в памяти, в базе);
+        расхождение в общем числе голосов отдается строкой (None, None, в памяти, в базе).
+        """
+        mismatches = self.tally.diff(self._count_votes())
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT n.name, p.name, COUNT(v.id) as votes
-                FROM nominations n
-                LEFT JOIN participants p ON n.id = p.nomination_id
-                LEFT JOIN votes v ON p.id = v.participant_id
-                GROUP BY n.id, p.id
-                ORDER BY n.name, votes DESC
-            ''')
-            return cursor.fetchall()
+            total = conn.execute(TOTAL_VOTES_SQL).fetchone()[0]
+        if self.tally.total != total:
+            mismatches.append((None, None, self.tally.total, total))
+        return mismatches
     
     def delete_participant(self, participant_id):
+        info = self.catalogue.get().participant_info.get(participant_id)
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM participants WHERE id = ?', (participant_id,))
-            cursor.execute('DELETE FROM votes WHERE participant_id = ?', (participant_id,))
+            cursor.execute(DELETE_PARTICIPANT_SQL, (participant_id,))
+            cursor.execute(DELETE_PARTICIPANT_VOTES_SQL, (participant_id,))
+            events = [delete_participant_event(participant_id)] if self.event_log is not None else []
+            self._log_events(conn, events)
             conn.commit()
+        self.tally.remove_participant(participant_id)
+        self.user_votes.remove_participant(participant_id)
+        self._append_events(events)
+        self._catalogue_changed(info[1] if info else None)
     
-    def get_user_votes(self, user_id):
+    def _load_user_votes(self, user_id):
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT n.name, p.name 
-                FROM votes v
-                JOIN nominations n ON v.nomination_id = n.id
-                JOIN participants p ON v.participant_id = p.id
-                WHERE v.user_id = ?
-            ''', (user_id,))
-            return cursor.fetchall()
+            return conn.execute(USER_VOTES_SQL, (user_id,)).fetchall()
+    
+    def _cached_user_votes(self, user_id, load):
+        """Голоса пользователя из UserVotesCache, при промахе - load(user_id) -> [(nomination_id, participant_id)]"""
+        votes = self.user_votes.get(user_id)
+        if votes is None:
+            self.user_votes.load_started(user_id)
+            votes = None
+            try:
+                votes = dict(load(user_id))
+            finally:
+                # Отметка загрузки снимается и при ошибке, иначе пользователь больше не попадет в кэш
+                self.user_votes.put(user_id, votes)
+        
+        catalogue = self.catalogue.get()
+        return [
+            (nom_name, catalogue.participant_info[votes[nom_id]][0])
+            for nom_id, nom_name in catalogue.nominations
+            if nom_id in votes and votes[nom_id] in catalogue.participant_info
+        ]
+    
+    def get_user_votes(self, user_id):
+        """Голоса пользователя [(номинация, участник)]; при попадании в кэш без запроса к базе"""
+        return self._cached_user_votes(user_id, self._load_user_votes)
     
     def get_participant_info(self, participant_id):
-        """Получить информацию об участнике по ID"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT p.name, n.name, n.id
-                FROM participants p 
-                JOIN nominations n ON p.nomination_id = n.id 
-                WHERE p.id = ?
-            ''', (participant_id,))
-            return cursor.fetchone()
+        """Получить информацию об участнике по ID: (имя, номинация, id номинации)"""
+        catalogue = self.catalogue.get()
+        info = catalogue.participant_info.get(participant_id)
+        if info is None or info[1] not in catalogue.nomination_names:
+            return None
+        name, nomination_id = info
+        return name, catalogue.nomination_names[nomination_id], nomination_id
     
     def get_voters_info(self):
         """Получить информацию о всех голосующих"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT v.user_id, n.name as nomination, p.name as participant, 
-                       v.first_name, v.last_name, v.username
-                FROM votes v
-                JOIN nominations n ON v.nomination_id = n.id
-                JOIN participants p ON v.participant_id = p.id
-                ORDER BY v.user_id, n.name
-            ''')
+            cursor.execute(VOTERS_INFO_SQL)
             return cursor.fetchall()
     
+    def get_voters_page(self, cursor=None, limit=20, backward=False):
+        """Голоса не более чем limit пользователей после user_id=cursor (или до него при backward).
+        
+        Строки как у get_voters_info, по возрастанию user_id вперед и по убыванию назад.
+        cursor=None - первая страница.
+        """
+        with self.get_connection() as conn:
+            if backward:
+                rows = conn.execute(VOTERS_PAGE_BACKWARD_SQL, (cursor, limit)).fetchall()
+            else:
+                rows = conn.execute(VOTERS_PAGE_SQL, (-1 if cursor is None else cursor, limit)).fetchall()
+            return rows
+    
+    def has_voters(self, user_id, before=False):
+        """Есть ли голосовавшие с user_id больше (или меньше при before) заданного"""
+        with self.get_connection() as conn:
+            return bool(conn.execute(VOTERS_BEFORE_SQL if before else VOTERS_AFTER_SQL, (user_id,)).fetchone()[0])
+    
+    @property
+    def results_version(self):
+        """Меняется при любом изменении голосов или каталога - версия для кэша текстов результатов"""
+        return self.tally.version, self.catalogue.version
+    
     def get_total_votes_count(self):
         """Получить общее количество голосов"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM votes')
-            return cursor.fetchone()[0]
\ No newline at end of file
+        return self.tally.total
+    
+    def find_full_scans(self):
+        """Прогоняет EXPLAIN QUERY PLAN по QUERY_PLAN_CHECKS.
+        
+        Возвращает (имя запроса, строка плана) для каждого полного сканирования
+        таблицы там, где оно не разрешено. Пустой список - все запросы идут по индексам.
+        """
+        offenders = []
+        # Отдельное соединение: подготовленные EXPLAIN в кэше соединений пула
+        # не перестраиваются при изменении схемы
+        conn = self._connect()
+        try:
+            for name, sql, params, full_scan_allowed in QUERY_PLAN_CHECKS:
+                if full_scan_allowed:
+                    continue
+                for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params):
+                    detail = row[-1]
+                    if _FULL_SCAN_RE.match(detail):
+                        offenders.append((name, detail))
+        finally:
+            conn.close()
+        return offenders
+
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database для хендлеров aiogram.
+    
+    Все записи выполняются в одном выделенном потоке (SQLite все равно допускает
+    только одного писателя), чтения - в пуле потоков. Event loop не блокируется
+    на диске и блокировках базы.
+    
+    shards > 0 - голоса пишутся в shards процессов, каждый в свой файл
+    (см. sharding.ShardedVotes); write_behind при этом не используется.
+    event_log - журнал событий (eventlog.EventLog), с шардами не поддерживается.
+    
+    Пока база открыта, второй AsyncDatabase на том же файле (в этом или другом
+    процессе) получает DatabaseInUseError: все кэши и подсчет голосов живут
+    в памяти одного процесса.
+    """
+    
+    def __init__(self, db_path="voting.db", readers=4, write_behind=False,
+                 batch_size=200, flush_interval_ms=20, online_migrations=False, shards=0,
+                 event_log=None, snapshot_every=100000, user_votes_cache=10000):
+        if shards and event_log is not None:
+            raise ValueError("Журнал событий не поддерживается вместе с шардами голосов")
+        self._lock_file = _lock_database(db_path)
+        try:
+            # Одно соединение на каждый поток чтения и одно на писателя
+            self.sync = Database(db_path, pool_size=readers + 1, online_migrations=online_migrations,
+                                 event_log=event_log, snapshot_every=snapshot_every,
+                                 user_votes_cache=user_votes_cache)
+        except BaseException:
+            self._unlock()
+            raise
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self.shards = None
+        if shards:
+            # Импорт здесь: sharding сам импортирует database
+            from sharding import ShardedVotes
+            self.shards = ShardedVotes(self.sync, shards, batch_size)
+        self._vote_queue = VoteWriteBehind(self, batch_size, flush_interval_ms) if write_behind and not shards else None
+        # Чтения голосов: из шардов или из основной базы
+        self._votes = self.shards or self.sync
+        # on_query(имя метода, секунды, результат) - для метрик, вызывается из потоков базы
+        self.on_query = None
+        # Готовые тексты результатов results.cached_text: ключ -> (версия результатов, текст).
+        # Версии начинаются с нуля у каждой базы, поэтому тексты хранятся при ней
+        self.results_texts = {}
+        # Снимок журнала по snapshot_every снимается в потоке чтения, запись не ждет
+        self._snapshot = None
+        self._snapshots_stopped = False
+        self.sync.schedule_snapshot = self._schedule_snapshot
+    
+    @property
+    def catalogue(self):
+        return self.sync.catalogue
+    
+    @property
+    def results_version(self):
+        return self.sync.results_version
+    
+    def _call(self, func, *args, **kwargs):
+        if self.on_query is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.on_query(func.__name__, time.perf_counter() - started, result)
+        return result
+    
+    async def _run(self, executor, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(self._call, func, *args, **kwargs))
+    
+    async def _read(self, func, *args, **kwargs):
+        return await self._run(self._readers, func, *args, **kwargs)
+    
+    async def _write(self, func, *args, **kwargs):
+        return await self._run(self._writer, func, *args, **kwargs)
+    
+    async def _cached(self, func, *args):
+        # Если каталог уже в памяти, ответ собирается без похода в поток и базу
+        if self.sync.catalogue.loaded:
+            return self._call(func, *args)
+        return await self._read(func, *args)
+    
+    async def add_participant(self, nomination_id, name):
+        return await self._write(self.sync.add_participant, nomination_id, name)
+    
+    async def import_participants(self, path, fmt="csv"):
+        return await self._write(self.sync.import_participants, path, fmt)
+    
+    async def export(self, kind, path, fmt="csv", batch_size=1000):
+        return await self._read(self._votes.export, kind, path, fmt, batch_size)
+    
+    async def get_nominations(self):
+        return await self._cached(self.sync.get_nominations)
+    
+    async def get_nomination_name(self, nomination_id, default=""):
+        return await self._cached(self.sync.get_nomination_name, nomination_id, default)
+    
+    async def get_participants(self, nomination_id):
+        return await self._cached(self.sync.get_participants, nomination_id)
+    
+    async def add_vote(self, user_id, nomination_id, participant_id, first_name=None, last_name=None, username=None):
+        vote = (user_id, nomination_id, participant_id, first_name, last_name, username)
+        if self.shards is not None:
+            # Голос пишет процесс шарда, поэтому время для метрик меряется здесь
+            started = time.perf_counter()
+            result = await self.shards.add_vote(vote)
+            if self.on_query is not None:
+                self.on_query("add_vote", time.perf_counter() - started, result)
+            return result
+        if self._vote_queue is not None and not self._vote_queue.closed:
+            return await self._vote_queue.submit(vote)
+        # Каталог проверяется в потоке записи: удаление участника, поставленное
+        # раньше голоса, уже выполнено, и голос за него не станет осиротевшей строкой
+        return await self._write(self.sync.add_vote, *vote, check_catalogue=True)
+    
+    async def add_votes(self, votes):
+        if self.shards is not None:
+            return list(await asyncio.gather(*(self.add_vote(*vote) for vote in votes)))
+        return await self._write(self.sync.add_votes, votes, check_catalogue=True)
+    
+    async def get_vote_results(self):
+        return await self._cached(self.sync.get_vote_results)
+    
+    async def delete_participant(self, participant_id):
+        if self.shards is not None:
+            # Сначала каталог и подсчет, затем голоса в шардах - после уже отправленных туда голосов
+            result = await self._write(self.sync.delete_participant, participant_id)
+            await self.shards.delete_participant_votes(participant_id)
+            return result
+        if self._vote_queue is not None:
+            # Как у шардов: голоса, уже стоящие в очереди, записываются до удаления
+            await self._vote_queue.drain()
+        return await self._write(self.sync.delete_participant, participant_id)
+    
+    async def get_user_votes(self, user_id):
+        # Пользователь в кэше голосов - ответ собирается без потока и базы
+        if user_id in self.sync.user_votes and self.sync.catalogue.loaded:
+            return self._call(self._votes.get_user_votes, user_id)
+        return await self._read(self._votes.get_user_votes, user_id)
+    
+    async def get_participant_info(self, participant_id):
+        return await self._cached(self.sync.get_participant_info, participant_id)
+    
+    async def get_voters_info(self):
+        return await self._read(self._votes.get_voters_info)
+    
+    async def get_voters_page(self, cursor=None, limit=20, backward=False):
+        return await self._read(self._votes.get_voters_page, cursor, limit, backward)
+    
+    async def has_voters(self, user_id, before=False):
+        return await self._read(self._votes.has_voters, user_id, before)
+    
+    async def get_total_votes_count(self):
+        return self.sync.get_total_votes_count()
+    
+    async def check_tally(self):
+        # В потоке записи: подсчет в памяти и таблица голосов меняются там вместе,
+        # а сверка из читателя застала бы голос записанным, но еще не посчитанным
+        return await self._write(self._votes.check_tally)
+    
+    async def find_full_scans(self):
+        return await self._read(self.sync.find_full_scans)
+    
+    def _schedule_snapshot(self):
+        # Вызывается в потоке записи; следующий снимок - только после сжатия журнала предыдущим
+        if self._snapshots_stopped or (self._snapshot is not None and not self._snapshot.done()):
+            return
+        self._snapshot = self._readers.submit(self._background_snapshot)
+    
+    def _background_snapshot(self):
+        try:
+            started = time.perf_counter()
+            path, seq = self.sync.write_event_snapshot()
+            self._writer.submit(self.sync.compact_event_log, seq).result()
+            logger.info("Снимок журнала %s записан за %.3f с", path, time.perf_counter() - started)
+        except Exception:
+            logger.exception("Не удалось записать снимок журнала событий")
+    
+    async def snapshot_event_log(self):
+        """Снимок журнала по команде: файл в потоке чтения, сжатие журнала в потоке записи"""
+        if self.sync.event_log is None:
+            return None
+        started = time.perf_counter()
+        path, seq = await self._read(self.sync.write_event_snapshot)
+        await self._write(self.sync.compact_event_log, seq)
+        logger.info("Снимок журнала %s записан за %.3f с", path, time.perf_counter() - started)
+        return path
+    
+    def _stop_snapshots(self):
+        self._snapshots_stopped = True
+    
+    def _unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    async def close(self):
+        """Дожидается выполнения поставленных запросов, останавливает потоки и закрывает соединения"""
+        if self._vote_queue is not None:
+            await self._vote_queue.close()
+        if self.shards is not None:
+            await self.shards.close()
+        
+        # Флаг ставится в потоке записи, поэтому после него новый снимок не начнется;
+        # начатый дописывается, пока писатель еще может сжать журнал
+        await self._write(self._stop_snapshots)
+        if self._snapshot is not None:
+            await asyncio.wrap_future(self._snapshot)
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.shutdown)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        self.sync.close()
+        self._unlock()
+
+
+class VoteWriteBehind:
+    """Очередь голосов с групповым коммитом.
+    
+    Голоса копятся в asyncio.Queue, фоновая задача записывает их пачками через
+    AsyncDatabase.add_votes: пачка уходит, когда набралось batch_size голосов
+    или прошло flush_interval_ms с момента первого голоса в ней. Хендлер ждет
+    future своего голоса, который завершается только после коммита пачки,
+    поэтому ответ пользователю остается честным. drain() ждет записи всего,
+    что уже в очереди, - так удаление участника встает после голосов за него.
+    """
+    
+    def __init__(self, db, batch_size=200, flush_interval_ms=20):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.closed = False
+        self._queue = asyncio.Queue()
+        self._task = None
+    
+    async def submit(self, vote):
+        """Ставит голос в очередь и ждет, пока его пачка будет записана"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((vote, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            deadline = loop.time() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                vote, future = item
+                if vote is None:
+                    # Метка drain(): голоса перед ней записываются раньше, чем она снимается
+                    await self._flush(batch)
+                    batch = []
+                    if not future.done():
+                        future.set_result(None)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            
+            await self._flush(batch)
+    
+    async def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            results = await self.db.add_votes([vote for vote, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    
+    async def drain(self):
+        """Дожидается записи всех голосов, поставленных в очередь до вызова"""
+        if self._task is None or self._task.done():
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((None, future))
+        await future
+    
+    async def close(self):
+        """Перестает принимать голоса и дожидается записи всего, что уже в очереди"""
+        self.closed = True
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
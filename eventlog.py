@@ -0,0 +1,388 @@
+"""Журнал событий голосования: только дописывание, NDJSON.
+
+Каждый голос (и повторный за того же участника - он обновляет имя
+пользователя), добавление и удаление участника записываются строкой в текущий сегмент журнала (00000000000001.ndjson, ...).
+Снимок (snapshot-<seq>.ndjson) хранит в первой строке подсчет голосов и
+каталог на момент события seq, в остальных - все голоса. После снимка
+старые сегменты и снимки удаляются (компактизация).
+
+При запуске бот читает заголовок последнего снимка и проигрывает только
+хвост журнала после него, не пересчитывая голоса по таблице votes. По
+журналу можно собрать voting.db заново:
+
+    python eventlog.py rebuild events/ restored.db
+
+Скорость записи и проигрывания журнала меряет bench/eventlog_replay.py.
+"""
+import argparse
+import glob
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = ".ndjson"
+SNAPSHOT_PREFIX = "snapshot-"
+
+# Вставка голоса при восстановлении базы: прежний выбор берется из события
+RESTORE_VOTE_SQL = '''
+    INSERT INTO votes
+    (user_id, nomination_id, participant_id, previous_participant_id, first_name, last_name, username)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, nomination_id) DO UPDATE SET
+        previous_participant_id = excluded.previous_participant_id,
+        participant_id = excluded.participant_id,
+        first_name = excluded.first_name,
+        last_name = excluded.last_name,
+        username = excluded.username
+'''
+
+# Голоса для снимка, в порядке колонок RESTORE_VOTE_SQL
+SNAPSHOT_VOTES_SQL = '''
+    SELECT user_id, nomination_id, participant_id, previous_participant_id, first_name, last_name, username
+    FROM votes
+    ORDER BY id
+'''
+
+GET_EVENT_SEQ_SQL = 'SELECT seq FROM event_log_state WHERE id = 1'
+
+SET_EVENT_SEQ_SQL = 'UPDATE event_log_state SET seq = ? WHERE id = 1'
+
+
+def vote_event(vote, previous_participant_id):
+    user_id, nomination_id, participant_id, first_name, last_name, username = vote
+    return {
+        "type": "vote",
+        "ts": round(time.time(), 3),
+        "user_id": user_id,
+        "nomination_id": nomination_id,
+        "participant_id": participant_id,
+        "previous": previous_participant_id,
+        "first_name": first_name,
+        "last_name": last_name,
+        "username": username,
+    }
+
+
+def delete_participant_event(participant_id):
+    return {"type": "delete_participant", "ts": round(time.time(), 3), "participant_id": participant_id}
+
+
+def add_participant_event(participant_id, nomination_id, name):
+    return {
+        "type": "add_participant",
+        "ts": round(time.time(), 3),
+        "participant_id": participant_id,
+        "nomination_id": nomination_id,
+        "name": name,
+    }
+
+
+def replay(tally, events):
+    """Проигрывает события в VoteTally, возвращает их число"""
+    count = 0
+    for event in events:
+        kind = event["type"]
+        if kind == "vote":
+            tally.apply_vote(event["nomination_id"], event["participant_id"], event["previous"])
+        elif kind == "delete_participant":
+            tally.remove_participant(event["participant_id"])
+        count += 1
+    return count
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+class EventLog:
+    """Каталог с сегментами журнала и снимками.
+
+    Писатель один (поток записи AsyncDatabase), но append защищен блокировкой.
+    seq - номер последнего записанного события; номера идут подряд с 1.
+    """
+
+    def __init__(self, directory, segment_size=100000, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_events = 0
+        os.makedirs(directory, exist_ok=True)
+
+        snapshot = self.latest_snapshot()
+        self.snapshot_seq = snapshot[0] if snapshot else 0
+        self.seq = self.snapshot_seq
+        segments = self.segments()
+        if segments:
+            self.seq = max(self.seq, self._recover_segment(segments[-1][1]))
+
+    # --- файлы ---
+
+    def segments(self):
+        """[(первый seq, путь)] по возрастанию"""
+        result = []
+        for path in glob.glob(os.path.join(self.directory, "*" + SEGMENT_SUFFIX)):
+            name = os.path.basename(path)[:-len(SEGMENT_SUFFIX)]
+            if name.isdigit():
+                result.append((int(name), path))
+        return sorted(result)
+
+    def snapshots(self):
+        """[(seq, путь)] по возрастанию"""
+        result = []
+        for path in glob.glob(os.path.join(self.directory, SNAPSHOT_PREFIX + "*" + SEGMENT_SUFFIX)):
+            seq = os.path.basename(path)[len(SNAPSHOT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if seq.isdigit():
+                result.append((int(seq), path))
+        return sorted(result)
+
+    def latest_snapshot(self):
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def _recover_segment(self, path):
+        """seq последнего целого события в сегменте; оборванную при сбое строку отрезает"""
+        last_seq = 0
+        good_size = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    last_seq = json.loads(line)["seq"]
+                except (ValueError, KeyError):
+                    break
+                good_size += len(line)
+        if good_size != os.path.getsize(path):
+            logger.warning("Журнал %s оборван, отрезаем хвост после события %s", path, last_seq)
+            with open(path, "r+b") as f:
+                f.truncate(good_size)
+        return last_seq
+
+    # --- запись ---
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{self.seq + 1:014d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "a", encoding="utf-8")
+        self._segment_events = 0
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, events):
+        """Дописывает события, присваивая им номера; возвращает seq последнего.
+
+        events может быть генератором: строки пишутся по одной, без списка в памяти.
+        """
+        with self._lock:
+            if self._file is None or self._segment_events >= self.segment_size:
+                self._close_segment()
+                self._open_segment()
+
+            first_seq = self.seq
+            for event in events:
+                self.seq += 1
+                self._file.write(_dumps({"seq": self.seq, **event}) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._segment_events += self.seq - first_seq
+            return self.seq
+
+    def write_snapshot(self, seq, tally_rows, nominations, participants, votes):
+        """Пишет файл снимка на момент события seq, возвращает его путь.
+
+        votes - итерируемое строк SNAPSHOT_VOTES_SQL. Файл появляется целиком
+        (через временный файл и os.replace), так что оборванного снимка не бывает.
+        Журнал при этом не трогается и может дописываться из другого потока;
+        покрытое снимком удаляет compact.
+        """
+        path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{seq:014d}{SEGMENT_SUFFIX}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_dumps({
+                "seq": seq,
+                "ts": round(time.time(), 3),
+                "tally": [list(row) for row in tally_rows],
+                "nominations": [list(row) for row in nominations],
+                "participants": [list(row) for row in participants],
+            }) + "\n")
+            for row in votes:
+                f.write(_dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def compact(self, seq):
+        """Удаляет сегменты и снимки, целиком покрытые снимком seq.
+
+        Вызывается писателем журнала: к этому моменту все события до seq, которые
+        есть в базе, уже дописаны. Если снимок впереди журнала (журнал отстал
+        от базы после сбоя), журнал продолжается с seq.
+        """
+        with self._lock:
+            segments = self.segments()
+            if seq >= self.seq:
+                self._close_segment()
+                self.seq = seq
+                removed = [path for _, path in segments]
+            else:
+                # Сегмент покрыт, если следующий начинается не позже seq + 1;
+                # последний (текущий) содержит события после seq и остается
+                removed = [path for (_, path), (next_first, _) in zip(segments, segments[1:]) if next_first <= seq + 1]
+            for path in removed:
+                os.remove(path)
+            self.snapshot_seq = max(self.snapshot_seq, seq)
+            for snapshot_seq, snapshot in self.snapshots():
+                if snapshot_seq < self.snapshot_seq:
+                    os.remove(snapshot)
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    # --- чтение ---
+
+    def read_snapshot_header(self, path=None):
+        """Заголовок снимка (dict) без голосов; None, если снимка нет"""
+        if path is None:
+            snapshot = self.latest_snapshot()
+            if snapshot is None:
+                return None
+            path = snapshot[1]
+        with open(path, encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    def read_snapshot(self, path=None):
+        """Заголовок снимка (dict) и генератор его голосов; (None, []) без снимка.
+
+        Файл с голосами открывается, только когда генератор начинают читать.
+        """
+        if path is None:
+            snapshot = self.latest_snapshot()
+            if snapshot is None:
+                return None, iter(())
+            path = snapshot[1]
+        header = self.read_snapshot_header(path)
+
+        def votes():
+            with open(path, encoding="utf-8") as f:
+                f.readline()
+                for line in f:
+                    yield json.loads(line)
+        return header, votes()
+
+    def events(self, after=0):
+        """События с seq больше after по всем сегментам"""
+        segments = self.segments()
+        for i, (first_seq, path) in enumerate(segments):
+            # Сегмент целиком до after - следующий начинается не позже after + 1
+            if i + 1 < len(segments) and segments[i + 1][0] <= after + 1:
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    event = json.loads(line)
+                    if event["seq"] > after:
+                        yield event
+
+    def load_tally(self, tally):
+        """Подсчет из заголовка снимка и хвоста журнала, возвращает число проигранных событий"""
+        header = self.read_snapshot_header()
+        tally.load(header["tally"] if header else ())
+        return replay(tally, self.events(header["seq"] if header else 0))
+
+
+# Участник из события add_participant; при повторном проигрывании перезаписывается
+RESTORE_PARTICIPANT_SQL = 'INSERT OR REPLACE INTO participants (id, nomination_id, name) VALUES (?, ?, ?)'
+
+
+def _replace_catalogue(conn, nominations, participants):
+    conn.execute('DELETE FROM participants')
+    conn.execute('DELETE FROM nominations')
+    conn.executemany('INSERT INTO nominations (id, name) VALUES (?, ?)', nominations)
+    conn.executemany('INSERT INTO participants (id, nomination_id, name) VALUES (?, ?, ?)', participants)
+
+
+def _restore_votes(events):
+    for event in events:
+        yield (event["user_id"], event["nomination_id"], event["participant_id"], event["previous"],
+               event["first_name"], event["last_name"], event["username"])
+
+
+def rebuild(log, db_path):
+    """Собирает новую базу db_path по снимку и журналу, возвращает число проигранных событий"""
+    from database import Database
+    from migrations import seed_nominations
+
+    if os.path.exists(db_path):
+        raise FileExistsError(db_path)
+    # Схема через обычные миграции
+    Database(db_path, pool_size=1).close()
+
+    header, votes = log.read_snapshot()
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM votes')
+            seq = 0
+            if header is not None:
+                _replace_catalogue(conn, header["nominations"], header["participants"])
+                conn.executemany(RESTORE_VOTE_SQL, votes)
+                seq = header["seq"]
+
+            replayed = 0
+            # Подряд идущие голоса пишутся одним executemany
+            for kind, events in itertools.groupby(log.events(seq), key=lambda event: event["type"]):
+                events = list(events)
+                if kind == "vote":
+                    conn.executemany(RESTORE_VOTE_SQL, _restore_votes(events))
+                elif kind == "delete_participant":
+                    for event in events:
+                        conn.execute('DELETE FROM votes WHERE participant_id = ?', (event["participant_id"],))
+                        conn.execute('DELETE FROM participants WHERE id = ?', (event["participant_id"],))
+                elif kind == "add_participant":
+                    conn.executemany(RESTORE_PARTICIPANT_SQL, (
+                        (event["participant_id"], event["nomination_id"], event["name"]) for event in events
+                    ))
+                elif kind == "catalogue":
+                    # Каталог целиком писали журналы до событий add_participant
+                    _replace_catalogue(conn, events[-1]["nominations"], events[-1]["participants"])
+                replayed += len(events)
+                seq = events[-1]["seq"]
+
+            # Номинации в журнал не пишутся: добавленные из config после снимка
+            # появляются так же, как при запуске бота
+            seed_nominations(conn)
+            conn.execute(SET_EVENT_SEQ_SQL, (seq,))
+    finally:
+        conn.close()
+    return replayed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал событий голосования")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", help="собрать новую базу по снимку и журналу")
+    rebuild_parser.add_argument("log_dir", help="каталог журнала (EVENT_LOG_DIR)")
+    rebuild_parser.add_argument("db_path", help="куда записать базу; файла не должно быть")
+
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        started = time.perf_counter()
+        replayed = rebuild(EventLog(args.log_dir), args.db_path)
+        print(f"База {args.db_path} собрана, событий после снимка: {replayed}, {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
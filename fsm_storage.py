@@ -0,0 +1,215 @@
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+logger = logging.getLogger(__name__)
+
+# set_state и set_data пишут только свою колонку: одновременные вызовы (из одного
+# процесса или из разных) не затирают друг другу состояние и данные. Вторая колонка
+# устаревшей строки (updated_at < ?) сбрасывается, как будто строки не было.
+# Параметры: key, значение, updated_at, граница устаревания (NULL - без срока)
+SAVE_STATE_SQL = '''
+    INSERT INTO fsm_states (key, state, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state,
+        data = CASE WHEN updated_at < ? THEN '{}' ELSE data END,
+        updated_at = excluded.updated_at
+    RETURNING state, data
+'''
+
+SAVE_DATA_SQL = '''
+    INSERT INTO fsm_states (key, data, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        data = excluded.data,
+        state = CASE WHEN updated_at < ? THEN NULL ELSE state END,
+        updated_at = excluded.updated_at
+    RETURNING state, data
+'''
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в SQLite.
+
+    Состояния и данные переживают перезапуск бота и видны всем процессам,
+    работающим с тем же файлом. Горячие ключи держатся в памяти (LRU на
+    cache_size записей), записи сразу уходят в файл (write-through). Состояния,
+    которые не менялись дольше ttl секунд, считаются устаревшими, а фоновая
+    задача раз в vacuum_interval секунд удаляет их и освобождает место в файле.
+
+    Если с файлом работают несколько процессов, кэш одного не видит записи
+    другого - для такого режима нужен cache_ttl=0: каждое чтение идет в файл.
+    Сам бот запускается одним процессом (см. main.create_fsm_storage).
+    """
+
+    def __init__(self, db_path="fsm.db", ttl=24 * 3600, vacuum_interval=600,
+                 cache_size=10000, cache_ttl=None, clock=time.time):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.vacuum_interval = vacuum_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._clock = clock
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # key -> [state, data, updated_at, cached_at]
+        self._cache = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._conn = None
+        self._vacuum_task = None
+        self.hits = 0
+        self.misses = 0
+
+    # --- работа с файлом, выполняется в потоке хранилища ---
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # auto_vacuum нужно включить до создания таблиц
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)')
+        conn.commit()
+        return conn
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def _load(self, key):
+        row = self._db().execute(
+            'SELECT state, data, updated_at FROM fsm_states WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        state, data, updated_at = row
+        return state, json.loads(data), updated_at
+
+    def _save(self, key, sql, value, updated_at, expired_before):
+        """Пишет одну колонку запросом sql, возвращает (state, data) строки после записи"""
+        conn = self._db()
+        with conn:
+            state, data = conn.execute(sql, (key, value, updated_at, expired_before)).fetchone()
+            if state is None and data == '{}':
+                conn.execute('DELETE FROM fsm_states WHERE key = ?', (key,))
+        return state, json.loads(data)
+
+    def _vacuum(self, expired_before):
+        conn = self._db()
+        with conn:
+            deleted = conn.execute(
+                'DELETE FROM fsm_states WHERE updated_at < ?', (expired_before,)
+            ).rowcount
+        conn.execute('PRAGMA incremental_vacuum')
+        return deleted
+
+    def _count(self):
+        return self._db().execute('SELECT COUNT(*) FROM fsm_states').fetchone()[0]
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # --- асинхронная часть ---
+
+    async def _run(self, func, *args):
+        if self._vacuum_task is None and self.vacuum_interval and self.ttl is not None:
+            self._vacuum_task = asyncio.create_task(self._vacuum_loop())
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _is_expired(self, updated_at):
+        return self.ttl is not None and updated_at < self._clock() - self.ttl
+
+    def _remember(self, key, state, data, updated_at):
+        self._cache[key] = [state, data, updated_at, self._clock()]
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _get_entry(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and (self.cache_ttl is None or entry[3] > self._clock() - self.cache_ttl):
+            self.hits += 1
+            self._cache.move_to_end(key)
+        else:
+            self.misses += 1
+            loaded = await self._run(self._load, key)
+            state, data, updated_at = loaded if loaded is not None else (None, {}, self._clock())
+            self._remember(key, state, data, updated_at)
+            entry = self._cache[key]
+
+        if self._is_expired(entry[2]):
+            return None, {}
+        return entry[0], entry[1]
+
+    async def _put(self, key, sql, value):
+        updated_at = self._clock()
+        expired_before = updated_at - self.ttl if self.ttl is not None else None
+        state, data = await self._run(self._save, key, sql, value, updated_at, expired_before)
+        self._remember(key, state, data, updated_at)
+
+    async def set_state(self, key, state=None):
+        await self._put(self._key_builder.build(key), SAVE_STATE_SQL, state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key):
+        state, _ = await self._get_entry(self._key_builder.build(key))
+        return state
+
+    async def set_data(self, key, data):
+        await self._put(self._key_builder.build(key), SAVE_DATA_SQL, json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key):
+        _, data = await self._get_entry(self._key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def _vacuum_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.vacuum_interval)
+            try:
+                await loop.run_in_executor(self._executor, self._vacuum, self._clock() - self.ttl)
+            except Exception:
+                # Например, файл занят дольше busy_timeout: попробуем в следующий раз
+                logger.exception("Очистка устаревших состояний FSM не удалась")
+                continue
+            for key in [key for key, entry in self._cache.items() if self._is_expired(entry[2])]:
+                del self._cache[key]
+
+    async def vacuum(self):
+        """Удаляет устаревшие состояния сейчас, возвращает число удаленных записей"""
+        if self.ttl is None:
+            return 0
+        return await self._run(self._vacuum, self._clock() - self.ttl)
+
+    async def size(self):
+        """Число сохраненных состояний в файле"""
+        return await self._run(self._count)
+
+    async def close(self):
+        task, self._vacuum_task = self._vacuum_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_connection)
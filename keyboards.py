@@ -1,6 +1,13 @@
+from functools import lru_cache
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from database import Database
+from callbacks import VoteNominationCallback, VoteParticipantCallback
+from cache import cached
 
+async def cached_keyboard(db, key, version, build):
+    """Возвращает клавиатуру из кэша каталога db или собирает ее заново, если версия каталога изменилась"""
+    return await cached(db.catalogue.keyboards, key, version, build)
+
+@lru_cache(maxsize=None)
 def get_main_menu():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -11,6 +18,7 @@ def get_main_menu():
         resize_keyboard=True
     )
 
+@lru_cache(maxsize=None)
 def get_admin_main_menu():
     """Главное меню для администраторов"""
     return ReplyKeyboardMarkup(
@@ -22,30 +30,37 @@ def get_admin_main_menu():
         resize_keyboard=True
     )
 
-def get_nominations_keyboard():
+async def get_nominations_keyboard(db):
     """Клавиатура номинаций для обычного голосования"""
-    db = Database()
-    nominations = db.get_nominations()
-    keyboard = []
-    
-    for nom_id, name in nominations:
-        keyboard.append([InlineKeyboardButton(text=name, callback_data=f"vote_nom_{nom_id}")])
+    async def build():
+        nominations = await db.get_nominations()
+        keyboard = []
+        
+        for nom_id, name in nominations:
+            keyboard.append([InlineKeyboardButton(text=name, callback_data=VoteNominationCallback(nomination_id=nom_id).pack())])
+        
+        keyboard.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="back_to_main")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
-    keyboard.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="back_to_main")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    return await cached_keyboard(db, "vote_nominations", db.catalogue.full_version, build)
 
-def get_participants_keyboard(nomination_id):
-    """Клавиатура участников для обычного голосования"""
-    db = Database()
-    participants = db.get_participants(nomination_id)
-    keyboard = []
-    
-    for part_id, name in participants:
-        keyboard.append([InlineKeyboardButton(text=name, callback_data=f"vote_part_{part_id}")])
+async def get_participants_keyboard(db, nomination_id):
+    """Клавиатура участников для обычного голосования, собирается при первом обращении к номинации"""
+    async def build():
+        participants = await db.get_participants(nomination_id)
+        keyboard = []
+        
+        for part_id, name in participants:
+            callback_data = VoteParticipantCallback(nomination_id=nomination_id, participant_id=part_id)
+            keyboard.append([InlineKeyboardButton(text=name, callback_data=callback_data.pack())])
+        
+        keyboard.append([InlineKeyboardButton(text="🔙 Назад к номинациям", callback_data="back_to_nominations")])
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
-    keyboard.append([InlineKeyboardButton(text="🔙 Назад к номинациям", callback_data="back_to_nominations")])
-    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+    version = db.catalogue.nomination_version(nomination_id)
+    return await cached_keyboard(db, ("vote_participants", nomination_id), version, build)
 
+@lru_cache(maxsize=None)
 def get_admin_keyboard():
     return ReplyKeyboardMarkup(
         keyboard=[
@@ -56,6 +71,7 @@ def get_admin_keyboard():
         resize_keyboard=True
     )
 
+@lru_cache(maxsize=None)
 def back_to_main_inline_keyboard():
     """Inline клавиатура для возврата в главное меню (используется в edit_text)"""
     return InlineKeyboardMarkup(
@@ -0,0 +1,372 @@
+"""Нагрузочный прогон бота без Telegram.
+
+Собирает настоящий диспетчер из main.py на копии базы, подменяет сессию бота
+заглушкой и прогоняет через dp.feed_update синтетические апдейты N пользователей:
+проверка подписки, выбор номинации, голос, смена голоса, а параллельно -
+админские "🏆 Результаты" и "👥 Кто голосовал". В конце сверяет базу с тем, что
+должно было получиться, и пишет пропускную способность и перцентили задержек
+в JSON, чтобы прогоны можно было сравнивать.
+
+    python loadtest.py --users 2000 --concurrency 200 --output loadtest.json
+
+Заглушку Bot API (FakeSession) и синтетические голоса (load_catalogue,
+inflate_votes, random_vote) берут отсюда же тесты и бенчмарки в bench/.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, GetChatMember, SendMessage
+from aiogram.types import CallbackQuery, Chat, ChatMemberMember, Message, Update, User
+
+from callbacks import VoteNominationCallback, VoteParticipantCallback
+from eventlog import RESTORE_VOTE_SQL
+
+# Пользователи нагрузки не пересекаются с настоящими id Telegram
+USER_ID_BASE = 10 ** 12
+# Синтетические голоса random_vote и inflate_votes не пересекаются ни с настоящими, ни с прогоном
+SYNTHETIC_USER_ID_BASE = 3 * 10 ** 12
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 3) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+        "max_ms": round(values[-1] * 1000, 3) if values else None,
+    }
+
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: отвечает на запросы как Telegram.
+
+    Пользователь подписан на канал, отправленное и отредактированное сообщение
+    возвращается как Message, на остальные методы ответ - True. Запросы
+    запоминаются в requests, если не передан keep_requests=False (для долгих
+    прогонов); api_latency - задержка каждого ответа в секундах.
+    """
+
+    def __init__(self, api_latency=0.0, keep_requests=True):
+        super().__init__()
+        self.api_latency = api_latency
+        self.keep_requests = keep_requests
+        self.requests = []
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.keep_requests:
+            self.requests.append(method)
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="user"))
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=self.calls,
+                date=datetime.datetime.now(),
+                chat=Chat(id=method.chat_id or 1, type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def load_catalogue(db_path):
+    """[(nomination_id, [participant_id, ...])] - номинации, где есть участники"""
+    # Импорт здесь: database читает config, а loadtest.py запускается и без него (--help)
+    from database import Database
+
+    db = Database(db_path, pool_size=1)
+    try:
+        catalogue = [(nomination_id, [pid for pid, _ in db.get_participants(nomination_id)])
+                     for nomination_id, _ in db.get_nominations()]
+    finally:
+        db.close()
+    catalogue = [(nomination_id, participants) for nomination_id, participants in catalogue if participants]
+    if not catalogue:
+        raise SystemExit(f"В {db_path} нет участников, голосовать не за кого")
+    return catalogue
+
+
+def inflate_votes(path, catalogue, votes, seed=1):
+    """Дописывает в базу votes синтетических голосов одной транзакцией, мимо журнала событий.
+
+    Пользователи - от SYNTHETIC_USER_ID_BASE + 10 ** 9, с random_vote не пересекаются.
+    """
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.executemany(RESTORE_VOTE_SQL, (
+                (SYNTHETIC_USER_ID_BASE + 10 ** 9 + i, nomination_id, rnd.choice(participants), None,
+                 f"Bench {i}", "Нагрузка", f"bench{i}")
+                for i in range(votes)
+                for nomination_id, participants in [rnd.choice(catalogue)]
+            ))
+    finally:
+        conn.close()
+
+
+def random_vote(rnd, catalogue, users):
+    """(user_id, nomination_id, participant_id) случайного голоса одного из users пользователей"""
+    nomination_id, participants = rnd.choice(catalogue)
+    return SYNTHETIC_USER_ID_BASE + rnd.randrange(users), nomination_id, rnd.choice(participants)
+
+
+def prepare_database(source, workdir):
+    """Путь к копии базы для прогона (без исходной базы - пустая база)"""
+    path = os.path.join(workdir, "loadtest.db")
+    if source and os.path.exists(source):
+        # backup дает целостную копию, даже если исходную базу сейчас пишет бот
+        with sqlite3.connect(source) as src, sqlite3.connect(path) as dst:
+            src.backup(dst)
+    return path
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.update_ids = itertools.count(1)
+        self.latencies = {}
+        self.errors = 0
+        # (user_id, nomination_id) -> participant_id последнего голоса
+        self.expected = {}
+
+    def _session(self):
+        return FakeSession(api_latency=self.args.api_latency_ms / 1000, keep_requests=False)
+
+    def _user(self, user_id):
+        return User(id=user_id, is_bot=False, first_name=f"Load {user_id}", username=f"load{user_id}")
+
+    def _message(self, user_id, text):
+        return Update(
+            update_id=next(self.update_ids),
+            message=Message(
+                message_id=next(self.update_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=user_id, type="private"),
+                from_user=self._user(user_id),
+                text=text,
+            ),
+        )
+
+    def _callback(self, user_id, data):
+        message = Message(
+            message_id=next(self.update_ids),
+            date=datetime.datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=1, is_bot=True, first_name="bot"),
+            text="Выберите номинацию:",
+        )
+        return Update(
+            update_id=next(self.update_ids),
+            callback_query=CallbackQuery(
+                id=str(next(self.update_ids)),
+                from_user=self._user(user_id),
+                chat_instance="loadtest",
+                message=message,
+                data=data,
+            ),
+        )
+
+    async def _feed(self, kind, update):
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors += 1
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started)
+
+    async def _think(self):
+        if self.args.think_time_ms:
+            await asyncio.sleep(self.random.uniform(0.5, 1.5) * self.args.think_time_ms / 1000)
+
+    async def _voter(self, user_id, catalogue):
+        await self._feed("start_voting", self._message(user_id, "🗳️ Голосовать"))
+        nominations = self.random.sample(catalogue, min(self.args.votes_per_user, len(catalogue)))
+        for nomination_id, participants in nominations:
+            await self._think()
+            await self._feed("select_nomination", self._callback(
+                user_id, VoteNominationCallback(nomination_id=nomination_id).pack()))
+
+            participant_id = self.random.choice(participants)
+            await self._think()
+            await self._feed("vote", self._callback(
+                user_id, VoteParticipantCallback(nomination_id=nomination_id, participant_id=participant_id).pack()))
+
+            if self.random.random() < self.args.change_ratio:
+                participant_id = self.random.choice([p for p in participants if p != participant_id])
+                await self._think()
+                await self._feed("change_vote", self._callback(
+                    user_id, VoteParticipantCallback(nomination_id=nomination_id, participant_id=participant_id).pack()))
+            self.expected[(user_id, nomination_id)] = participant_id
+
+    async def _admin(self, admin_id, stop):
+        while not stop.is_set():
+            await self._feed("show_results", self._message(admin_id, "🏆 Результаты"))
+            await self._feed("show_voters", self._message(admin_id, "👥 Кто голосовал"))
+            await asyncio.sleep(self.args.admin_interval_ms / 1000)
+
+    async def _catalogue(self, db):
+        """Номинации, где есть из кого выбирать; недостающих участников добавляет в копию базы"""
+        catalogue = []
+        for nomination_id, _ in await db.get_nominations():
+            participants = [pid for pid, _ in await db.get_participants(nomination_id)]
+            for i in range(len(participants), 2):
+                participants.append(await db.add_participant(nomination_id, f"Loadtest {i + 1}"))
+            catalogue.append((nomination_id, participants))
+        return catalogue
+
+    def _check_consistency(self, db_path):
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(
+                'SELECT user_id, nomination_id, participant_id FROM votes WHERE user_id >= ?',
+                (USER_ID_BASE,)
+            ).fetchall()
+        found = {(user_id, nomination_id): participant_id for user_id, nomination_id, participant_id in rows}
+        wrong = sum(1 for key, participant_id in self.expected.items() if found.get(key) != participant_id)
+        return {
+            "votes_expected": len(self.expected),
+            "votes_found": len(found),
+            "wrong_votes": wrong,
+        }
+
+    async def run(self):
+        import main
+        from config import ADMINS
+
+        self.dp = main.dp
+        db = main.setup_services()
+        self.bot = Bot("42:LOADTEST", session=self._session())
+        if self.args.outbound:
+            main.setup_outbound(self.bot)
+        metrics = main.setup_metrics(db) if self.args.metrics else None
+
+        catalogue = await self._catalogue(db)
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def voter(user_id):
+            async with semaphore:
+                await self._voter(user_id, catalogue)
+
+        stop = asyncio.Event()
+        admins = [asyncio.create_task(self._admin(admin_id, stop)) for admin_id in ADMINS[:self.args.admins]]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(voter(USER_ID_BASE + i) for i in range(self.args.users)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*admins)
+
+        mismatches = await db.check_tally()
+        await db.close()
+        await self.dp.storage.close()
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        report = {
+            "config": vars(self.args),
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "duration_s": round(elapsed, 3),
+            "updates": len(all_latencies),
+            "errors": self.errors,
+            "throughput_updates_per_s": round(len(all_latencies) / elapsed, 1),
+            "votes_per_s": round(
+                (len(self.latencies.get("vote", [])) + len(self.latencies.get("change_vote", []))) / elapsed, 1
+            ),
+            "latency": {"all": summarize(all_latencies), **{
+                kind: summarize(values) for kind, values in sorted(self.latencies.items())
+            }},
+            "consistency": {
+                **self._check_consistency(os.environ["DB_PATH"]),
+                "tally_mismatches": len(mismatches),
+            },
+        }
+        if self.dp.get("rate_limiter") is not None:
+            report["rate_limiter"] = self.dp["rate_limiter"].stats()
+        if metrics is not None:
+            report["metrics"] = await metrics.render()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон диспетчера бота на синтетических апдейтах")
+    parser.add_argument("--users", type=int, default=1000, help="число голосующих пользователей")
+    parser.add_argument("--concurrency", type=int, default=100, help="сколько пользователей голосуют одновременно")
+    parser.add_argument("--votes-per-user", type=int, default=3, help="в скольких номинациях голосует пользователь")
+    parser.add_argument("--change-ratio", type=float, default=0.3, help="доля голосов, которые потом меняются")
+    parser.add_argument("--admins", type=int, default=1, help="сколько админов из config.ADMINS смотрят отчеты")
+    parser.add_argument("--admin-interval-ms", type=float, default=200, help="пауза между отчетами админа")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="средняя пауза пользователя между нажатиями")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="задержка ответа заглушки Bot API")
+    parser.add_argument("--db", default="voting.db", help="исходная база; прогон идет на ее копии")
+    parser.add_argument("--write-behind", action="store_true", help="групповой коммит голосов (VOTE_WRITE_BEHIND=1)")
+    parser.add_argument("--sqlite-fsm", action="store_true", help="FSM в SQLite вместо памяти")
+    parser.add_argument("--throttle", action="store_true", help="включить ограничение частоты запросов пользователей; "
+                        "без --think-time-ms лишние голоса отбрасываются и видны в сверке")
+    parser.add_argument("--outbound", action="store_true", help="пропускать ответы через очередь отправки с лимитами")
+    parser.add_argument("--metrics", action="store_true", help="собирать метрики и добавить их в отчет")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest.json", help="куда записать отчет")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    try:
+        # main.py читает настройки из окружения при импорте и в setup_services
+        os.environ["DB_PATH"] = prepare_database(args.db, workdir)
+        os.environ["FSM_STORAGE"] = "sqlite" if args.sqlite_fsm else "memory"
+        os.environ["FSM_DB_PATH"] = os.path.join(workdir, "fsm.db")
+        os.environ["VOTE_WRITE_BEHIND"] = "1" if args.write_behind else "0"
+        os.environ["THROTTLE"] = "1" if args.throttle else "0"
+        # Журнал событий, шарды и копии из окружения бота относятся к боевой базе:
+        # прогон не пишет в журнал и не удаляет старые копии по BACKUP_KEEP
+        os.environ.pop("EVENT_LOG_DIR", None)
+        os.environ.pop("VOTE_SHARDS", None)
+        os.environ["BACKUP_DIR"] = os.path.join(workdir, "backups")
+        os.environ["BACKUP_INTERVAL_MINUTES"] = "0"
+
+        report = asyncio.run(LoadTest(args).run())
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    latency = report["latency"]["all"]
+    print(
+        f"{report['updates']} апдейтов за {report['duration_s']} с: "
+        f"{report['throughput_updates_per_s']} апдейтов/с, {report['votes_per_s']} голосов/с, "
+        f"p50 {latency['p50_ms']} мс, p95 {latency['p95_ms']} мс, p99 {latency['p99_ms']} мс"
+    )
+    print(f"Согласованность: {report['consistency']}")
+    print(f"Отчет: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,57 @@
+import argparse
 import asyncio
+import os
+from aiohttp import web
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 from config_token import BOT_TOKEN
-from database import Database
+from database import AsyncDatabase, VoteStatus
+from eventlog import EventLog
+from backup import BackupManager
+from callbacks import VoteNominationCallback, VoteParticipantCallback
 from keyboards import (
     get_main_menu, get_admin_main_menu, get_nominations_keyboard, 
     get_participants_keyboard, back_to_main_inline_keyboard
 )
 from admin_panel import router as admin_router
+from subscription import SubscriptionChecker
+from fsm_storage import SQLiteStorage
+from throttling import DEFAULT_LIMITS, RateLimiter, ThrottlingMiddleware
+from outbound import OutboundQueue, PriorityMiddleware
+from metrics import HandlerMetricsMiddleware, Metrics, stats_collector
+from results import LiveResults, get_results_text
 from config import CHANNEL_USERNAME, ADMINS
 
+def create_fsm_storage():
+    """FSM-хранилище: SQLite-файл по умолчанию, FSM_STORAGE=memory - в памяти процесса.
+    
+    Бот работает одним процессом: подсчет голосов, кэши и процессы шардов у каждого
+    процесса были бы свои и не видели бы голосов и участников из других. Поэтому
+    BOT_WORKERS > 1 - ошибка конфигурации (второй процесс на той же базе не
+    запустится и без него, см. AsyncDatabase).
+    """
+    if int(os.getenv("BOT_WORKERS", "1")) > 1:
+        raise ValueError("BOT_WORKERS > 1 не поддерживается: голоса и кэши бота живут в памяти одного процесса")
+    if os.getenv("FSM_STORAGE") == "memory":
+        return MemoryStorage()
+    
+    cache_ttl = os.getenv("FSM_CACHE_TTL")
+    return SQLiteStorage(
+        os.getenv("FSM_DB_PATH", "fsm.db"),
+        ttl=int(os.getenv("FSM_STATE_TTL", str(24 * 3600))),
+        cache_ttl=float(cache_ttl) if cache_ttl else None,
+    )
+
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
 
 dp.include_router(admin_router)
 
-class VotingStates(StatesGroup):
-    waiting_for_participant = State()
-
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором"""
     return user_id in ADMINS
@@ -58,11 +88,10 @@ async def main_menu(message: Message):
         )
 
 @dp.message(F.text == "🗳️ Голосовать")
-async def start_voting(message: Message):
-    # Проверка подписки на канал
+async def start_voting(message: Message, bot: Bot, db: AsyncDatabase, subscriptions: SubscriptionChecker):
+    # Проверка подписки на канал (результат кэшируется)
     try:
-        chat_member = await bot.get_chat_member(CHANNEL_USERNAME, message.from_user.id)
-        if chat_member.status in ['left', 'kicked']:
+        if not await subscriptions.is_subscribed(bot, message.from_user.id):
             await message.answer(
                 f"⛔ Для голосования необходимо быть подписанным на канал {CHANNEL_USERNAME}",
                 reply_markup=get_main_menu() if not is_admin(message.from_user.id) else get_admin_main_menu()
@@ -77,15 +106,14 @@ async def start_voting(message: Message):
     
     await message.answer(
         "Выберите номинацию:",
-        reply_markup=get_nominations_keyboard()
+        reply_markup=await get_nominations_keyboard(db)
     )
 
 @dp.callback_query(F.data == "back_to_nominations")
-async def back_to_nominations(callback: CallbackQuery, state: FSMContext):
-    await state.clear()
+async def back_to_nominations(callback: CallbackQuery, db: AsyncDatabase):
     await callback.message.edit_text(
         "Выберите номинацию:",
-        reply_markup=get_nominations_keyboard()
+        reply_markup=await get_nominations_keyboard(db)
     )
 
 @dp.callback_query(F.data == "back_to_main")
@@ -105,43 +133,37 @@ async def back_to_main_handler(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_main_menu()
         )
 
-@dp.callback_query(F.data.startswith("vote_nom_"))
-async def select_nomination(callback: CallbackQuery, state: FSMContext):
-    nomination_id = int(callback.data.split("_")[2])
+@dp.callback_query(VoteNominationCallback.filter())
+async def select_nomination(callback: CallbackQuery, callback_data: VoteNominationCallback, db: AsyncDatabase):
+    nomination_id = callback_data.nomination_id
     
-    db = Database()
-    participants = db.get_participants(nomination_id)
+    participants = await db.get_participants(nomination_id)
     
     if not participants:
         await callback.answer("❌ В этой номинации пока нет участников", show_alert=True)
         return
     
-    await state.update_data(nomination_id=nomination_id)
-    nominations = db.get_nominations()
-    nomination_name = next((name for id, name in nominations if id == nomination_id), "")
+    nomination_name = await db.get_nomination_name(nomination_id)
     
     await callback.message.edit_text(
         f"Номинация: <b>{nomination_name}</b>\n\nВыберите участника:",
-        reply_markup=get_participants_keyboard(nomination_id)
+        reply_markup=await get_participants_keyboard(db, nomination_id)
     )
-    await state.set_state(VotingStates.waiting_for_participant)
 
-@dp.callback_query(F.data.startswith("vote_part_"), VotingStates.waiting_for_participant)
-async def vote_for_participant(callback: CallbackQuery, state: FSMContext):
-    participant_id = int(callback.data.split("_")[2])
-    data = await state.get_data()
-    nomination_id = data['nomination_id']
-    
-    db = Database()
+@dp.callback_query(VoteParticipantCallback.filter())
+async def vote_for_participant(callback: CallbackQuery, callback_data: VoteParticipantCallback, db: AsyncDatabase):
+    # Номинация и участник приходят в callback_data, состояние FSM не читается
+    nomination_id = callback_data.nomination_id
+    participant_id = callback_data.participant_id
     
-    # Получаем информацию о номинации и участнике для красивого сообщения
-    nominations = db.get_nominations()
-    nomination_name = next((name for id, name in nominations if id == nomination_id), "")
-    
-    participants = db.get_participants(nomination_id)
-    participant_name = next((name for id, name in participants if id == participant_id), "")
+    # Проверка участника и имена для сообщения - один поиск в каталоге в памяти
+    info = await db.get_participant_info(participant_id)
+    if info is None or info[2] != nomination_id:
+        await callback.answer("❌ Участник не найден в этой номинации", show_alert=True)
+        return
+    participant_name, nomination_name, _ = info
     
-    success = db.add_vote(
+    result = await db.add_vote(
         user_id=callback.from_user.id,
         nomination_id=nomination_id,
         participant_id=participant_id,
@@ -150,9 +172,16 @@ async def vote_for_participant(callback: CallbackQuery, state: FSMContext):
         username=callback.from_user.username
     )
     
-    if success:
+    if result.ok:
+        if result.status is VoteStatus.CHANGED:
+            header = "🔄 Ваш голос изменен!"
+        elif result.status is VoteStatus.UNCHANGED:
+            header = "✅ Вы уже голосовали за этого участника"
+        else:
+            header = "✅ Ваш голос успешно учтен!"
+        
         await callback.message.edit_text(
-            f"✅ Ваш голос успешно учтен!\n\n"
+            f"{header}\n\n"
             f"<b>Номинация:</b> {nomination_name}\n"
             f"<b>Участник:</b> {participant_name}",
             reply_markup=back_to_main_inline_keyboard()
@@ -162,13 +191,10 @@ async def vote_for_participant(callback: CallbackQuery, state: FSMContext):
             f"❌ Произошла ошибка при сохранении голоса. Попробуйте еще раз.",
             reply_markup=back_to_main_inline_keyboard()
         )
-    
-    await state.clear()
 
 @dp.message(F.text == "📊 Мои голоса")
-async def show_my_votes(message: Message):
-    db = Database()
-    votes = db.get_user_votes(message.from_user.id)
+async def show_my_votes(message: Message, db: AsyncDatabase):
+    votes = await db.get_user_votes(message.from_user.id)
     
     if not votes:
         await message.answer(
@@ -187,7 +213,7 @@ async def show_my_votes(message: Message):
     )
 
 @dp.message(F.text == "🏆 Результаты")
-async def show_results(message: Message):
+async def show_results(message: Message, db: AsyncDatabase):
     # Проверяем, является ли пользователь администратором
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -197,37 +223,244 @@ async def show_results(message: Message):
         )
         return
     
-    db = Database()
-    results = db.get_vote_results()
+    # Текст пересобирается, только когда изменились голоса или каталог
+    text = await get_results_text(db)
     
-    if not results or all(votes == 0 for _, _, votes in results):
+    if text is None:
         await message.answer(
             "📊 Голосов пока нет",
             reply_markup=get_admin_main_menu()
         )
         return
     
-    current_nomination = ""
-    text = "🏆 <b>Текущие результаты:</b>\n\n"
+    await message.answer(text, reply_markup=get_admin_main_menu())
+
+@dp.chat_member()
+async def channel_member_updated(event: ChatMemberUpdated, subscriptions: SubscriptionChecker):
+    # Приходит, только если бот - администратор канала и chat_member есть в allowed_updates
+    subscriptions.update_from_chat_member(event)
+
+def create_rate_limiter():
+    # THROTTLE_VOTE / THROTTLE_RESULTS / THROTTLE_ADMIN="<в секунду>,<запас>", например "2,5"
+    limits = {}
+    for group, (rate, burst) in DEFAULT_LIMITS.items():
+        value = os.getenv(f"THROTTLE_{group.upper()}")
+        if value:
+            rate, burst = value.split(",")
+        limits[group] = (float(rate), int(burst))
+    return RateLimiter(limits, maxsize=int(os.getenv("THROTTLE_MAX_USERS", "100000")))
+
+def setup_services():
+    """Создает общие для всех хендлеров объекты и кладет их в workflow_data диспетчера"""
+    # Один экземпляр базы на весь процесс: схема создается один раз при запуске.
+    # VOTE_WRITE_BEHIND=1 включает групповой коммит голосов (на время пиковой нагрузки),
+    # MIGRATIONS_ONLINE=1 строит новые индексы короткими транзакциями,
+    # VOTE_SHARDS=N пишет голоса в N процессов (число шардов потом не меняется),
+    # EVENT_LOG_DIR включает журнал событий голосования со снимками
+    event_log = None
+    if os.getenv("EVENT_LOG_DIR"):
+        event_log = EventLog(os.getenv("EVENT_LOG_DIR"), fsync=os.getenv("EVENT_LOG_FSYNC") == "1")
+    db = AsyncDatabase(
+        os.getenv("DB_PATH", "voting.db"),
+        write_behind=os.getenv("VOTE_WRITE_BEHIND") == "1",
+        batch_size=int(os.getenv("VOTE_BATCH_SIZE", "200")),
+        flush_interval_ms=int(os.getenv("VOTE_FLUSH_MS", "20")),
+        online_migrations=os.getenv("MIGRATIONS_ONLINE") == "1",
+        shards=int(os.getenv("VOTE_SHARDS", "0")),
+        event_log=event_log,
+        snapshot_every=int(os.getenv("EVENT_LOG_SNAPSHOT_EVERY", "100000")),
+        user_votes_cache=int(os.getenv("USER_VOTES_CACHE_SIZE", "10000")),
+    )
+    dp["db"] = db
+    
+    # Резервные копии основной базы и шардов: раз в BACKUP_INTERVAL_MINUTES (0 - только /backup),
+    # хранятся последние BACKUP_KEEP
+    paths = [db.sync.db_path] + (db.shards.paths if db.shards is not None else [])
+    dp["backups"] = BackupManager(
+        paths,
+        directory=os.getenv("BACKUP_DIR", "backups"),
+        interval=float(os.getenv("BACKUP_INTERVAL_MINUTES", "360")) * 60,
+        keep=int(os.getenv("BACKUP_KEEP", "10")),
+        pages=int(os.getenv("BACKUP_PAGES", "256")),
+        pause=float(os.getenv("BACKUP_PAUSE_MS", "5")) / 1000,
+    )
+    
+    # Закрепленные результаты /live обновляются не чаще раза в LIVE_RESULTS_INTERVAL секунд
+    dp["live_results"] = LiveResults(db, interval=float(os.getenv("LIVE_RESULTS_INTERVAL", "5")))
+    
+    dp["subscriptions"] = SubscriptionChecker(
+        CHANNEL_USERNAME,
+        positive_ttl=int(os.getenv("SUBSCRIPTION_POSITIVE_TTL", "300")),
+        negative_ttl=int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30")),
+        maxsize=int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000")),
+    )
+    
+    # Ограничение частоты запросов пользователя до фильтров и хендлеров; THROTTLE=0 выключает
+    if os.getenv("THROTTLE", "1") != "0":
+        throttling = ThrottlingMiddleware(create_rate_limiter())
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+        dp["rate_limiter"] = throttling.limiter
+    return db
+
+def setup_outbound(bot: Bot):
+    """Пропускает отправку сообщений бота через общую очередь с лимитами Bot API"""
+    # OUTBOUND_QUEUE=0 выключает очередь; лимиты - сообщений в секунду на бота и на чат
+    if os.getenv("OUTBOUND_QUEUE", "1") == "0":
+        return None
+    
+    outbound = OutboundQueue(
+        global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+        chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+        chat_burst=int(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+    )
+    bot.session.middleware(outbound)
     
-    for nom_name, part_name, votes in results:
-        if nom_name != current_nomination:
-            if current_nomination != "":
-                text += "\n"
-            text += f"<b>{nom_name}:</b>\n"
-            current_nomination = nom_name
+    # Ответы на голосование обгоняют в очереди отчеты для админов
+    priority = PriorityMiddleware()
+    dp.message.outer_middleware(priority)
+    dp.callback_query.outer_middleware(priority)
+    dp["outbound"] = outbound
+    return outbound
+
+def setup_metrics(db: AsyncDatabase):
+    """Метрики хендлеров, базы, кэшей и очередей; отдаются по /metrics"""
+    metrics = Metrics()
+    
+    handler_metrics = HandlerMetricsMiddleware(metrics)
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    dp.chat_member.middleware(handler_metrics)
+    db.on_query = metrics.observe_query
+    
+    metrics.add_collector(lambda: [("bot_votes_counted", {}, db.sync.get_total_votes_count())])
+    metrics.add_collector(stats_collector("bot_catalogue_cache", db.catalogue.stats))
+    metrics.add_collector(stats_collector("bot_user_votes_cache", db.sync.user_votes.stats))
+    metrics.add_collector(stats_collector("bot_subscription_cache", dp["subscriptions"].stats))
+    metrics.add_collector(stats_collector("bot_backups", dp["backups"].stats))
+    if dp.get("rate_limiter") is not None:
+        metrics.add_collector(stats_collector("bot_rate_limiter", dp["rate_limiter"].stats, label="group"))
+    if dp.get("outbound") is not None:
+        metrics.add_collector(stats_collector("bot_outbound", dp["outbound"].stats, label="priority"))
+    
+    if isinstance(dp.storage, SQLiteStorage):
+        storage = dp.storage
         
-        if part_name:
-            text += f"  {part_name}: {votes} голосов\n"
+        async def collect_fsm():
+            return [
+                ("bot_fsm_states", {}, await storage.size()),
+                ("bot_fsm_cache_hits", {}, storage.hits),
+                ("bot_fsm_cache_misses", {}, storage.misses),
+            ]
+        
+        metrics.add_collector(collect_fsm)
     
-    total_votes = db.get_total_votes_count()
-    text += f"\n<b>Всего голосов:</b> {total_votes}"
+    dp["metrics"] = metrics
+    return metrics
+
+async def start_metrics_server(metrics: Metrics):
+    # Только для локального сборщика метрик: по умолчанию слушаем 127.0.0.1
+    app = web.Application()
+    app.router.add_get("/metrics", metrics.handle)
     
-    await message.answer(text, reply_markup=get_admin_main_menu())
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=os.getenv("METRICS_HOST", "127.0.0.1"),
+        port=int(os.getenv("METRICS_PORT", "9100")),
+    )
+    await site.start()
+    return runner
+
+def get_allowed_updates():
+    # SUBSCRIPTION_UPDATES=1 - обновлять статус подписки из апдейтов chat_member канала
+    subscription_updates = os.getenv("SUBSCRIPTION_UPDATES") == "1"
+    return dp.resolve_used_update_types(
+        skip_events=None if subscription_updates else {"chat_member"}
+    )
+
+@dp.startup()
+async def on_webhook_startup(bot: Bot, webhook_url: str = None, webhook_secret: str = None):
+    # webhook_url передает только create_webhook_app; при polling хук ничего не делает
+    if webhook_url:
+        await bot.set_webhook(
+            webhook_url,
+            secret_token=webhook_secret,
+            allowed_updates=get_allowed_updates(),
+        )
+
+@dp.shutdown()
+async def on_webhook_shutdown(bot: Bot, webhook_url: str = None):
+    if webhook_url:
+        await bot.delete_webhook()
 
-async def main():
+def create_webhook_app(bot: Bot, path="/webhook", secret_token=None, webhook_url=None):
+    """aiohttp-приложение, принимающее апдейты от Telegram на path.
+    
+    Если webhook_url не задан, вебхук в Telegram не регистрируется - так
+    приложение можно поднять локально и слать ему записанные апдейты POST-запросами
+    (с заголовком X-Telegram-Bot-Api-Secret-Token, если задан secret_token).
+    """
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token).register(app, path=path)
+    setup_application(app, dp, bot=bot, webhook_url=webhook_url, webhook_secret=secret_token)
+    return app
+
+async def run_webhook():
+    path = os.getenv("WEBHOOK_PATH", "/webhook")
+    base_url = os.getenv("WEBHOOK_BASE_URL")
+    app = create_webhook_app(
+        bot,
+        path=path,
+        secret_token=os.getenv("WEBHOOK_SECRET"),
+        webhook_url=f"{base_url.rstrip('/')}{path}" if base_url else None,
+    )
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("WEBHOOK_PORT", "8080")),
+    )
+    await site.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # cleanup вызывает shutdown-хуки диспетчера и удаляет вебхук
+        await runner.cleanup()
+
+async def main(webhook=False):
+    db = setup_services()
+    setup_outbound(bot)
+    
+    # METRICS=0 выключает сбор метрик и /metrics
+    metrics_runner = None
+    if os.getenv("METRICS", "1") != "0":
+        metrics_runner = await start_metrics_server(setup_metrics(db))
+    
+    dp["backups"].start()
+    
     print("Бот запущен!")
-    await dp.start_polling(bot)
+    try:
+        if webhook:
+            await run_webhook()
+        else:
+            await dp.start_polling(bot, allowed_updates=get_allowed_updates())
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await dp["live_results"].close()
+        await dp["backups"].close()
+        await db.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Track Awards voting bot")
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="принимать апдейты через webhook вместо long polling (или BOT_MODE=webhook)",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(webhook=args.webhook or os.getenv("BOT_MODE") == "webhook"))
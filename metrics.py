@@ -0,0 +1,168 @@
+import bisect
+import inspect
+import threading
+import time
+from collections import Counter
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+from database import VoteResult
+
+# Границы корзин гистограмм задержки, в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как histogram в Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше самой большой границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            yield f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def stats_collector(prefix, stats, label="key"):
+    """Коллектор из функции stats() -> dict: числа становятся метриками prefix_<ключ>,
+    вложенные словари - метриками с меткой label. Если есть hits и misses,
+    добавляется доля попаданий prefix_hit_ratio.
+    """
+    def collect():
+        values = stats()
+        for key, value in values.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    yield f"{prefix}_{key}", {label: sub_key}, sub_value
+            elif isinstance(value, (int, float)):
+                yield f"{prefix}_{key}", {}, value
+
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        if "hits" in values and lookups:
+            yield f"{prefix}_hit_ratio", {}, values["hits"] / lookups
+    return collect
+
+
+class Metrics:
+    """Счетчики и гистограммы бота в формате Prometheus (text exposition).
+
+    Запись - несколько операций со словарями под блокировкой, чтобы метрики
+    можно было держать включенными всегда; запросы к базе отмечаются из потоков
+    AsyncDatabase. Прочие показатели (кэши, очереди) снимаются коллекторами
+    в момент чтения /metrics.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, clock=time.perf_counter):
+        self.buckets = buckets
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.handler_latency = {}
+        self.handler_errors = Counter()
+        self.query_latency = {}
+        self.query_rows = Counter()
+        self.votes = Counter()
+        self._collectors = []
+
+    def _observe(self, histograms, name, seconds):
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def observe_handler(self, name, seconds, error=False):
+        with self._lock:
+            self._observe(self.handler_latency, name, seconds)
+            if error:
+                self.handler_errors[name] += 1
+
+    def observe_query(self, name, seconds, result):
+        """Время вызова метода Database, число строк в ответе и записанные голоса"""
+        with self._lock:
+            self._observe(self.query_latency, name, seconds)
+            if isinstance(result, list):
+                self.query_rows[name] += len(result)
+            # add_vote возвращает VoteResult, add_votes - список VoteResult
+            if isinstance(result, VoteResult):
+                self.votes[result.status.value] += 1
+            elif name == "add_votes":
+                self.votes.update(vote.status.value for vote in result)
+
+    def add_collector(self, collect):
+        """collect() -> итерируемое из (имя, метки, значение); может быть async"""
+        self._collectors.append(collect)
+
+    def _samples(self):
+        with self._lock:
+            for name, histogram in self.handler_latency.items():
+                yield from histogram.samples("bot_handler_seconds", {"handler": name})
+            for name, count in self.handler_errors.items():
+                yield "bot_handler_errors_total", {"handler": name}, count
+            for name, histogram in self.query_latency.items():
+                yield from histogram.samples("bot_db_query_seconds", {"method": name})
+            for name, count in self.query_rows.items():
+                yield "bot_db_rows_total", {"method": name}, count
+            for status, count in self.votes.items():
+                yield "bot_votes_total", {"status": status}, count
+
+    async def render(self):
+        samples = list(self._samples())
+        for collect in self._collectors:
+            result = collect()
+            if inspect.isawaitable(result):
+                result = await result
+            samples.extend(result)
+        return "".join(f"{name}{_format_labels(labels)} {_format_value(value)}\n" for name, labels, value in samples)
+
+    async def handle(self, request):
+        return web.Response(text=await self.render(), content_type="text/plain", charset="utf-8")
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время работы каждого хендлера (по имени функции) и его ошибки"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = self.metrics.clock()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            self.metrics.observe_handler(name, self.metrics.clock() - started, error=True)
+            raise
+        self.metrics.observe_handler(name, self.metrics.clock() - started)
+        return result
@@ -0,0 +1,175 @@
+import argparse
+import logging
+import sqlite3
+import time
+from typing import NamedTuple
+from config import NOMINATIONS
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    """Шаг схемы. Каждый шаг идемпотентен: повторный запуск ничего не ломает.
+
+    steps - функции (conn), каждая выполняется целиком. В обычном режиме все
+    шаги миграции идут одной транзакцией вместе с повышением user_version.
+    Если online=True, в онлайн-режиме каждый шаг получает свою короткую
+    транзакцию, а между шагами писатели успевают взять блокировку.
+    """
+    version: int
+    description: str
+    steps: tuple
+    online: bool = False
+
+
+def _create_tables(conn):
+    # Таблица номинаций
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS nominations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    # Таблица участников
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nomination_id INTEGER,
+            name TEXT NOT NULL,
+            FOREIGN KEY (nomination_id) REFERENCES nominations (id)
+        )
+    ''')
+
+    # Таблица голосов с информацией о пользователях
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            first_name TEXT,
+            last_name TEXT,
+            username TEXT,
+            nomination_id INTEGER NOT NULL,
+            participant_id INTEGER NOT NULL,
+            FOREIGN KEY (nomination_id) REFERENCES nominations (id),
+            FOREIGN KEY (participant_id) REFERENCES participants (id),
+            UNIQUE(user_id, nomination_id)
+        )
+    ''')
+
+
+def seed_nominations(conn):
+    """Добавляет номинации из config.NOMINATIONS, которых еще нет в базе.
+
+    Кроме миграции 1 вызывается при каждом запуске (Database.init_db): так
+    номинация, дописанная в config.py, появляется и в уже созданной базе.
+    """
+    conn.executemany(
+        'INSERT OR IGNORE INTO nominations (name) VALUES (?)',
+        [(nomination,) for nomination in NOMINATIONS]
+    )
+
+
+def _add_previous_participant(conn):
+    # Прежний выбор пользователя для UPSERT в add_vote
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(votes)')]
+    if 'previous_participant_id' not in columns:
+        conn.execute('ALTER TABLE votes ADD COLUMN previous_participant_id INTEGER')
+
+
+def _create_event_log_state(conn):
+    # Номер последнего события журнала (eventlog.py), записанного вместе с изменением базы
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_log_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO event_log_state (id, seq) VALUES (1, 0)')
+
+
+def _create_index(sql):
+    def step(conn):
+        conn.execute(sql)
+    return step
+
+
+MIGRATIONS = (
+    Migration(1, "таблицы и номинации по умолчанию", (_create_tables, seed_nominations)),
+    Migration(2, "votes.previous_participant_id", (_add_previous_participant,)),
+    Migration(3, "индексы для голосов и участников", (
+        # Удаление голосов участника
+        _create_index('CREATE INDEX IF NOT EXISTS idx_votes_participant ON votes (participant_id)'),
+        # Покрывающий индекс для агрегата подсчета голосов
+        _create_index('CREATE INDEX IF NOT EXISTS idx_votes_nomination_participant ON votes (nomination_id, participant_id)'),
+        # Участники номинации без обращения к таблице
+        _create_index('CREATE INDEX IF NOT EXISTS idx_participants_nomination ON participants (nomination_id, id, name)'),
+    ), online=True),
+    Migration(4, "индекс участников по имени", (
+        # Поиск дубликатов при загрузке участников из файла
+        _create_index('CREATE INDEX IF NOT EXISTS idx_participants_nomination_name ON participants (nomination_id, name)'),
+    ), online=True),
+    Migration(5, "состояние журнала событий", (_create_event_log_state,)),
+)
+
+# Версия схемы хранится в PRAGMA user_version
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def get_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _run_in_transaction(conn, steps, version=None):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for step in steps:
+            step(conn)
+        if version is not None:
+            conn.execute(f'PRAGMA user_version = {version}')
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def migrate(conn, online=False, pause=0.05):
+    """Применяет недостающие миграции по порядку.
+
+    conn должен быть в autocommit-режиме (isolation_level=None): транзакциями
+    управляет сама функция. Возвращает [(version, description, секунды)]
+    для примененных миграций.
+    """
+    timings = []
+    for migration in MIGRATIONS:
+        if migration.version <= get_version(conn):
+            continue
+
+        started = time.perf_counter()
+        if online and migration.online:
+            for step in migration.steps:
+                _run_in_transaction(conn, (step,))
+                time.sleep(pause)
+            _run_in_transaction(conn, (), migration.version)
+        else:
+            _run_in_transaction(conn, migration.steps, migration.version)
+        elapsed = time.perf_counter() - started
+
+        logger.info("Миграция %s (%s) применена за %.3f с", migration.version, migration.description, elapsed)
+        timings.append((migration.version, migration.description, elapsed))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Применить миграции схемы к файлу базы")
+    parser.add_argument("db_path", help="файл базы, например копия voting.db")
+    parser.add_argument("--online", action="store_true", help="строить индексы короткими транзакциями")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout=5000')
+    print(f"Версия схемы: {get_version(conn)}")
+    for version, description, elapsed in migrate(conn, online=args.online):
+        print(f"  {version}: {description} - {elapsed * 1000:.1f} мс")
+    print(f"Версия схемы: {get_version(conn)}")
+    conn.close()
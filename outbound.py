@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    DeleteMessage,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    PinChatMessage,
+    SendDocument,
+    SendMessage,
+)
+
+from throttling import classify
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые Telegram считает в лимитах отправки (30 в секунду на бота, около 1 в секунду на чат).
+# Остальные запросы (answerCallbackQuery, getChatMember, ...) уходят без очереди
+SHAPED_METHODS = (
+    SendMessage,
+    SendDocument,
+    EditMessageText,
+    EditMessageReplyMarkup,
+    DeleteMessage,
+    PinChatMessage,
+)
+
+# Приоритет отправки по группе хендлера: меньше - раньше
+PRIORITIES = {"vote": 0, "results": 1, "admin": 2}
+DEFAULT_PRIORITY = 1
+
+send_priority = contextvars.ContextVar("send_priority", default=DEFAULT_PRIORITY)
+
+
+class PriorityMiddleware(BaseMiddleware):
+    """Outer-middleware: запросы хендлера уходят с приоритетом его группы"""
+
+    async def __call__(self, handler, event, data):
+        token = send_priority.set(PRIORITIES.get(classify(event), DEFAULT_PRIORITY))
+        try:
+            return await handler(event, data)
+        finally:
+            send_priority.reset(token)
+
+
+class OutboundQueue(BaseRequestMiddleware):
+    """Очередь исходящих запросов к Bot API поверх сессии бота.
+
+    Каждый чат получает не больше chat_rate сообщений в секунду с запасом
+    chat_burst, весь бот - не больше global_rate. Когда общий лимит исчерпан,
+    запросы ждут в очереди по приоритету (send_priority): подтверждения голосов
+    уходят раньше админских отчетов. На TelegramRetryAfter запрос ждет указанное
+    время и повторяется до max_retries раз, остальные сообщения того же чата
+    тоже придерживаются.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, max_retries=3,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        self.global_interval = 1 / global_rate
+        self.chat_interval = 1 / chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._sleep = sleep
+        # Время, раньше которого не уходит следующий запрос бота
+        self._global_next = 0.0
+        # (приоритет, порядковый номер, future) ждущих общего лимита
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump_task = None
+        # chat_id -> расчетное время следующего сообщения (GCRA), в порядке обращения
+        self._chats = OrderedDict()
+        self.queued = Counter()
+        self.max_queued = 0
+        self.sent = 0
+        self.retries = 0
+
+    def _reserve_chat(self, chat_id):
+        """Занимает место в лимите чата, возвращает сколько ждать"""
+        now = self._clock()
+        # Чаты, чей запас уже восстановился, ничем не отличаются от новых
+        while self._chats:
+            oldest = next(iter(self._chats))
+            if self._chats[oldest] > now:
+                break
+            del self._chats[oldest]
+
+        tat = max(self._chats.pop(chat_id, now), now)
+        self._chats[chat_id] = tat + self.chat_interval
+        return tat - self.chat_interval * (self.chat_burst - 1) - now
+
+    def _hold_chat(self, chat_id, delay):
+        # Следующие сообщения чата уходят не раньше чем через delay секунд
+        tat = self._clock() + delay + self.chat_interval * (self.chat_burst - 1)
+        self._chats[chat_id] = max(self._chats.pop(chat_id, tat), tat)
+
+    async def _pump(self):
+        try:
+            while self._waiters:
+                delay = self._global_next - self._clock()
+                if delay > 0:
+                    await self._sleep(delay)
+                    continue
+                _, _, future = heapq.heappop(self._waiters)
+                if future.done():
+                    continue
+                future.set_result(None)
+                self._global_next = max(self._global_next, self._clock()) + self.global_interval
+        finally:
+            self._pump_task = None
+
+    async def _reserve_global(self, priority):
+        now = self._clock()
+        if not self._waiters and self._global_next <= now:
+            self._global_next = now + self.global_interval
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _acquire(self, chat_id, priority):
+        self.queued[priority] += 1
+        self.max_queued = max(self.max_queued, sum(self.queued.values()))
+        try:
+            if chat_id is not None:
+                delay = self._reserve_chat(chat_id)
+                if delay > 0:
+                    await self._sleep(delay)
+            await self._reserve_global(priority)
+        finally:
+            self.queued[priority] -= 1
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, SHAPED_METHODS):
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("Bot API просит подождать %s с (чат %s), повтор %s", e.retry_after, chat_id, attempt + 1)
+                if chat_id is not None:
+                    self._hold_chat(chat_id, e.retry_after)
+                else:
+                    self._global_next = max(self._global_next, self._clock() + e.retry_after)
+                continue
+            self.sent += 1
+            return result
+
+    def stats(self):
+        return {
+            "queued": sum(self.queued.values()),
+            "queued_by_priority": {priority: count for priority, count in self.queued.items() if count},
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "retries": self.retries,
+            "chats": len(self._chats),
+        }
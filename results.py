@@ -0,0 +1,165 @@
+import asyncio
+import datetime
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from cache import cached
+
+logger = logging.getLogger(__name__)
+
+async def cached_text(db, key, version, build):
+    """Возвращает текст из кэша db.results_texts или собирает его заново, если голоса или каталог изменились"""
+    return await cached(db.results_texts, key, version, build)
+
+
+async def get_results_text(db):
+    """Текст "🏆 Результаты" или None, если голосов еще нет"""
+    async def build():
+        results = await db.get_vote_results()
+
+        if not results or all(votes == 0 for _, _, votes in results):
+            return None
+
+        parts = ["🏆 <b>Текущие результаты:</b>\n\n"]
+        current_nomination = ""
+        for nom_name, part_name, votes in results:
+            if nom_name != current_nomination:
+                if current_nomination != "":
+                    parts.append("\n")
+                parts.append(f"<b>{nom_name}:</b>\n")
+                current_nomination = nom_name
+
+            if part_name:
+                parts.append(f"  {part_name}: {votes} голосов\n")
+
+        parts.append(f"\n<b>Всего голосов:</b> {await db.get_total_votes_count()}")
+        return "".join(parts)
+
+    return await cached_text(db, "results", db.results_version, build)
+
+
+async def get_statistics_text(db):
+    """Текст "📊 Статистика" админ-панели или None, если результатов нет"""
+    async def build():
+        results = await db.get_vote_results()
+
+        if not results:
+            return None
+
+        parts = ["📊 <b>Результаты голосования:</b>\n\n"]
+        current_nomination = ""
+        for nom_name, part_name, votes in results:
+            if nom_name != current_nomination:
+                parts.append(f"<b>{nom_name}:</b>\n")
+                current_nomination = nom_name
+
+            if part_name:
+                parts.append(f"  {part_name}: {votes} голосов\n")
+            else:
+                parts.append("  Нет участников\n")
+
+        parts.append(f"\n<b>Всего голосов:</b> {await db.get_total_votes_count()}")
+        return "".join(parts)
+
+    return await cached_text(db, "statistics", db.results_version, build)
+
+
+class LiveResults:
+    """Закрепленные сообщения с результатами, которые обновляются сами.
+
+    Раз в interval секунд фоновая задача сравнивает версию результатов с
+    показанной; если голоса изменились, текст собирается один раз и
+    редактируется во всех сообщениях. Сколько бы админов ни смотрело, база
+    не читается чаще одного раза за interval.
+    """
+
+    def __init__(self, db, interval=5.0):
+        self.db = db
+        self.interval = interval
+        # chat_id -> message_id закрепленного сообщения
+        self.messages = {}
+        self._bot = None
+        self._shown_version = None
+        self._task = None
+        self.edits = 0
+
+    async def _render(self):
+        text = await get_results_text(self.db) or "📊 Голосов пока нет"
+        updated_at = datetime.datetime.now().strftime("%H:%M:%S")
+        return f"🔴 <b>Прямой эфир</b>\n\n{text}\n\n🕒 Обновлено в {updated_at}"
+
+    async def start(self, bot, chat_id):
+        """Отправляет и закрепляет сообщение с результатами в чате"""
+        await self.stop(bot, chat_id)
+
+        message = await bot.send_message(chat_id, await self._render())
+        try:
+            await bot.pin_chat_message(chat_id, message.message_id, disable_notification=True)
+        except TelegramBadRequest:
+            # Без закрепления сообщение все равно обновляется
+            logger.warning("Не удалось закрепить результаты в чате %s", chat_id)
+
+        self.messages[chat_id] = message.message_id
+        self._bot = bot
+        if self._task is None:
+            self._shown_version = self.db.results_version
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, bot, chat_id):
+        message_id = self.messages.pop(chat_id, None)
+        if message_id is None:
+            return False
+
+        try:
+            await bot.unpin_chat_message(chat_id, message_id=message_id)
+        except TelegramBadRequest:
+            pass
+        return True
+
+    async def _run(self):
+        try:
+            while self.messages:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.refresh()
+                except Exception:
+                    # Задача живет, пока есть сообщения: ошибка одного обновления ее не останавливает
+                    logger.exception("Не удалось обновить закрепленные результаты")
+        finally:
+            self._task = None
+
+    async def refresh(self):
+        """Редактирует сообщения, если результаты изменились с прошлого показа"""
+        version = self.db.results_version
+        if version == self._shown_version or not self.messages:
+            return
+
+        text = await self._render()
+        failed = False
+        for chat_id, message_id in list(self.messages.items()):
+            try:
+                await self._bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+                self.edits += 1
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                if "message is not modified" in e.message:
+                    continue
+                # Сообщение удалили или бота убрали из чата - перестаем его обновлять
+                logger.warning("Не удалось обновить результаты в чате %s: %s", chat_id, e.message)
+                self.messages.pop(chat_id, None)
+            except Exception:
+                # Сеть, RetryAfter и прочие временные ошибки: повторим на следующем шаге
+                logger.exception("Не удалось обновить результаты в чате %s", chat_id)
+                failed = True
+        if not failed:
+            self._shown_version = version
+
+    async def close(self):
+        self.messages.clear()
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
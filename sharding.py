@@ -0,0 +1,420 @@
+"""Шардированная запись голосов в нескольких процессах.
+
+Голоса делятся по user_id на N файлов SQLite рядом с основной базой
+(voting.shard0.db, voting.shard1.db, ...), каждый файл пишет свой процесс,
+поэтому записи не упираются в одно ядро и одну блокировку писателя. Все
+голоса пользователя лежат в одном шарде, так что UNIQUE(user_id, nomination_id)
+работает как раньше. Номинации и участники остаются в основной базе.
+
+Координатор в процессе бота раздает голоса процессам шардов, сводит
+подсчет в общий VoteTally и собирает отчеты по всем шардам. При первом запуске
+с шардами голоса из основной базы раскладываются по шардам; дальше таблица
+votes основной базы не используется. Число шардов после этого менять нельзя:
+голоса пользователя должны оставаться в его шарде.
+
+Как пропускная способность растет с числом шардов, меряет bench/sharding_scaling.py.
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from itertools import groupby
+from operator import itemgetter
+
+from database import (
+    COUNT_VOTES_SQL,
+    DELETE_PARTICIPANT_VOTES_SQL,
+    EXPORTS,
+    TOTAL_VOTES_SQL,
+    USER_VOTES_SQL,
+    VOTERS_AFTER_SQL,
+    VOTERS_BEFORE_SQL,
+    Database,
+    VoteResult,
+    VoteStatus,
+)
+from transfer import write_rows
+
+logger = logging.getLogger(__name__)
+
+# Запросы к шардам: имена номинаций и участников берутся из каталога основной базы
+SHARD_VOTERS_SQL = '''
+    SELECT user_id, nomination_id, participant_id, first_name, last_name, username
+    FROM votes
+    ORDER BY user_id
+'''
+
+SHARD_VOTERS_PAGE_SQL = '''
+    SELECT user_id, nomination_id, participant_id, first_name, last_name, username
+    FROM votes
+    WHERE user_id IN (
+        SELECT DISTINCT user_id FROM votes WHERE user_id > ? ORDER BY user_id LIMIT ?
+    )
+    ORDER BY user_id
+'''
+
+SHARD_VOTERS_PAGE_BACKWARD_SQL = '''
+    SELECT user_id, nomination_id, participant_id, first_name, last_name, username
+    FROM votes
+    WHERE user_id IN (
+        SELECT DISTINCT user_id FROM votes WHERE user_id < ? ORDER BY user_id DESC LIMIT ?
+    )
+    ORDER BY user_id DESC
+'''
+
+SHARD_EXPORT_VOTES_SQL = '''
+    SELECT user_id, first_name, last_name, username, nomination_id, participant_id
+    FROM votes
+    ORDER BY id
+'''
+
+# Перенос голосов из основной базы (подключенной как main_db) в шард
+SEED_SHARD_SQL = 'INSERT OR IGNORE INTO votes SELECT * FROM main_db.votes WHERE user_id % ? = ?'
+
+# Как часто координатор проверяет, живы ли процессы шардов, в секундах
+WORKER_CHECK_INTERVAL = 0.5
+
+
+def shard_of(user_id, shards):
+    """Номер шарда пользователя; то же правило, что в SEED_SHARD_SQL"""
+    return user_id % shards
+
+
+def shard_paths(db_path, shards):
+    base, ext = os.path.splitext(db_path)
+    return [f"{base}.shard{i}{ext or '.db'}" for i in range(shards)]
+
+
+def _write_votes(db, votes):
+    try:
+        return db.add_votes(votes)
+    except Exception:
+        # Ошибка пачки не должна останавливать процесс: голоса получают FAILED
+        logger.exception("Ошибка записи пачки из %s голосов в шард %s", len(votes), db.db_path)
+        return [VoteResult(VoteStatus.FAILED)] * len(votes)
+
+
+def _delete_votes(db, participant_id):
+    try:
+        with db.get_connection() as conn:
+            return conn.execute(DELETE_PARTICIPANT_VOTES_SQL, (participant_id,)).rowcount
+    except Exception:
+        logger.exception("Ошибка удаления голосов за участника %s в шарде %s", participant_id, db.db_path)
+        return None
+
+
+def _shard_worker(path, requests, responses, batch_size):
+    """Процесс шарда: пишет голоса пачками через Database.add_votes.
+
+    Из requests приходят списки (request_id, голос), кортежи
+    ("delete", request_id, participant_id) и None - остановка. В responses
+    уходит список (request_id, VoteResult) на каждую пачку и
+    [(request_id, число удаленных голосов)] на удаление.
+    """
+    db = Database(path, pool_size=1)
+    try:
+        carry = []
+        while True:
+            item = carry.pop() if carry else requests.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                _, request_id, participant_id = item
+                responses.put([(request_id, _delete_votes(db, participant_id))])
+                continue
+            batch = list(item)
+            while len(batch) < batch_size:
+                try:
+                    item = requests.get_nowait()
+                except queue.Empty:
+                    break
+                if not isinstance(item, list):
+                    # Остановка или удаление - после записи уже набранной пачки
+                    carry.append(item)
+                    break
+                batch.extend(item)
+
+            results = _write_votes(db, [vote for _, vote in batch])
+            responses.put([(request_id, result) for (request_id, _), result in zip(batch, results)])
+    finally:
+        db.close()
+
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class ShardedVotes:
+    """Координатор шардов для AsyncDatabase(shards=N).
+
+    db - Database основной базы: из нее берутся каталог и общий VoteTally.
+    Методы чтения синхронные и выполняются в потоках AsyncDatabase.
+    """
+
+    def __init__(self, db, shards, batch_size=200):
+        self.db = db
+        self.paths = shard_paths(db.db_path, shards)
+        # Схема шардов создается здесь, до запуска процессов
+        self.shards = [Database(path, pool_size=2) for path in self.paths]
+        self._seed_from_main()
+        db.tally.load(self._merged_counts())
+
+        context = multiprocessing.get_context("spawn")
+        self._responses = context.Queue()
+        self._requests = [context.Queue() for _ in self.paths]
+        self._workers = [
+            context.Process(
+                target=_shard_worker,
+                args=(path, requests, self._responses, batch_size),
+                name=f"vote-shard-{i}",
+                daemon=True,
+            )
+            for i, (path, requests) in enumerate(zip(self.paths, self._requests))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        # request_id -> (loop, future, номер шарда, голос)
+        self._pending = {}
+        # Номера шардов, чьи процессы завершились
+        self._dead = set()
+        self._closing = False
+        self._ids = itertools.count()
+        # Голоса, накопленные за текущую итерацию event loop, по шардам
+        self._outbox = [[] for _ in self.paths]
+        self._flush_scheduled = False
+        self._reader = threading.Thread(target=self._read_responses, name="vote-shard-responses", daemon=True)
+        self._reader.start()
+
+    # --- запись ---
+
+    def _seed_from_main(self):
+        if any(self._total(shard) for shard in self.shards):
+            return
+        with self.db.get_connection() as conn:
+            if not conn.execute(TOTAL_VOTES_SQL).fetchone()[0]:
+                return
+
+        logger.info("Раскладываем голоса основной базы по %s шардам", len(self.shards))
+        for i, shard in enumerate(self.shards):
+            with shard.get_connection() as conn:
+                conn.execute('ATTACH DATABASE ? AS main_db', (self.db.db_path,))
+                conn.execute(SEED_SHARD_SQL, (len(self.shards), i))
+                conn.commit()
+                conn.execute('DETACH DATABASE main_db')
+
+    def _read_responses(self):
+        next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+        while True:
+            try:
+                batch = self._responses.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                batch = []
+            if batch is None:
+                return
+            for request_id, result in batch:
+                pending = self._pending.pop(request_id, None)
+                if pending is None:
+                    continue
+                loop, future, _, vote = pending
+                # Подсчет обновляется до ответа хендлеру, как и без шардов
+                if vote is not None:
+                    self.db._apply_to_tally(vote, result)
+                loop.call_soon_threadsafe(_resolve, future, result)
+
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + WORKER_CHECK_INTERVAL
+
+    def _check_workers(self):
+        """Голоса упавших процессов шардов получают FAILED, а не ждут ответа вечно"""
+        if self._closing:
+            return
+        for i, worker in enumerate(self._workers):
+            if i not in self._dead and not worker.is_alive():
+                logger.error("Процесс шарда %s завершился с кодом %s, голоса шарда не записываются",
+                             i, worker.exitcode)
+                self._dead.add(i)
+        if not self._dead:
+            return
+
+        for request_id, (loop, future, shard, vote) in list(self._pending.items()):
+            if shard in self._dead and self._pending.pop(request_id, None) is not None:
+                loop.call_soon_threadsafe(_resolve, future, VoteResult(VoteStatus.FAILED) if vote is not None else None)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        for i, box in enumerate(self._outbox):
+            if box:
+                self._requests[i].put(box)
+                self._outbox[i] = []
+
+    async def add_vote(self, vote):
+        """Отправляет голос процессу его шарда и ждет VoteResult после коммита"""
+        shard = shard_of(vote[0], len(self.shards))
+        if shard in self._dead:
+            return VoteResult(VoteStatus.FAILED)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request_id = next(self._ids)
+        self._pending[request_id] = (loop, future, shard, vote)
+
+        # Голоса одной итерации loop уходят в процесс одним сообщением
+        self._outbox[shard].append((request_id, vote))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        return await future
+
+    async def delete_participant_votes(self, participant_id):
+        """Удаляет голоса за участника во всех шардах, возвращает их число.
+
+        Удаление идет через очереди процессов, поэтому выполняется после уже
+        отправленных голосов, и их ответы учитываются в подсчете раньше.
+        """
+        self._flush()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for shard, requests in enumerate(self._requests):
+            if shard in self._dead:
+                continue
+            future = loop.create_future()
+            request_id = next(self._ids)
+            self._pending[request_id] = (loop, future, shard, None)
+            requests.put(("delete", request_id, participant_id))
+            futures.append(future)
+        deleted = await asyncio.gather(*futures)
+
+        # Голоса за участника, записанные до удаления, могли попасть в подсчет
+        # уже после tally.remove_participant - убираем их еще раз
+        self.db.tally.remove_participant(participant_id)
+        self.db.user_votes.remove_participant(participant_id)
+        return sum(count or 0 for count in deleted)
+
+    # --- чтение ---
+
+    def _total(self, shard):
+        with shard.get_connection() as conn:
+            return conn.execute(TOTAL_VOTES_SQL).fetchone()[0]
+
+    def _merged_counts(self):
+        counts = {}
+        for shard in self.shards:
+            with shard.get_connection() as conn:
+                for nomination_id, participant_id, votes in conn.execute(COUNT_VOTES_SQL):
+                    key = (nomination_id, participant_id)
+                    counts[key] = counts.get(key, 0) + votes
+        return [(nomination_id, participant_id, votes) for (nomination_id, participant_id), votes in counts.items()]
+
+    def _named_voters(self, rows):
+        """Строки шардов в формате get_voters_info; голоса пользователя по названию номинации"""
+        catalogue = self.db.catalogue.get()
+        named = []
+        for _, user_rows in groupby(rows, key=itemgetter(0)):
+            user_named = []
+            for user_id, nomination_id, participant_id, first_name, last_name, username in user_rows:
+                info = catalogue.participant_info.get(participant_id)
+                nomination = catalogue.nomination_names.get(nomination_id)
+                if info is None or nomination is None:
+                    continue
+                user_named.append((user_id, nomination, info[0], first_name, last_name, username))
+            user_named.sort(key=itemgetter(1))
+            named.extend(user_named)
+        return named
+
+    def _load_user_votes(self, user_id):
+        shard = self.shards[shard_of(user_id, len(self.shards))]
+        with shard.get_connection() as conn:
+            return conn.execute(USER_VOTES_SQL, (user_id,)).fetchall()
+
+    def get_user_votes(self, user_id):
+        # Кэш голосов общий: голоса шардов попадают в него вместе с подсчетом
+        return self.db._cached_user_votes(user_id, self._load_user_votes)
+
+    def get_voters_info(self):
+        with contextlib.ExitStack() as stack:
+            cursors = [
+                stack.enter_context(shard.get_connection()).execute(SHARD_VOTERS_SQL)
+                for shard in self.shards
+            ]
+            return self._named_voters(heapq.merge(*cursors, key=itemgetter(0)))
+
+    def get_voters_page(self, cursor=None, limit=20, backward=False):
+        # Каждый шард отдает свою страницу, из слияния берутся первые limit пользователей
+        rows = []
+        for shard in self.shards:
+            with shard.get_connection() as conn:
+                if backward:
+                    rows.extend(conn.execute(SHARD_VOTERS_PAGE_BACKWARD_SQL, (cursor, limit)))
+                else:
+                    rows.extend(conn.execute(SHARD_VOTERS_PAGE_SQL, (-1 if cursor is None else cursor, limit)))
+        rows.sort(key=itemgetter(0), reverse=backward)
+
+        user_ids = sorted({row[0] for row in rows}, reverse=backward)[:limit]
+        last = user_ids[-1] if user_ids else None
+        page = [row for row in rows if (row[0] >= last if backward else row[0] <= last)] if user_ids else []
+        return self._named_voters(page)
+
+    def has_voters(self, user_id, before=False):
+        sql = VOTERS_BEFORE_SQL if before else VOTERS_AFTER_SQL
+        for shard in self.shards:
+            with shard.get_connection() as conn:
+                if conn.execute(sql, (user_id,)).fetchone()[0]:
+                    return True
+        return False
+
+    def check_tally(self):
+        """Сверка общего подсчета с агрегатами всех шардов, формат как у Database.check_tally"""
+        mismatches = self.db.tally.diff(self._merged_counts())
+        total = sum(self._total(shard) for shard in self.shards)
+        if self.db.tally.total != total:
+            mismatches.append((None, None, self.db.tally.total, total))
+        return mismatches
+
+    def export(self, kind, path, fmt="csv", batch_size=1000):
+        if kind != "votes":
+            return self.db.export(kind, path, fmt, batch_size)
+
+        catalogue = self.db.catalogue.get()
+
+        def batches():
+            for shard in self.shards:
+                with shard.get_connection() as conn:
+                    cursor = conn.execute(SHARD_EXPORT_VOTES_SQL)
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield [
+                            (user_id, first_name, last_name, username,
+                             nomination_id, catalogue.nomination_names.get(nomination_id, ""),
+                             participant_id, catalogue.participant_info.get(participant_id, ("",))[0])
+                            for user_id, first_name, last_name, username, nomination_id, participant_id in rows
+                        ]
+
+        return write_rows(path, EXPORTS["votes"][1], batches(), fmt)
+
+    async def close(self):
+        """Дожидается записи отправленных голосов и останавливает процессы шардов"""
+        self._closing = True
+        self._flush()
+        for requests in self._requests:
+            requests.put(None)
+
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join)
+        self._responses.put(None)
+        await loop.run_in_executor(None, self._reader.join)
+
+        for shard in self.shards:
+            shard.close()
+
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Статусы участника канала, при которых подписки нет
+NOT_SUBSCRIBED_STATUSES = ('left', 'kicked')
+
+
+class SubscriptionChecker:
+    """Проверка подписки на канал с кэшем.
+
+    Результат get_chat_member кэшируется на positive_ttl секунд для подписчиков
+    и на negative_ttl для неподписанных; кэш ограничен maxsize записями и
+    вытесняет самые давние (LRU). Одновременные проверки одного пользователя
+    объединяются в один запрос к Bot API. Статус также можно обновлять из
+    апдейтов chat_member через update_from_chat_member.
+    """
+
+    def __init__(self, channel, positive_ttl=300, negative_ttl=30, maxsize=10000, clock=time.monotonic):
+        self.channel = channel
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        # user_id -> (подписан, когда истекает)
+        self._cache = OrderedDict()
+        # user_id -> задача с запросом get_chat_member
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _store(self, user_id, subscribed):
+        ttl = self.positive_ttl if subscribed else self.negative_ttl
+        self._cache[user_id] = (subscribed, self._clock() + ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def _lookup(self, user_id):
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        subscribed, expires_at = entry
+        if expires_at <= self._clock():
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return subscribed
+
+    async def _fetch(self, bot, user_id):
+        chat_member = await bot.get_chat_member(self.channel, user_id)
+        subscribed = chat_member.status not in NOT_SUBSCRIBED_STATUSES
+        self._store(user_id, subscribed)
+        return subscribed
+
+    async def is_subscribed(self, bot, user_id):
+        """Подписан ли пользователь; ошибки Bot API пробрасываются и не кэшируются"""
+        subscribed = self._lookup(user_id)
+        if subscribed is not None:
+            self.hits += 1
+            return subscribed
+
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(bot, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+
+        # shield: отмена одного ожидающего хендлера не должна отменять запрос для остальных
+        return await asyncio.shield(task)
+
+    def _is_channel(self, chat):
+        if str(chat.id) == str(self.channel):
+            return True
+        return chat.username is not None and f"@{chat.username}".lower() == str(self.channel).lower()
+
+    def update_from_chat_member(self, event):
+        """Обновляет кэш по апдейту chat_member из канала"""
+        if not self._is_channel(event.chat):
+            return
+        member = event.new_chat_member
+        self._store(member.user.id, member.status not in NOT_SUBSCRIBED_STATUSES)
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._cache),
+        }
@@ -0,0 +1,90 @@
+import threading
+
+
+class VoteTally:
+    """Живой подсчет голосов в памяти: nomination_id -> participant_id -> голоса.
+
+    Загружается из базы один раз при запуске, дальше обновляется инкрементально
+    после каждой успешной записи, так что результаты читаются за O(участников)
+    без GROUP BY по всей таблице votes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._nomination_of = {}
+        self._total = 0
+        # Увеличивается при каждом изменении подсчета
+        self.version = 0
+
+    def load(self, rows):
+        """Заполняет подсчет строками (nomination_id, participant_id, votes)"""
+        with self._lock:
+            self._counts = {}
+            self._nomination_of = {}
+            self._total = 0
+            for nomination_id, participant_id, votes in rows:
+                self._counts.setdefault(nomination_id, {})[participant_id] = votes
+                self._nomination_of[participant_id] = nomination_id
+                self._total += votes
+            self.version += 1
+
+    def _add(self, nomination_id, participant_id, delta):
+        counts = self._counts.setdefault(nomination_id, {})
+        counts[participant_id] = counts.get(participant_id, 0) + delta
+        self._nomination_of[participant_id] = nomination_id
+
+    def apply_vote(self, nomination_id, participant_id, previous_participant_id=None):
+        """Учитывает новый голос или перенос голоса от previous_participant_id"""
+        if previous_participant_id == participant_id:
+            return
+
+        with self._lock:
+            if previous_participant_id is None:
+                self._total += 1
+            else:
+                self._add(nomination_id, previous_participant_id, -1)
+            self._add(nomination_id, participant_id, 1)
+            self.version += 1
+
+    def remove_participant(self, participant_id):
+        """Убирает участника вместе с его голосами"""
+        with self._lock:
+            nomination_id = self._nomination_of.pop(participant_id, None)
+            if nomination_id is None:
+                return
+            self._total -= self._counts[nomination_id].pop(participant_id, 0)
+            self.version += 1
+
+    def snapshot(self):
+        """Копия подсчета {(nomination_id, participant_id): голоса} и общее число голосов"""
+        with self._lock:
+            counts = {
+                (nomination_id, participant_id): votes
+                for nomination_id, participants in self._counts.items()
+                for participant_id, votes in participants.items()
+                if votes
+            }
+            return counts, self._total
+
+    @property
+    def total(self):
+        with self._lock:
+            return self._total
+
+    def diff(self, rows):
+        """Сравнивает подсчет с агрегатом из базы.
+
+        rows - строки (nomination_id, participant_id, votes) из GROUP BY.
+        Возвращает расхождения (nomination_id, participant_id, в памяти, в базе).
+        """
+        counts, _ = self.snapshot()
+        expected = {(nomination_id, participant_id): votes for nomination_id, participant_id, votes in rows}
+
+        mismatches = []
+        for key in sorted(counts.keys() | expected.keys()):
+            in_memory = counts.get(key, 0)
+            in_db = expected.get(key, 0)
+            if in_memory != in_db:
+                mismatches.append((key[0], key[1], in_memory, in_db))
+        return mismatches
@@ -0,0 +1,123 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# config.py и config_token.py не хранятся в репозитории: если их нет, берутся
+# тестовые из tests/settings. Путем, а не подменой модулей, чтобы их видели
+# и процессы шардов
+sys.path.append(os.path.join(ROOT, "tests", "settings"))
+
+# Заглушка Bot API для тестов - та же, что у нагрузочного прогона
+from loadtest import FakeSession  # noqa: E402,F401
+
+FIXTURE_DB = os.path.join(ROOT, "voting.db")
+
+
+def pytest_addoption(parser):
+    parser.addoption("--slow", action="store_true", help="запускать и долгие тесты на миллионах строк")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: долгий тест на миллионах строк, запускается с --slow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--slow"):
+        return
+    skip = pytest.mark.skip(reason="долгий тест, запускается с --slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
+
+
+def count_votes(path):
+    """Число голосов в базе по пути"""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM votes').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def sent(session, method_type):
+    """Запросы FakeSession к Bot API одного типа"""
+    return [method for method in session.requests if isinstance(method, method_type)]
+
+
+def user(user_id):
+    return User(id=user_id, is_bot=False, first_name=f"User {user_id}", username=f"user{user_id}")
+
+
+def message_update(update_id, user_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=user(user_id),
+        text=text,
+    ))
+
+
+def callback_update(update_id, user_id, data):
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=42, is_bot=True, first_name="bot"),
+        text="Выберите номинацию:",
+    )
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user(user_id), chat_instance="test", message=message, data=data,
+    ))
+
+
+@pytest.fixture
+def fixture_db(tmp_path):
+    """Копия voting.db из репозитория"""
+    path = tmp_path / "voting.db"
+    shutil.copy(FIXTURE_DB, path)
+    return str(path)
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    """Путь к еще не созданной базе"""
+    return str(tmp_path / "test.db")
+
+
+@pytest.fixture
+def bot_main(fixture_db, tmp_path, monkeypatch):
+    """main.py на копии voting.db: FSM в SQLite во временном каталоге, без ограничения частоты.
+
+    Диспетчер в main.py один на процесс - middleware и workflow_data, добавленные
+    тестом (setup_services, setup_metrics), после теста возвращаются как были.
+    """
+    monkeypatch.setenv("DB_PATH", fixture_db)
+    # FSM_STORAGE читается при импорте main: хранилище подменяется ниже
+    monkeypatch.setenv("FSM_STORAGE", "memory")
+    monkeypatch.setenv("BACKUP_DIR", str(tmp_path / "backups"))
+    monkeypatch.setenv("BACKUP_INTERVAL_MINUTES", "0")
+    monkeypatch.setenv("THROTTLE", "0")
+    for name in ("EVENT_LOG_DIR", "VOTE_SHARDS", "VOTE_WRITE_BEHIND"):
+        monkeypatch.delenv(name, raising=False)
+
+    import main
+    from fsm_storage import SQLiteStorage
+
+    managers = [manager for observer in main.dp.observers.values()
+                for manager in (observer.middleware, observer.outer_middleware)]
+    saved = [list(manager._middlewares) for manager in managers]
+    workflow_data = dict(main.dp.workflow_data)
+    monkeypatch.setattr(main.dp.fsm, "storage", SQLiteStorage(str(tmp_path / "fsm.db")))
+    yield main
+    for manager, middlewares in zip(managers, saved):
+        manager._middlewares[:] = middlewares
+    main.dp.workflow_data.clear()
+    main.dp.workflow_data.update(workflow_data)
@@ -0,0 +1,4 @@
+# Настройки для тестов, если рядом с ботом нет своего config.py
+NOMINATIONS = ["Трек года", "Альбом года", "Клип года"]
+CHANNEL_USERNAME = "@testchan"
+ADMINS = [1]
@@ -0,0 +1 @@
+BOT_TOKEN = "42:TEST"
@@ -0,0 +1,145 @@
+import asyncio
+import re
+
+from admin_panel import MESSAGE_LIMIT, VOTERS_HEADER, VOTERS_PAGE_SIZE, _text_length, render_voters_page
+from callbacks import VotersPageCallback
+from database import AsyncDatabase
+from loadtest import load_catalogue
+
+USER_ID_RE = re.compile(r"🆔 ID: (\d+)")
+BLOCK_END = "─" * 30 + "\n\n"
+# Единственный голосовавший в voting.db - голоса во всех номинациях с участниками
+FIXTURE_VOTER = 6094958658
+
+
+def add_voters(db_path, users, first_name="Пользователь"):
+    """users пользователей с голосом в каждой номинации, где есть участники.
+
+    Возвращает user_id всех голосовавших по возрастанию и число голосов у каждого.
+    """
+    catalogue = load_catalogue(db_path)
+    user_ids = [1000 + i * 7 for i in range(users)]
+
+    async def scenario():
+        db = AsyncDatabase(db_path)
+        try:
+            await db.add_votes([(user_id, nomination_id, participants[0], first_name, None, None)
+                                for user_id in user_ids for nomination_id, participants in catalogue])
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+    return user_ids + [FIXTURE_VOTER], len(catalogue)
+
+
+def page_buttons(keyboard):
+    """{direction: user_id} кнопок листания страницы"""
+    if keyboard is None:
+        return {}
+    [row] = keyboard.inline_keyboard
+    callbacks = [VotersPageCallback.unpack(button.callback_data) for button in row]
+    return {callback.direction: callback.user_id for callback in callbacks}
+
+
+def walk_voters(db_path):
+    """Листает отчет кнопками: страницы [(текст, кнопки)] от первой вперед и от последней назад"""
+    async def scenario():
+        db = AsyncDatabase(db_path)
+        try:
+            text, keyboard = await render_voters_page(db)
+            forward = [(text, page_buttons(keyboard))]
+            while "next" in forward[-1][1]:
+                text, keyboard = await render_voters_page(db, forward[-1][1]["next"])
+                forward.append((text, page_buttons(keyboard)))
+
+            backward = [forward[-1]]
+            while "prev" in backward[-1][1]:
+                text, keyboard = await render_voters_page(db, backward[-1][1]["prev"], backward=True)
+                backward.append((text, page_buttons(keyboard)))
+            return forward, backward
+        finally:
+            await db.close()
+
+    return asyncio.run(scenario())
+
+
+def page_user_ids(text):
+    return [int(user_id) for user_id in USER_ID_RE.findall(text)]
+
+
+def test_get_voters_page_cursors(fixture_db):
+    user_ids, nominations = add_voters(fixture_db, 45)
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db)
+        try:
+            first = await db.get_voters_page(None, 20)
+            second = await db.get_voters_page(first[-1][0], 20)
+            back = await db.get_voters_page(second[0][0], 20, backward=True)
+            last = await db.get_voters_page(user_ids[-2], 20)
+            edges = (await db.has_voters(first[0][0], before=True), await db.has_voters(FIXTURE_VOTER),
+                     await db.has_voters(second[0][0], before=True), await db.has_voters(first[-1][0]))
+            return first, second, back, last, edges
+        finally:
+            await db.close()
+
+    first, second, back, last, edges = asyncio.run(scenario())
+    first_ids = [row[0] for row in first]
+    second_ids = [row[0] for row in second]
+    # Страница - 20 целых пользователей подряд, со всеми их голосами
+    assert first_ids == sorted(first_ids) and second_ids == sorted(second_ids)
+    assert sorted(set(first_ids)) == user_ids[:20]
+    assert sorted(set(second_ids)) == user_ids[20:40]
+    assert len(first) == len(second) == 20 * nominations
+    # Назад от первого пользователя второй страницы - первая страница, по убыванию user_id
+    back_ids = [row[0] for row in back]
+    assert back_ids == sorted(back_ids, reverse=True)
+    assert sorted(back) == sorted(first)
+    assert [row[0] for row in last] == [FIXTURE_VOTER] * nominations
+    assert edges == (False, False, True, True)
+
+
+def test_voters_pages_forward_and_back(fixture_db):
+    user_ids, nominations = add_voters(fixture_db, 45)
+
+    forward, backward = walk_voters(fixture_db)
+    pages = [page_user_ids(text) for text, _ in forward]
+    assert len(pages) == 3 and all(len(page) <= VOTERS_PAGE_SIZE for page in pages)
+    assert sum(pages, []) == user_ids
+    for text, _ in forward:
+        # Блок пользователя целиком на странице: все его голоса
+        assert text.count("  • ") == nominations * len(page_user_ids(text))
+        assert text.startswith(VOTERS_HEADER) and text.endswith(BLOCK_END)
+
+    # На первой странице нет кнопки назад, на последней - кнопки вперед
+    assert set(forward[0][1]) == {"next"}
+    assert set(forward[1][1]) == {"prev", "next"}
+    assert set(forward[-1][1]) == {"prev"}
+
+    # Назад кнопками - те же страницы в обратном порядке
+    assert [page_user_ids(text) for text, _ in backward] == pages[::-1]
+    assert set(backward[-1][1]) == {"next"}
+
+
+def test_long_voters_page_is_cut_between_blocks(fixture_db):
+    # Эмодзи - две позиции UTF-16: по len() в сообщение поместилось бы почти вдвое больше блоков
+    name = "🎵" * 400
+    user_ids, nominations = add_voters(fixture_db, 25, name)
+
+    forward, backward = walk_voters(fixture_db)
+    pages = [page_user_ids(text) for text, _ in forward]
+    assert all(len(page) < VOTERS_PAGE_SIZE for page in pages)
+    assert sum(pages, []) == user_ids
+    assert [page_user_ids(text) for text, _ in backward] == pages[::-1]
+    for text, _ in forward:
+        assert _text_length(text) <= MESSAGE_LIMIT
+        # Разрез только между блоками: разметка заголовка цела, последний блок закончен
+        assert text.startswith(VOTERS_HEADER) and text.endswith(BLOCK_END)
+        assert text.count("<b>") == text.count("</b>") == 1
+        assert text.count("  • ") == nominations * len(page_user_ids(text))
+
+    # Первая страница заполнена до лимита UTF-16: следующий блок не влез бы, хотя по len() влез бы
+    text, _ = forward[0]
+    block_length = _text_length(text[len(VOTERS_HEADER):]) // len(pages[0])
+    assert _text_length(text) + block_length > MESSAGE_LIMIT
+    assert len(text) + len(text[len(VOTERS_HEADER):]) // len(pages[0]) <= MESSAGE_LIMIT
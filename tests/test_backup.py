@@ -0,0 +1,81 @@
+import asyncio
+import os
+import random
+import sqlite3
+
+import pytest
+
+import backup
+from backup import BackupError, BackupManager
+from database import AsyncDatabase
+from loadtest import inflate_votes, load_catalogue, random_vote
+
+from conftest import count_votes
+
+
+def test_backup_during_voting_is_consistent(fixture_db, tmp_path):
+    catalogue = load_catalogue(fixture_db)
+    inflate_votes(fixture_db, catalogue, 200000)
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db)
+        rnd = random.Random(1)
+        committed = {"baseline": 0, "backup": 0}
+        phase = "baseline"
+        stop = asyncio.Event()
+
+        async def voter():
+            while not stop.is_set():
+                assert (await db.add_vote(*random_vote(rnd, catalogue, 5000))).ok
+                committed[phase] += 1
+
+        voters = [asyncio.create_task(voter()) for _ in range(20)]
+        await asyncio.sleep(0.2)
+
+        before = count_votes(fixture_db)
+        phase = "backup"
+        manager = BackupManager([fixture_db], str(tmp_path / "backups"), pages=64, pause=0.002)
+        info = await manager.backup()
+        stop.set()
+        await asyncio.gather(*voters)
+        await db.close()
+        return before, count_votes(fixture_db), info, committed
+
+    before, after, info, committed = asyncio.run(scenario())
+    copy_path = os.path.join(info.path, "voting.db")
+
+    conn = sqlite3.connect(copy_path)
+    assert conn.execute('PRAGMA integrity_check').fetchall() == [("ok",)]
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ("delete",)
+    conn.close()
+    # Копия - один файл без -wal рядом
+    assert os.listdir(info.path) == ["voting.db"]
+    # Копия - один момент между началом и концом копирования, а голосование шло все время
+    assert info.steps > 10
+    assert committed["backup"] > 0
+    assert after > before
+    assert before <= count_votes(copy_path) <= after
+
+
+def test_keep_prunes_oldest_backups(fixture_db, tmp_path):
+    manager = BackupManager([fixture_db], str(tmp_path / "backups"), keep=2)
+    for stamp in ("20260101-000000", "20260102-000000", "20260103-000000"):
+        os.makedirs(tmp_path / "backups" / stamp)
+    os.makedirs(tmp_path / "backups" / ".20260104-000000.tmp")
+
+    info = asyncio.run(manager.backup())
+    assert [os.path.basename(path) for path in manager.backups()] == ["20260103-000000", os.path.basename(info.path)]
+    assert manager.stats()["completed"] == 1
+
+
+def test_failed_check_leaves_no_partial_backup(fixture_db, tmp_path, monkeypatch):
+    def broken_copy(source, target, *args):
+        open(target, "wb").close()
+        raise BackupError(f"{target}: page 2 is never used")
+
+    monkeypatch.setattr(backup, "backup_file", broken_copy)
+    manager = BackupManager([fixture_db], str(tmp_path / "backups"))
+    with pytest.raises(BackupError):
+        asyncio.run(manager.backup())
+    assert os.listdir(tmp_path / "backups") == []
+    assert manager.stats()["failed"] == 1
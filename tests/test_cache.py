@@ -0,0 +1,102 @@
+import itertools
+import random
+import threading
+
+from cache import CatalogueCache, UserVotesCache
+
+
+def simulate_user_votes(users, requests, maxsize, exponent=1.1, vote_ratio=0.5, seed=1):
+    """Прогон UserVotesCache на пользователях с частотой обращений по закону Ципфа.
+
+    Пользователь k обращается с весом 1 / k ** exponent; доля vote_ratio обращений -
+    голоса, остальные - "📊 Мои голоса". Возвращает stats() кэша.
+    """
+    rnd = random.Random(seed)
+    cache = UserVotesCache(maxsize)
+    cum_weights = list(itertools.accumulate(1 / k ** exponent for k in range(1, users + 1)))
+    for user_id in rnd.choices(range(users), cum_weights=cum_weights, k=requests):
+        if rnd.random() < vote_ratio:
+            cache.record_vote(user_id, rnd.randrange(10), rnd.randrange(5))
+        elif cache.get(user_id) is None:
+            cache.load_started(user_id)
+            cache.put(user_id, {})
+    return cache.stats()
+
+
+def test_lru_counts_hits_misses_and_evictions():
+    cache = UserVotesCache(maxsize=2)
+    for user_id in (1, 2):
+        assert cache.get(user_id) is None
+        cache.load_started(user_id)
+        cache.put(user_id, {10: 100})
+
+    assert cache.get(1) == {10: 100}
+    # 2 давно не читали - он и вытесняется третьим пользователем
+    cache.load_started(3)
+    cache.put(3, {})
+    assert 2 not in cache
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "size": 2}
+
+
+def test_vote_during_load_is_not_overwritten():
+    cache = UserVotesCache()
+    cache.load_started(1)
+    cache.record_vote(1, 10, 100)
+    # Прочитанное из базы до голоса устарело и не сохраняется
+    cache.put(1, {})
+    assert 1 not in cache
+
+
+def test_failed_load_does_not_block_later_loads():
+    cache = UserVotesCache()
+    cache.load_started(1)
+    # Запрос к базе упал - отметка снимается, голоса не сохраняются
+    cache.put(1, None)
+    assert 1 not in cache
+
+    cache.load_started(1)
+    cache.put(1, {10: 100})
+    assert cache.get(1) == {10: 100}
+
+
+def test_record_vote_and_remove_participant():
+    cache = UserVotesCache()
+    cache.load_started(1)
+    cache.put(1, {10: 100, 11: 110})
+    cache.record_vote(1, 10, 101)
+    cache.remove_participant(110)
+    assert cache.get(1) == {10: 101}
+
+
+def test_zipf_hit_ratio_grows_with_cache_size():
+    users, requests = 20000, 100000
+    small = simulate_user_votes(users, requests, maxsize=500)
+    large = simulate_user_votes(users, requests, maxsize=5000)
+    whole = simulate_user_votes(users, requests, maxsize=users)
+
+    assert small["size"] == 500
+    assert large["size"] == 5000
+
+    # Горячие пользователи помещаются и в маленький кэш, вытеснения - за счет хвоста
+    assert small["hits"] / (small["hits"] + small["misses"]) > 0.5
+    assert small["evictions"] > large["evictions"] > 0
+    assert small["hits"] < large["hits"] < whole["hits"]
+    # Кэш на всех пользователей ничего не вытесняет: промах - только первое обращение
+    assert whole["evictions"] == 0
+    assert whole["misses"] == whole["size"]
+
+
+def test_catalogue_counters_from_many_threads():
+    cache = CatalogueCache(lambda: ([(1, "Номинация")], [(10, 1, "Участник")]))
+    threads, calls = 8, 20000
+
+    def read():
+        for _ in range(calls):
+            cache.get()
+
+    workers = [threading.Thread(target=read) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert cache.stats() == {"hits": threads * calls - 1, "misses": 1, "version": 0}
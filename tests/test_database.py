@@ -0,0 +1,76 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from database import AsyncDatabase, DatabaseInUseError
+
+
+def test_second_database_on_same_file_is_refused(fixture_db):
+    async def scenario():
+        first = AsyncDatabase(fixture_db)
+        try:
+            # Второй экземпляр считал бы голоса и кэшировал каталог отдельно от первого
+            with pytest.raises(DatabaseInUseError):
+                AsyncDatabase(fixture_db)
+            nomination_id, _ = (await first.get_nominations())[0]
+            participant_id = await first.add_participant(nomination_id, "Новый участник")
+        finally:
+            await first.close()
+
+        # После close файл свободен, и новый экземпляр видит все, что записал первый
+        second = AsyncDatabase(fixture_db)
+        try:
+            return participant_id, await second.get_participant_info(participant_id)
+        finally:
+            await second.close()
+
+    participant_id, info = asyncio.run(scenario())
+    assert info is not None and info[0] == "Новый участник"
+
+
+def test_second_process_on_same_file_is_refused(fixture_db):
+    script = (
+        "import sys\n"
+        "from database import AsyncDatabase, DatabaseInUseError\n"
+        "try:\n"
+        "    AsyncDatabase(sys.argv[1])\n"
+        "except DatabaseInUseError:\n"
+        "    sys.exit(3)\n"
+    )
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db)
+        try:
+            # Тот же sys.path, что у тестов: модули бота и тестовый config
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+            return subprocess.run([sys.executable, "-c", script, fixture_db], env=env).returncode
+        finally:
+            await db.close()
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_check_tally_while_voting(fixture_db):
+    async def scenario():
+        db = AsyncDatabase(fixture_db)
+        try:
+            nomination_id, _ = (await db.get_nominations())[0]
+            (first, _), (second, _), *_ = await db.get_participants(nomination_id)
+            # Каждый повторный голос переносится к другому участнику: -1 и +1 в подсчете
+            votes = [db.add_vote(user_id, nomination_id, (first, second)[(user_id + round_) % 2])
+                     for round_ in range(10) for user_id in range(200)]
+            checks = [db.check_tally() for _ in range(200)]
+            results = await asyncio.gather(*votes, *checks)
+            mismatches = [result for result in results[len(votes):] if result]
+
+            await db.delete_participant(first)
+            return mismatches, await db.check_tally()
+        finally:
+            await db.close()
+
+    mismatches, after_delete = asyncio.run(scenario())
+    assert mismatches == []
+    assert after_delete == []
@@ -0,0 +1,213 @@
+import asyncio
+import gc
+import logging
+import random
+import sqlite3
+import time
+import warnings
+
+from tally import VoteTally
+
+from database import AsyncDatabase, Database, VoteStatus
+from eventlog import EventLog, rebuild
+from loadtest import inflate_votes, load_catalogue, random_vote
+from transfer import write_rows
+
+
+def random_votes(catalogue, count, seed=1, users=1000):
+    rnd = random.Random(seed)
+    for _ in range(count):
+        yield random_vote(rnd, catalogue, users)
+
+
+def test_compact_keeps_segment_with_events_after_snapshot(tmp_path):
+    log = EventLog(str(tmp_path), segment_size=10)
+    for _ in range(35):
+        log.append([{"type": "noop"}])
+    assert [first for first, _ in log.segments()] == [1, 11, 21, 31]
+
+    log.write_snapshot(15, [], [], [], [])
+    log.compact(15)
+    # 1-10 покрыты снимком, в 11-20 есть события после него
+    assert [first for first, _ in log.segments()] == [11, 21, 31]
+    assert [event["seq"] for event in log.events(log.snapshot_seq)] == list(range(16, 36))
+    assert log.seq == 35
+
+    log.write_snapshot(35, [], [], [], [])
+    log.compact(35)
+    assert log.segments() == []
+    assert [seq for seq, _ in log.snapshots()] == [35]
+    assert log.append([{"type": "noop"}]) == 36
+    log.close()
+
+
+def test_snapshot_does_not_stall_votes(fixture_db, tmp_path):
+    catalogue = load_catalogue(fixture_db)
+    inflate_votes(fixture_db, catalogue, 150000)
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db, event_log=EventLog(str(tmp_path / "events")))
+        votes = random_votes(catalogue, 10 ** 6, seed=2)
+        latencies = []
+        snapshot = asyncio.create_task(db.snapshot_event_log())
+        started = time.perf_counter()
+        while not snapshot.done():
+            vote_started = time.perf_counter()
+            assert (await db.add_vote(*next(votes))).ok
+            latencies.append(time.perf_counter() - vote_started)
+        snapshot_time = time.perf_counter() - started
+        await snapshot
+        await db.close()
+        return latencies, snapshot_time
+
+    latencies, snapshot_time = asyncio.run(scenario())
+    # Голоса шли все время снимка, и ни один не ждал его целиком
+    assert len(latencies) > 10
+    assert max(latencies) < snapshot_time / 2
+
+
+def test_snapshot_during_writes_recovers_exactly(fixture_db, tmp_path):
+    catalogue = load_catalogue(fixture_db)
+    inflate_votes(fixture_db, catalogue, 100000)
+    events = str(tmp_path / "events")
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db, event_log=EventLog(events, segment_size=50))
+        votes = random_votes(catalogue, 10 ** 6, seed=3, users=300)
+
+        async def voter():
+            for _ in range(200):
+                await db.add_vote(*next(votes))
+
+        async def snapshot_midway():
+            while db.sync.event_log.seq < 100:
+                await asyncio.sleep(0.001)
+            await db.snapshot_event_log()
+
+        await asyncio.gather(snapshot_midway(), voter(), voter())
+        await db.close()
+
+    asyncio.run(scenario())
+
+    # После перезапуска подсчет берется из снимка и хвоста журнала без пересчета по базе
+    log = EventLog(events, segment_size=50)
+    db = Database(fixture_db, event_log=log)
+    # Снимок снят посреди записи: часть событий проигрывается из журнала после него
+    assert 0 < log.snapshot_seq < log.seq
+    assert db.check_tally() == []
+    db.close()
+
+
+def test_background_snapshots_by_snapshot_every(fixture_db, tmp_path):
+    events = str(tmp_path / "events")
+    catalogue = load_catalogue(fixture_db)
+
+    async def scenario():
+        db = AsyncDatabase(fixture_db, event_log=EventLog(events, segment_size=20), snapshot_every=50)
+        for vote in random_votes(catalogue, 400, seed=4):
+            await db.add_vote(*vote)
+        await db.close()
+        return db.sync.event_log
+
+    log = asyncio.run(scenario())
+    assert log.snapshot_seq > 50
+    # Покрытые снимками сегменты удалены, старые снимки тоже
+    assert len(log.snapshots()) == 1
+    assert all(first > log.snapshot_seq - 20 for first, _ in log.segments())
+
+    db = Database(fixture_db, event_log=EventLog(events, segment_size=20))
+    assert db.check_tally() == []
+    db.close()
+
+
+def test_load_tally_closes_snapshot(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.write_snapshot(0, [[1, 2, 3]], [], [], [[10 ** 12, 1, 2, None, "A", None, None]])
+    log.compact(0)
+    log.append([{"type": "vote", "nomination_id": 1, "participant_id": 2, "previous": None}])
+
+    tally = VoteTally()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", ResourceWarning)
+        assert log.load_tally(tally) == 1
+        gc.collect()
+    assert [w for w in caught if issubclass(w.category, ResourceWarning)] == []
+    assert tally.snapshot()[0] == {(1, 2): 4}
+
+    header, votes = log.read_snapshot()
+    assert header["seq"] == 0
+    assert list(votes) == [[10 ** 12, 1, 2, None, "A", None, None]]
+    log.close()
+
+
+def test_first_start_is_not_reported_as_mismatch(fixture_db, tmp_path, caplog):
+    events = str(tmp_path / "events")
+    with caplog.at_level(logging.INFO, logger="database"):
+        Database(fixture_db, event_log=EventLog(events)).close()
+    assert "Снимка журнала событий еще нет" in caplog.text
+    assert "не совпадает" not in caplog.text
+    assert [r for r in caplog.records if r.levelno >= logging.WARNING] == []
+
+    # Второй запуск восстанавливает подсчет из снимка
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="database"):
+        db = Database(fixture_db, event_log=EventLog(events))
+    assert "Подсчет восстановлен из снимка" in caplog.text
+    assert db.check_tally() == []
+    db.close()
+
+
+def test_rebuild_keeps_name_from_repeated_vote(fixture_db, tmp_path):
+    events = str(tmp_path / "events")
+    db = Database(fixture_db, event_log=EventLog(events))
+    nomination_id, _ = db.get_nominations()[0]
+    participant_id, _ = db.get_participants(nomination_id)[0]
+    assert db.add_vote(10 ** 12, nomination_id, participant_id, "Старое имя").status is VoteStatus.NEW
+    result = db.add_vote(10 ** 12, nomination_id, participant_id, "Новое имя", None, "new_username")
+    assert result.status is VoteStatus.UNCHANGED
+    db.close()
+
+    restored = str(tmp_path / "restored.db")
+    rebuild(EventLog(events), restored)
+    conn = sqlite3.connect(restored)
+    try:
+        row = conn.execute("SELECT first_name, username FROM votes WHERE user_id = ?", (10 ** 12,)).fetchone()
+    finally:
+        conn.close()
+    assert row == ("Новое имя", "new_username")
+
+    # Повторный голос не меняет подсчет при восстановлении
+    db = Database(fixture_db, event_log=EventLog(events))
+    assert db.check_tally() == []
+    db.close()
+
+
+def test_catalogue_edits_are_logged_as_deltas(fixture_db, tmp_path):
+    events = str(tmp_path / "events")
+    db = Database(fixture_db, event_log=EventLog(events))
+    nomination_id, nomination = db.get_nominations()[0]
+    added = db.add_participant(nomination_id, "Добавлен вручную")
+    path = str(tmp_path / "participants.csv")
+    write_rows(path, ("nomination", "name"), [[(nomination, f"Из файла {i}") for i in range(50)]], "csv")
+    assert db.import_participants(path, "csv") == (50, 0)
+    db.delete_participant(added)
+    db.close()
+
+    # Каждая правка - короткая строка, каталог целиком пишется только в снимок
+    log = EventLog(events)
+    logged = list(log.events(log.snapshot_seq))
+    assert [event["type"] for event in logged] == ["add_participant"] * 51 + ["delete_participant"]
+    for _, segment in log.segments():
+        with open(segment, encoding="utf-8") as f:
+            assert max(len(line) for line in f) < 300
+
+    restored = str(tmp_path / "restored.db")
+    rebuild(log, restored)
+    participants = "SELECT id, nomination_id, name FROM participants ORDER BY id"
+    conns = [sqlite3.connect(restored), sqlite3.connect(fixture_db)]
+    try:
+        restored_rows, expected_rows = [conn.execute(participants).fetchall() for conn in conns]
+    finally:
+        for conn in conns:
+            conn.close()
+    assert restored_rows == expected_rows
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import sqlite3
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=42, chat_id=7, user_id=7)
+
+
+def test_vacuum_loop_survives_errors(tmp_path, caplog):
+    storage = SQLiteStorage(str(tmp_path / "fsm.db"), ttl=60, vacuum_interval=0.01)
+    vacuum = storage._vacuum
+    calls = []
+
+    def flaky_vacuum(expired_before):
+        calls.append(expired_before)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return vacuum(expired_before)
+
+    storage._vacuum = flaky_vacuum
+
+    async def scenario():
+        await storage.set_state(KEY, "VotingStates:waiting")
+        task = storage._vacuum_task
+        try:
+            while len(calls) < 3:
+                assert not task.done(), "цикл очистки остановился после ошибки"
+                await asyncio.sleep(0.01)
+        finally:
+            await storage.close()
+        return task
+
+    with caplog.at_level(logging.ERROR, logger="fsm_storage"):
+        task = asyncio.run(scenario())
+    assert "Очистка устаревших состояний FSM не удалась" in caplog.text
+    # После ошибки цикл продолжил работу и остановился только в close()
+    assert task.cancelled()
+
+
+def test_several_workers_are_refused(bot_main, monkeypatch):
+    monkeypatch.setenv("BOT_WORKERS", "2")
+    for storage in ("sqlite", "memory"):
+        monkeypatch.setenv("FSM_STORAGE", storage)
+        with pytest.raises(ValueError, match="BOT_WORKERS > 1"):
+            bot_main.create_fsm_storage()
+
+    # Один процесс - прежнее поведение: кэш без срока
+    monkeypatch.delenv("BOT_WORKERS")
+    monkeypatch.delenv("FSM_CACHE_TTL", raising=False)
+    monkeypatch.setenv("FSM_STORAGE", "sqlite")
+    assert bot_main.create_fsm_storage().cache_ttl is None
+
+
+def test_concurrent_set_state_and_set_data_keep_both(tmp_path):
+    path = str(tmp_path / "fsm.db")
+
+    async def scenario():
+        # Один процесс с кэшем и два процесса на общем файле
+        local = SQLiteStorage(path)
+        first, second = SQLiteStorage(path, cache_ttl=0), SQLiteStorage(path, cache_ttl=0)
+        other = StorageKey(bot_id=42, chat_id=8, user_id=8)
+        await asyncio.gather(
+            local.set_state(KEY, "VotingStates:waiting"),
+            local.set_data(KEY, {"nomination_id": 3}),
+            first.set_state(other, "AdminStates:waiting"),
+            second.set_data(other, {"participant_id": 5}),
+        )
+        fresh = SQLiteStorage(path)
+        seen = [(await storage.get_state(key), await storage.get_data(key))
+                for storage, key in ((local, KEY), (fresh, KEY), (first, other), (fresh, other))]
+        for storage in (local, first, second, fresh):
+            await storage.close()
+        return seen
+
+    assert asyncio.run(scenario()) == [
+        ("VotingStates:waiting", {"nomination_id": 3}),
+        ("VotingStates:waiting", {"nomination_id": 3}),
+        ("AdminStates:waiting", {"participant_id": 5}),
+        ("AdminStates:waiting", {"participant_id": 5}),
+    ]
+
+
+def test_set_data_does_not_revive_expired_state(tmp_path):
+    now = [1000.0]
+    storage = SQLiteStorage(str(tmp_path / "fsm.db"), ttl=60, vacuum_interval=0, clock=lambda: now[0])
+
+    async def scenario():
+        await storage.set_state(KEY, "VotingStates:waiting")
+        await storage.set_data(KEY, {"nomination_id": 3})
+        now[0] += 61
+        await storage.set_data(KEY, {"nomination_id": 4})
+        expired = await storage.get_state(KEY), await storage.get_data(KEY)
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        size = await storage.size()
+        await storage.close()
+        return expired, size
+
+    expired, size = asyncio.run(scenario())
+    assert expired == (None, {"nomination_id": 4})
+    # Пустая строка (без состояния и данных) удаляется из файла
+    assert size == 0
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.methods import AnswerCallbackQuery, EditMessageText
+
+from callbacks import VoteParticipantCallback
+
+from conftest import FakeSession, callback_update, count_votes, sent
+
+USER_ID = 7
+
+
+@pytest.mark.parametrize("forgery", ["unknown", "deleted", "other_nomination", "not_integer"])
+def test_forged_vote_callback_writes_no_vote(bot_main, fixture_db, forgery):
+    session = FakeSession()
+    bot = Bot("42:TEST", session=session)
+    votes_before = count_votes(fixture_db)
+
+    async def scenario():
+        db = bot_main.setup_services()
+        (participant_id, _), *_ = await db.get_participants(1)
+        (other_id, _), *_ = await db.get_participants(2)
+        if forgery == "deleted":
+            # Клавиатура показана до удаления участника из админ-панели
+            await db.delete_participant(participant_id)
+        data = {
+            "unknown": VoteParticipantCallback(nomination_id=1, participant_id=10 ** 9).pack(),
+            "deleted": VoteParticipantCallback(nomination_id=1, participant_id=participant_id).pack(),
+            "other_nomination": VoteParticipantCallback(nomination_id=1, participant_id=other_id).pack(),
+            "not_integer": f"vote_part:1:{participant_id}x",
+        }[forgery]
+        deleted_votes = votes_before - count_votes(fixture_db)
+
+        await bot_main.dp.feed_update(bot, callback_update(1, USER_ID, data))
+        state = await db.get_user_votes(USER_ID), await db.check_tally()
+        await db.close()
+        await bot_main.dp.storage.close()
+        return deleted_votes, state
+
+    deleted_votes, (user_votes, mismatches) = asyncio.run(scenario())
+    assert user_votes == []
+    assert mismatches == []
+    assert count_votes(fixture_db) == votes_before - deleted_votes
+    assert sent(session, EditMessageText) == []
+    answers = sent(session, AnswerCallbackQuery)
+    if forgery == "not_integer":
+        # callback_data не разбирается: фильтр не пропускает апдейт к хендлеру голосования
+        assert answers == []
+    else:
+        [answer] = answers
+        assert answer.show_alert
+        assert "не найден" in answer.text
@@ -0,0 +1,43 @@
+import asyncio
+import shutil
+import sqlite3
+
+from admin_panel import get_nominations_keyboard_admin
+from database import AsyncDatabase
+from keyboards import get_nominations_keyboard, get_participants_keyboard
+
+
+def button_texts(markup):
+    return [button.text for row in markup.inline_keyboard for button in row]
+
+
+def test_keyboards_are_not_shared_between_databases(fixture_db, tmp_path):
+    other_path = str(tmp_path / "other.db")
+    shutil.copy(fixture_db, other_path)
+    conn = sqlite3.connect(other_path)
+    with conn:
+        conn.execute("UPDATE nominations SET name = 'Другая номинация' WHERE id = 1")
+        conn.execute("UPDATE participants SET name = 'Другой участник' WHERE nomination_id = 1")
+    conn.close()
+
+    async def scenario():
+        first, other = AsyncDatabase(fixture_db), AsyncDatabase(other_path)
+        # У обеих баз каталог еще не менялся: версии одинаковые, а клавиатуры - нет
+        assert first.catalogue.full_version == other.catalogue.full_version
+        markups = []
+        for db in (first, other, first):
+            markups.append((
+                button_texts(await get_nominations_keyboard(db)),
+                button_texts(await get_participants_keyboard(db, 1)),
+                button_texts(await get_nominations_keyboard_admin(db, "add")),
+            ))
+        await first.close()
+        await other.close()
+        return markups
+
+    first, other, first_again = asyncio.run(scenario())
+    assert first == first_again
+    for markup, other_markup in zip(first, other):
+        assert markup != other_markup
+    assert "Другая номинация" in other[0] and "Другая номинация" not in first[0]
+    assert "Другой участник" in other[1]
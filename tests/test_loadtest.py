@@ -0,0 +1,29 @@
+import json
+import sys
+
+import loadtest
+
+
+def test_loadtest_ignores_production_event_log_and_backups(fixture_db, tmp_path, monkeypatch):
+    # Окружение боевого бота: журнал событий, шарды и каталог копий
+    events = tmp_path / "events"
+    backups = tmp_path / "backups"
+    monkeypatch.setenv("EVENT_LOG_DIR", str(events))
+    monkeypatch.setenv("VOTE_SHARDS", "2")
+    monkeypatch.setenv("BACKUP_DIR", str(backups))
+    for name in ("DB_PATH", "FSM_STORAGE", "FSM_DB_PATH", "VOTE_WRITE_BEHIND", "THROTTLE", "BACKUP_INTERVAL_MINUTES"):
+        monkeypatch.delenv(name, raising=False)
+
+    report_path = tmp_path / "loadtest.json"
+    monkeypatch.setattr(sys, "argv", [
+        "loadtest.py", "--users", "30", "--concurrency", "10", "--admin-interval-ms", "20",
+        "--db", fixture_db, "--output", str(report_path),
+    ])
+    loadtest.main()
+
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["errors"] == 0
+    assert report["consistency"]["tally_mismatches"] == 0
+    assert report["consistency"]["wrong_votes"] == 0
+    assert not events.exists()
+    assert not backups.exists()
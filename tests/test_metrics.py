@@ -0,0 +1,87 @@
+import asyncio
+import re
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import StorageKey
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from callbacks import VoteParticipantCallback
+from metrics import DEFAULT_BUCKETS
+
+from conftest import FakeSession, callback_update, message_update
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """Текст /metrics -> {(имя, ((метка, значение), ...)): число}"""
+    samples = {}
+    for line in text.splitlines():
+        name, labels, value = SAMPLE.match(line).groups()
+        samples[name, tuple(LABEL.findall(labels or ""))] = float(value)
+    return samples
+
+
+def test_metrics_endpoint(bot_main):
+    dp = bot_main.dp
+
+    async def scenario():
+        db = bot_main.setup_services()
+        metrics = bot_main.setup_metrics(db)
+        bot = Bot("42:TEST", session=FakeSession())
+        participants = [pid for pid, _ in await db.get_participants(1)]
+        first, second = participants[:2]
+
+        updates = [
+            message_update(1, 7, "/start"),
+            message_update(2, 7, "🗳️ Голосовать"),
+            callback_update(3, 7, VoteParticipantCallback(nomination_id=1, participant_id=first).pack()),
+            callback_update(4, 7, VoteParticipantCallback(nomination_id=1, participant_id=second).pack()),
+            message_update(5, 7, "📊 Мои голоса"),
+            message_update(6, 7, "📊 Мои голоса"),
+            message_update(7, 8, "📊 Мои голоса"),
+        ]
+        for update in updates:
+            await dp.feed_update(bot, update)
+        await dp.storage.set_state(StorageKey(bot_id=42, chat_id=7, user_id=7), "AdminStates:waiting")
+
+        app = web.Application()
+        app.router.add_get("/metrics", metrics.handle)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get("/metrics")
+            assert response.status == 200
+            assert response.content_type == "text/plain"
+            text = await response.text()
+        await db.close()
+        await dp.storage.close()
+        return text, len(participants), db.catalogue.stats(), db.sync.user_votes.stats()
+
+    text, participants, catalogue_stats, user_votes_stats = asyncio.run(scenario())
+    samples = parse_metrics(text)
+
+    # Гистограмма хендлера: корзины накопительные, +Inf равна числу вызовов
+    buckets = [value for (name, labels), value in samples.items()
+               if name == "bot_handler_seconds_bucket" and ("handler", "show_my_votes") in labels]
+    assert len(buckets) == len(DEFAULT_BUCKETS) + 1
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == 3
+    assert samples["bot_handler_seconds_count", (("handler", "show_my_votes"),)] == 3
+    assert samples["bot_handler_seconds_count", (("handler", "vote_for_participant"),)] == 2
+    assert samples["bot_handler_seconds_count", (("handler", "start_command"),)] == 1
+    assert samples["bot_handler_seconds_sum", (("handler", "start_command"),)] > 0
+    assert not any(name == "bot_handler_errors_total" for name, _ in samples)
+
+    # У пользователя 7 один голос (спросил дважды, второй раз - из кэша), у 8 - ни одного
+    assert samples["bot_db_rows_total", (("method", "get_user_votes"),)] == 2
+    assert samples["bot_db_rows_total", (("method", "get_participants"),)] == participants
+    assert samples["bot_db_query_seconds_count", (("method", "add_vote"),)] == 2
+    assert samples["bot_votes_total", (("status", "new"),)] == 1
+    assert samples["bot_votes_total", (("status", "changed"),)] == 1
+    assert samples["bot_votes_counted", ()] == 5
+
+    for prefix, stats in (("bot_catalogue_cache", catalogue_stats), ("bot_user_votes_cache", user_votes_stats)):
+        assert samples[f"{prefix}_hits", ()] == stats["hits"] > 0
+        assert samples[f"{prefix}_hit_ratio", ()] == stats["hits"] / (stats["hits"] + stats["misses"])
+    assert samples["bot_fsm_states", ()] == 1
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from database import Database
+from migrations import MIGRATIONS, SCHEMA_VERSION, get_version, migrate
+
+EXPECTED_INDEXES = {
+    "idx_votes_participant",
+    "idx_votes_nomination_participant",
+    "idx_participants_nomination",
+    "idx_participants_nomination_name",
+}
+
+
+def connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout=5000')
+    return conn
+
+
+@pytest.mark.parametrize("online", [False, True])
+def test_migrates_fixture_from_zero_to_head(fixture_db, online):
+    conn = connect(fixture_db)
+    try:
+        assert get_version(conn) == 0
+        votes_before = conn.execute('SELECT COUNT(*) FROM votes').fetchone()[0]
+
+        timings = migrate(conn, online=online, pause=0)
+
+        # Каждый шаг применен по порядку и замерен
+        assert [version for version, _, _ in timings] == [migration.version for migration in MIGRATIONS]
+        assert all(seconds >= 0 for _, _, seconds in timings)
+        assert get_version(conn) == SCHEMA_VERSION
+
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert EXPECTED_INDEXES <= indexes
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(votes)')}
+        assert "previous_participant_id" in columns
+        assert conn.execute('SELECT seq FROM event_log_state').fetchall() == [(0,)]
+        assert conn.execute('SELECT COUNT(*) FROM votes').fetchone()[0] == votes_before
+
+        # Повторный запуск ничего не делает
+        assert migrate(conn, online=online) == []
+    finally:
+        conn.close()
+
+
+def test_migrates_empty_database(empty_db):
+    conn = connect(empty_db)
+    try:
+        migrate(conn)
+        assert get_version(conn) == SCHEMA_VERSION
+        assert conn.execute('SELECT COUNT(*) FROM nominations').fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+def test_new_config_nomination_is_added_on_start(fixture_db, monkeypatch):
+    Database(fixture_db, pool_size=1).close()
+
+    # База уже на последней версии схемы: номинация из config добавляется при запуске, а не миграцией
+    monkeypatch.setattr(migrations, "NOMINATIONS", [*migrations.NOMINATIONS, "Новая номинация"])
+    db = Database(fixture_db, pool_size=1)
+    names = [name for _, name in db.get_nominations()]
+    db.close()
+    assert "Новая номинация" in names
+    assert len(names) == len(set(names))
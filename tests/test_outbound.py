@@ -0,0 +1,158 @@
+import asyncio
+import datetime
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChatMember
+from aiogram.types import Chat, ChatMemberMember, Message, User
+
+from outbound import OutboundQueue, send_priority
+
+
+class RecordingSession(BaseSession):
+    """Сессия без сети: запоминает время и текст отправленных сообщений.
+
+    retry_after - сколько первых sendMessage ответить ошибкой 429.
+    """
+
+    def __init__(self, retry_after=0, retry_after_seconds=1):
+        super().__init__()
+        self.sent = []
+        self.requests = 0
+        self.retry_after = retry_after
+        self.retry_after_seconds = retry_after_seconds
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        if isinstance(method, GetChatMember):
+            return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="user"))
+        if self.retry_after:
+            self.retry_after -= 1
+            raise TelegramRetryAfter(method, "Too Many Requests", self.retry_after_seconds)
+        self.sent.append((time.monotonic(), method.chat_id, method.text))
+        return Message(
+            message_id=len(self.sent),
+            date=datetime.datetime.now(),
+            chat=Chat(id=method.chat_id, type="private"),
+            text=method.text,
+        )
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_bot(queue, **session_options):
+    session = RecordingSession(**session_options)
+    session.middleware(queue)
+    return Bot("42:TEST", session=session), session
+
+
+def gaps(sent):
+    return [b[0] - a[0] for a, b in zip(sent, sent[1:])]
+
+
+def test_global_rate_is_respected():
+    async def scenario():
+        queue = OutboundQueue(global_rate=100, chat_rate=100, chat_burst=10)
+        bot, session = make_bot(queue)
+        started = time.monotonic()
+        await asyncio.gather(*(bot.send_message(chat_id, "x") for chat_id in range(1, 41)))
+        elapsed = time.monotonic() - started
+
+        assert len(session.sent) == 40
+        assert elapsed >= 39 / 100 * 0.95
+        assert min(gaps(session.sent)) >= 1 / 100 * 0.8
+        assert queue.stats()["sent"] == 40
+        assert queue.stats()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_chat_rate_allows_burst_then_spaces_messages():
+    async def scenario():
+        queue = OutboundQueue(global_rate=1000, chat_rate=20, chat_burst=3)
+        bot, session = make_bot(queue)
+        await asyncio.gather(*(bot.send_message(5, str(i)) for i in range(6)))
+
+        spacing = gaps(session.sent)
+        # Первые chat_burst уходят сразу, дальше не чаще chat_rate
+        assert sum(spacing[:2]) < 0.02
+        assert all(gap >= 1 / 20 * 0.8 for gap in spacing[2:])
+
+    asyncio.run(scenario())
+
+
+def test_vote_replies_overtake_admin_reports():
+    async def scenario():
+        queue = OutboundQueue(global_rate=50, chat_rate=100, chat_burst=10)
+        bot, session = make_bot(queue)
+
+        async def send(chat_id, text, priority):
+            send_priority.set(priority)
+            await bot.send_message(chat_id, text)
+
+        admin = [asyncio.create_task(send(100 + i, "admin", 2)) for i in range(5)]
+        await asyncio.sleep(0)
+        votes = [asyncio.create_task(send(200 + i, "vote", 0)) for i in range(5)]
+        await asyncio.gather(*admin, *votes)
+
+        order = [text for _, _, text in session.sent]
+        # Первый админский отчет ушел сразу, остальные ждали голосов
+        assert order == ["admin"] + ["vote"] * 5 + ["admin"] * 4
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_is_waited_and_retried():
+    async def scenario():
+        queue = OutboundQueue(global_rate=100, chat_rate=100, chat_burst=10)
+        bot, session = make_bot(queue, retry_after=1, retry_after_seconds=1)
+        started = time.monotonic()
+        message = await bot.send_message(7, "x")
+        assert message.text == "x"
+        assert time.monotonic() - started >= 0.95
+        assert queue.stats()["retries"] == 1
+        assert session.requests == 2
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_gives_up_after_max_retries():
+    async def scenario():
+        now = 0.0
+        sleeps = []
+
+        async def fake_sleep(delay):
+            nonlocal now
+            sleeps.append(delay)
+            now += delay
+
+        queue = OutboundQueue(max_retries=1, clock=lambda: now, sleep=fake_sleep)
+        bot, session = make_bot(queue, retry_after=5, retry_after_seconds=30)
+        with pytest.raises(TelegramRetryAfter):
+            await bot.send_message(7, "x")
+        assert session.requests == 2
+        # Повтор ждал retry_after по часам очереди, а не по реальному времени
+        assert sum(sleeps) >= 30
+        assert queue.stats()["retries"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_unshaped_methods_bypass_queue():
+    async def scenario():
+        queue = OutboundQueue(global_rate=1)
+        bot, session = make_bot(queue)
+        started = time.monotonic()
+        for user_id in range(5):
+            await bot.get_chat_member("@testchan", user_id)
+        assert time.monotonic() - started < 0.5
+        assert queue.stats()["sent"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+import pytest
+
+import database
+from database import Database
+
+
+@pytest.mark.parametrize("db_fixture", ["empty_db", "fixture_db"])
+def test_queries_do_not_scan_tables(request, db_fixture):
+    db = Database(request.getfixturevalue(db_fixture))
+    try:
+        assert db.find_full_scans() == []
+    finally:
+        db.close()
+
+
+def test_unindexed_query_is_reported(empty_db, monkeypatch):
+    monkeypatch.setattr(database, "QUERY_PLAN_CHECKS", (
+        ("by_username", "SELECT user_id FROM votes WHERE username = ?", ("x",), False),
+        ("ordered_walk", "SELECT user_id FROM votes ORDER BY user_id, nomination_id", (), False),
+        ("allowed", "SELECT * FROM votes", (), True),
+    ))
+    db = Database(empty_db)
+    try:
+        offenders = db.find_full_scans()
+    finally:
+        db.close()
+
+    assert [name for name, _ in offenders] == ["by_username", "ordered_walk"]
+    # Обход индекса целиком тоже считается полным сканированием
+    assert "USING COVERING INDEX" in offenders[1][1]
+
+
+@pytest.mark.parametrize("detail, full_scan", [
+    ("SCAN votes", True),
+    ("SCAN votes AS v", True),
+    ("SCAN v USING INDEX sqlite_autoindex_votes_1", True),
+    ("SCAN votes USING COVERING INDEX idx_votes_participant", True),
+    ("SCAN CONSTANT ROW", False),
+    ("SEARCH votes USING INDEX idx_votes_participant (participant_id=?)", False),
+])
+def test_full_scan_pattern(detail, full_scan):
+    assert bool(database._FULL_SCAN_RE.match(detail)) is full_scan
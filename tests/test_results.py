@@ -0,0 +1,161 @@
+import asyncio
+import shutil
+import sqlite3
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+
+from database import AsyncDatabase
+from results import LiveResults, get_results_text
+
+
+class FakeDatabase:
+    """Результаты и версия, которые тест меняет сам"""
+
+    def __init__(self):
+        self.votes = 1
+        self.results_version = (1, 1)
+        self.reads = 0
+        self.results_texts = {}
+
+    def vote(self):
+        self.votes += 1
+        self.results_version = (self.votes, 1)
+
+    async def get_vote_results(self):
+        self.reads += 1
+        return [("Трек года", "Участник", self.votes)]
+
+    async def get_total_votes_count(self):
+        return self.votes
+
+
+class FakeBot:
+    """Считает правки; fail - ошибки, которые выбросит следующий edit_message_text"""
+
+    def __init__(self):
+        self.edits = []
+        self.fail = []
+        self.pinned = set()
+
+    async def send_message(self, chat_id, text):
+        return SimpleNamespace(message_id=100 + chat_id)
+
+    async def pin_chat_message(self, chat_id, message_id, disable_notification=False):
+        self.pinned.add(chat_id)
+
+    async def unpin_chat_message(self, chat_id, message_id=None):
+        self.pinned.discard(chat_id)
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        if self.fail:
+            raise self.fail.pop(0)
+        self.edits.append((chat_id, message_id))
+
+
+async def wait_for(condition, timeout=1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.005)
+
+
+def test_edits_only_when_results_change():
+    async def scenario():
+        db, bot = FakeDatabase(), FakeBot()
+        live = LiveResults(db, interval=0.01)
+        for chat_id in (1, 2, 3):
+            await live.start(bot, chat_id)
+        assert bot.pinned == {1, 2, 3}
+        reads = db.reads
+
+        # Без новых голосов сообщения не трогаются
+        await asyncio.sleep(0.05)
+        assert bot.edits == []
+
+        db.vote()
+        await wait_for(lambda: len(bot.edits) == 3)
+        await asyncio.sleep(0.05)
+        assert sorted(bot.edits) == [(1, 101), (2, 102), (3, 103)]
+        # Текст собирается один раз на все чаты
+        assert db.reads == reads + 1
+        assert live.edits == 3
+        await live.close()
+
+    asyncio.run(scenario())
+
+
+def test_transient_error_keeps_task_alive():
+    async def scenario():
+        db, bot = FakeDatabase(), FakeBot()
+        live = LiveResults(db, interval=0.01)
+        await live.start(bot, 1)
+
+        bot.fail = [ConnectionError("network down")]
+        db.vote()
+        await wait_for(lambda: bot.edits)
+        # Ошибка не остановила задачу и не выкинула чат, правка прошла на следующем шаге
+        assert live._task is not None
+        assert live.messages == {1: 101}
+        assert bot.edits == [(1, 101)]
+
+        db.vote()
+        await wait_for(lambda: len(bot.edits) == 2)
+        await live.close()
+
+    asyncio.run(scenario())
+
+
+def test_deleted_message_stops_updates():
+    async def scenario():
+        db, bot = FakeDatabase(), FakeBot()
+        live = LiveResults(db, interval=0.01)
+        await live.start(bot, 1)
+        await live.start(bot, 2)
+
+        bot.fail = [TelegramBadRequest(EditMessageText(text="x"), "Bad Request: message to edit not found")]
+        db.vote()
+        await wait_for(lambda: len(live.messages) == 1 and bot.edits)
+        assert live.messages == {2: 102}
+        await live.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_waits_for_update_task():
+    async def scenario():
+        db, bot = FakeDatabase(), FakeBot()
+        live = LiveResults(db, interval=0.01)
+        await live.start(bot, 1)
+        task = live._task
+        await live.close()
+        # Задача отменена и завершилась до возврата из close
+        assert task.done() and task.cancelled()
+        assert live._task is None
+
+    asyncio.run(scenario())
+
+
+def test_results_text_is_not_shared_between_databases(fixture_db, tmp_path):
+    empty_path = str(tmp_path / "no_votes.db")
+    shutil.copy(fixture_db, empty_path)
+    conn = sqlite3.connect(empty_path)
+    with conn:
+        conn.execute("DELETE FROM votes")
+    conn.close()
+
+    async def scenario():
+        voted, empty = AsyncDatabase(fixture_db), AsyncDatabase(empty_path)
+        texts = [await get_results_text(db) for db in (voted, empty, voted)]
+        versions = voted.results_version, empty.results_version
+        await voted.close()
+        await empty.close()
+        return texts, versions
+
+    (voted, empty, voted_again), versions = asyncio.run(scenario())
+    # Версии у свежих баз совпадают, а тексты у каждой свои
+    assert versions[0] == versions[1]
+    assert "Всего голосов:</b> 4" in voted
+    assert empty is None
+    assert voted_again == voted
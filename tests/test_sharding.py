@@ -0,0 +1,83 @@
+import asyncio
+
+from database import AsyncDatabase, VoteStatus
+from metrics import Metrics
+
+
+async def open_sharded(path, shards=2):
+    db = AsyncDatabase(path, readers=2, shards=shards)
+    catalogue = []
+    for nomination_id, _ in await db.get_nominations():
+        participants = [pid for pid, _ in await db.get_participants(nomination_id)]
+        for i in range(len(participants), 2):
+            participants.append(await db.add_participant(nomination_id, f"Участник {i}"))
+        catalogue.append((nomination_id, participants))
+    return db, catalogue
+
+
+def test_sharded_votes_are_counted_in_metrics(empty_db):
+    async def scenario():
+        db, catalogue = await open_sharded(empty_db)
+        metrics = Metrics()
+        db.on_query = metrics.observe_query
+        nomination_id, participants = catalogue[0]
+        try:
+            results = await db.add_votes([(user_id, nomination_id, participants[0]) for user_id in range(4)])
+            assert [result.status for result in results] == [VoteStatus.NEW] * 4
+            await db.add_vote(0, nomination_id, participants[1])
+            assert metrics.votes == {"new": 4, "changed": 1}
+            assert metrics.query_latency["add_vote"].count == 5
+            assert await db.check_tally() == []
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_dead_shard_fails_votes_instead_of_hanging(empty_db):
+    async def scenario():
+        db, catalogue = await open_sharded(empty_db)
+        nomination_id, participants = catalogue[0]
+        try:
+            worker = db.shards._workers[0]
+            worker.kill()
+            worker.join()
+
+            # Голос, отправленный до того, как координатор заметил падение, тоже не зависает
+            result = await asyncio.wait_for(db.add_vote(2, nomination_id, participants[0]), timeout=5)
+            assert result.status is VoteStatus.FAILED
+            result = await asyncio.wait_for(db.add_vote(4, nomination_id, participants[0]), timeout=1)
+            assert result.status is VoteStatus.FAILED
+
+            # Второй шард продолжает работать
+            result = await asyncio.wait_for(db.add_vote(3, nomination_id, participants[0]), timeout=5)
+            assert result.status is VoteStatus.NEW
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
+
+
+def test_delete_participant_waits_for_votes_in_flight(empty_db):
+    async def scenario():
+        db, catalogue = await open_sharded(empty_db)
+        nomination_id, participants = catalogue[0]
+        try:
+            for round_ in range(5):
+                participant_id = await db.add_participant(nomination_id, f"Удаляемый {round_}")
+                votes = [
+                    asyncio.create_task(db.add_vote(1000 * round_ + user_id, nomination_id, participant_id))
+                    for user_id in range(300)
+                ]
+                # Голоса уже в очередях шардов, но ответы на них еще не пришли
+                await asyncio.sleep(0)
+                await db.delete_participant(participant_id)
+                await asyncio.gather(*votes)
+
+                assert await db.check_tally() == []
+                counts, _ = db.sync.tally.snapshot()
+                assert all(key[1] != participant_id for key in counts)
+        finally:
+            await db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,149 @@
+import asyncio
+import datetime
+
+import pytest
+from aiogram.types import Chat, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated, User
+
+from subscription import SubscriptionChecker
+
+CHANNEL = "@testchan"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubBot:
+    """get_chat_member по словарю статусов; считает запросы"""
+
+    def __init__(self, statuses=None, delay=0):
+        self.statuses = statuses or {}
+        self.delay = delay
+        self.requests = 0
+        self.errors = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.requests += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        user = User(id=user_id, is_bot=False, first_name="user")
+        if self.statuses.get(user_id, "member") == "left":
+            return ChatMemberLeft(user=user)
+        return ChatMemberMember(user=user)
+
+
+def chat_member_update(user_id, status, channel_username="testchan"):
+    user = User(id=user_id, is_bot=False, first_name="user")
+    old, new = ChatMemberLeft(user=user), ChatMemberMember(user=user)
+    if status == "left":
+        old, new = new, old
+    return ChatMemberUpdated(
+        chat=Chat(id=-100123, type="channel", username=channel_username),
+        from_user=user,
+        date=datetime.datetime.now(),
+        old_chat_member=old,
+        new_chat_member=new,
+    )
+
+
+def test_concurrent_checks_are_coalesced():
+    async def scenario():
+        bot = StubBot(delay=0.01)
+        checker = SubscriptionChecker(CHANNEL)
+        results = await asyncio.gather(*(checker.is_subscribed(bot, 7) for _ in range(20)))
+        assert results == [True] * 20
+        assert bot.requests == 1
+        assert checker.stats() == {"hits": 0, "misses": 1, "coalesced": 19, "size": 1}
+
+        # Дальше ответ берется из кэша
+        assert await checker.is_subscribed(bot, 7) is True
+        assert bot.requests == 1
+
+    asyncio.run(scenario())
+
+
+def test_positive_and_negative_ttl():
+    async def scenario():
+        clock = FakeClock()
+        bot = StubBot({2: "left"})
+        checker = SubscriptionChecker(CHANNEL, positive_ttl=300, negative_ttl=30, clock=clock)
+        assert await checker.is_subscribed(bot, 1) is True
+        assert await checker.is_subscribed(bot, 2) is False
+        assert bot.requests == 2
+
+        clock.now += 29
+        await checker.is_subscribed(bot, 1)
+        await checker.is_subscribed(bot, 2)
+        assert bot.requests == 2
+
+        # Отказ живет negative_ttl, подписка - positive_ttl
+        clock.now += 2
+        await checker.is_subscribed(bot, 1)
+        await checker.is_subscribed(bot, 2)
+        assert bot.requests == 3
+
+        clock.now += 270
+        await checker.is_subscribed(bot, 1)
+        assert bot.requests == 4
+
+    asyncio.run(scenario())
+
+
+def test_cache_is_bounded_lru():
+    async def scenario():
+        bot = StubBot()
+        checker = SubscriptionChecker(CHANNEL, maxsize=2)
+        await checker.is_subscribed(bot, 1)
+        await checker.is_subscribed(bot, 2)
+        await checker.is_subscribed(bot, 1)
+        await checker.is_subscribed(bot, 3)
+        assert checker.stats()["size"] == 2
+        assert bot.requests == 3
+
+        # Вытеснен давно не спрошенный 2, а не 1
+        await checker.is_subscribed(bot, 1)
+        assert bot.requests == 3
+        await checker.is_subscribed(bot, 2)
+        assert bot.requests == 4
+
+    asyncio.run(scenario())
+
+
+def test_errors_are_not_cached():
+    async def scenario():
+        bot = StubBot()
+        bot.errors = [ConnectionError("network down")]
+        checker = SubscriptionChecker(CHANNEL)
+        with pytest.raises(ConnectionError):
+            await checker.is_subscribed(bot, 1)
+        assert checker.stats()["size"] == 0
+
+        assert await checker.is_subscribed(bot, 1) is True
+        assert bot.requests == 2
+
+    asyncio.run(scenario())
+
+
+def test_update_from_chat_member():
+    async def scenario():
+        bot = StubBot()
+        checker = SubscriptionChecker(CHANNEL)
+        assert await checker.is_subscribed(bot, 1) is True
+
+        checker.update_from_chat_member(chat_member_update(1, "left"))
+        assert await checker.is_subscribed(bot, 1) is False
+        checker.update_from_chat_member(chat_member_update(1, "member"))
+        assert await checker.is_subscribed(bot, 1) is True
+        assert bot.requests == 1
+
+        # Апдейты из чужих чатов не трогают кэш
+        checker.update_from_chat_member(chat_member_update(1, "left", channel_username="other"))
+        assert await checker.is_subscribed(bot, 1) is True
+
+    asyncio.run(scenario())
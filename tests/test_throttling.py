@@ -0,0 +1,87 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.methods import AnswerCallbackQuery, EditMessageText
+
+from callbacks import VoteParticipantCallback
+from throttling import RateLimiter
+
+from conftest import FakeSession, callback_update, sent
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    clock = FakeClock()
+    limiter = RateLimiter({"vote": (2.0, 3)}, clock=clock)
+
+    assert [limiter.allow("vote", 1) for _ in range(4)] == [True, True, True, False]
+    # Другой пользователь - своя корзина
+    assert limiter.allow("vote", 2)
+
+    # За 0.5 с при 2 токенах в секунду восполняется один токен
+    clock.now = 0.5
+    assert [limiter.allow("vote", 1) for _ in range(2)] == [True, False]
+
+    # После долгого простоя корзина полна, но не больше burst
+    clock.now = 100
+    assert [limiter.allow("vote", 1) for _ in range(4)] == [True, True, True, False]
+    # Корзина пользователя 2 за это время простояла дольше восполнения и удалена
+    assert limiter.stats() == {"allowed": 8, "throttled": {"vote": 3}, "buckets": 1}
+
+
+def test_idle_buckets_are_evicted():
+    clock = FakeClock()
+    # Корзина "vote" заполняется за 3 / 2 = 1.5 с, "admin" - за 3 / 0.5 = 6 с: простой считается по самой долгой
+    limiter = RateLimiter({"vote": (2.0, 3), "admin": (0.5, 3)}, maxsize=3, clock=clock)
+
+    for user_id in range(3):
+        limiter.allow("vote", user_id)
+    assert limiter.stats()["buckets"] == 3
+
+    # Сверх maxsize вытесняется корзина, к которой дольше всех не обращались
+    clock.now = 1
+    limiter.allow("vote", 0)
+    limiter.allow("vote", 3)
+    assert set(limiter._buckets) == {("vote", 0), ("vote", 2), ("vote", 3)}
+
+    # Простоявшие дольше полного восполнения удаляются при следующем обращении
+    clock.now = 6.5
+    limiter.allow("admin", 4)
+    assert set(limiter._buckets) == {("vote", 0), ("vote", 3), ("admin", 4)}
+    clock.now = 20
+    limiter.allow("vote", 5)
+    assert set(limiter._buckets) == {("vote", 5)}
+
+
+def test_throttled_callback_is_answered_without_handler(bot_main, monkeypatch):
+    monkeypatch.setenv("THROTTLE", "1")
+    monkeypatch.setenv("THROTTLE_VOTE", "0.01,2")
+    session = FakeSession()
+    bot = Bot("42:TEST", session=session)
+
+    async def scenario():
+        db = bot_main.setup_services()
+        participants = await db.get_participants(1)
+        for update_id, (participant_id, _) in enumerate(participants[:3], 1):
+            data = VoteParticipantCallback(nomination_id=1, participant_id=participant_id).pack()
+            await bot_main.dp.feed_update(bot, callback_update(update_id, 7, data))
+        votes = await db.get_user_votes(7)
+        await db.close()
+        await bot_main.dp.storage.close()
+        return participants, votes
+
+    participants, votes = asyncio.run(scenario())
+    # Два голоса дошли до хендлера, третий отброшен до него: голос остался за вторым участником
+    assert len(sent(session, EditMessageText)) == 2
+    [answer] = sent(session, AnswerCallbackQuery)
+    assert answer.callback_query_id == "3"
+    assert "Слишком часто" in answer.text
+    [(_, participant_name)] = votes
+    assert participant_name == participants[1][1]
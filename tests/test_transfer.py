@@ -0,0 +1,226 @@
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+from aiogram.filters import CommandObject
+
+import admin_panel
+from database import AsyncDatabase, Database
+from loadtest import inflate_votes, load_catalogue
+from transfer import MAX_DOCUMENT_SIZE, detect_format, read_rows, write_rows
+
+from conftest import FIXTURE_DB, count_votes
+
+MILLION = 1000000
+
+
+@pytest.fixture(scope="module")
+def million_votes_db(tmp_path_factory):
+    """Копия voting.db с миллионом голосов: одна на модуль, заполняется ~10 с"""
+    path = str(tmp_path_factory.mktemp("export") / "voting.db")
+    shutil.copy(FIXTURE_DB, path)
+    inflate_votes(path, load_catalogue(path), MILLION)
+    return path
+
+
+class FakeMessage:
+    """Сообщение админа: ответы и отправленные документы остаются в списках"""
+
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.answers = []
+        self.documents = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+    async def answer_document(self, document, caption=None, **kwargs):
+        # Временный файл удаляется сразу после отправки, поэтому читаем его здесь
+        with open(document.path, "rb") as f:
+            magic = f.read(2)
+        self.documents.append((document.filename, os.path.getsize(document.path), magic, caption))
+
+
+def export(db_path, args):
+    async def scenario():
+        db = AsyncDatabase(db_path)
+        message = FakeMessage()
+        started = time.perf_counter()
+        await admin_panel.export_data(message, CommandObject(prefix="/", command="export", args=args), db)
+        elapsed = time.perf_counter() - started
+        await db.close()
+        return message, elapsed
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_gzip_round_trip(tmp_path, fmt):
+    columns = ("nomination", "name")
+    rows = [("Трек года", f"Участник {i}") for i in range(1000)]
+    path = str(tmp_path / f"participants.{fmt}.gz")
+
+    assert write_rows(path, columns, [rows[:500], rows[500:]], fmt) == 1000
+    with open(path, "rb") as f:
+        assert f.read(2) == b"\x1f\x8b"
+    assert [(row["nomination"], row["name"]) for row in read_rows(path, fmt)] == rows
+
+
+def test_detect_format_sees_through_gzip():
+    assert detect_format("votes.csv.gz") == "csv"
+    assert detect_format("VOTES.NDJSON.GZ") == "ndjson"
+    assert detect_format("votes.gz") is None
+    assert detect_format("votes.csv") == "csv"
+
+
+def test_import_gzipped_participants(fixture_db, tmp_path):
+    path = str(tmp_path / "participants.csv.gz")
+    write_rows(path, ("nomination", "name"), [[("Трек года", "Новый"), ("Нет такой", "Кто-то")]], "csv")
+    db = Database(fixture_db)
+    assert db.import_participants(path, "csv") == (1, 1)
+    db.close()
+
+
+def test_small_export_is_sent_as_is(fixture_db):
+    message, _ = export(fixture_db, "participants csv")
+    [(filename, size, magic, caption)] = message.documents
+    assert filename == "participants.csv"
+    assert magic != b"\x1f\x8b"
+
+
+def test_export_over_limit_even_compressed_is_refused(fixture_db, monkeypatch):
+    monkeypatch.setattr(admin_panel, "MAX_DOCUMENT_SIZE", 10)
+    message, _ = export(fixture_db, "participants csv")
+    assert message.documents == []
+    assert "больше лимита Telegram" in message.answers[0]
+
+
+def test_export_rejects_unknown_option(fixture_db):
+    message, _ = export(fixture_db, "votes csv zip")
+    assert message.documents == []
+    assert message.answers[0].startswith("Использование")
+
+
+@pytest.mark.slow
+def test_million_votes_csv_is_compressed_to_fit_limit(million_votes_db):
+    message, elapsed = export(million_votes_db, "votes csv")
+    [(filename, size, magic, caption)] = message.documents
+
+    # Несжатый CSV миллиона голосов больше 50 МБ, поэтому уходит .csv.gz
+    assert filename == "votes.csv.gz"
+    assert magic == b"\x1f\x8b"
+    assert size <= MAX_DOCUMENT_SIZE
+    assert caption.startswith(f"📤 votes: {count_votes(million_votes_db)} строк")
+    assert elapsed < 120, f"/export votes csv, {MILLION} строк: {size / 2 ** 20:.1f} МиБ за {elapsed:.1f} с"
+
+
+@pytest.mark.slow
+def test_million_votes_ndjson_gz_export(million_votes_db):
+    message, elapsed = export(million_votes_db, "votes ndjson gz")
+    [(filename, size, magic, caption)] = message.documents
+
+    # Несжатый NDJSON миллиона голосов около 200 МБ, сжатый - в пределах лимита
+    assert filename == "votes.ndjson.gz"
+    assert size <= MAX_DOCUMENT_SIZE
+    assert caption.startswith(f"📤 votes: {count_votes(million_votes_db)} строк")
+    assert elapsed < 120, f"/export votes ndjson gz, {MILLION} строк: {size / 2 ** 20:.1f} МиБ за {elapsed:.1f} с"
+
+
+def participant_batches(nominations, count, batch_size=10000):
+    """count строк (номинация, уникальное имя) пачками для write_rows"""
+    for start in range(0, count, batch_size):
+        yield [(nominations[i % len(nominations)], f"Участник {i}") for i in range(start, min(start + batch_size, count))]
+
+
+def count_only_in(first_path, second_path):
+    """Сколько пар (номинация, имя) участников есть в first_path, но нет в second_path"""
+    conn = sqlite3.connect(first_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS other", (second_path,))
+        return conn.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT nomination_id, name FROM main.participants
+                EXCEPT
+                SELECT nomination_id, name FROM other.participants
+            )
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def data_size(path):
+    """Размер файла без сжатия"""
+    if not path.endswith(".gz"):
+        return os.path.getsize(path)
+    with gzip.open(path, "rb") as f:
+        return sum(len(chunk) for chunk in iter(lambda: f.read(2 ** 20), b""))
+
+
+def import_and_round_trip(fixture_db, tmp_path, filename, count):
+    """Загружает count новых участников из filename и сверяет выгрузку с загрузкой в чистую копию.
+
+    Возвращает время загрузки под tracemalloc.
+    """
+    fmt = detect_format(filename)
+    path = str(tmp_path / filename)
+    db = Database(fixture_db)
+    nominations = [name for _, name in db.get_nominations()]
+    existing = sum(len(db.get_participants(nomination_id)) for nomination_id, _ in db.get_nominations())
+    assert write_rows(path, ("nomination", "name"), participant_batches(nominations, count), fmt) == count
+
+    # Память меряется до перезагрузки каталога: в нем все участники держатся по задумке
+    reload_catalogue = db._catalogue_changed
+    peaks = []
+
+    def measured_reload(*args):
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        reload_catalogue(*args)
+
+    db._catalogue_changed = measured_reload
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        added, skipped = db.import_participants(path, fmt)
+    finally:
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+
+    assert (added, skipped) == (count, 0)
+    assert len(db.catalogue.get().participant_info) == existing + count
+    # Файл не читается в память целиком: пик много меньше данных в нем
+    [peak] = peaks
+    size = data_size(path)
+    assert peak < size / 4, f"пик {peak / 2 ** 20:.1f} МиБ при {size / 2 ** 20:.1f} МиБ данных"
+
+    # Выгрузка и загрузка сходятся: участники из выгрузки дают в чистой копии ту же таблицу
+    exported = str(tmp_path / f"exported.{filename}")
+    assert db.export("participants", exported, fmt) == existing + count
+    db.close()
+
+    restored_path = str(tmp_path / "restored.db")
+    shutil.copy(FIXTURE_DB, restored_path)
+    restored = Database(restored_path)
+    assert restored.import_participants(exported, fmt) == (count, existing)
+    restored.close()
+    assert count_only_in(fixture_db, restored_path) == 0
+    assert count_only_in(restored_path, fixture_db) == 0
+    return elapsed
+
+
+@pytest.mark.parametrize("filename", ["participants.csv", "participants.ndjson.gz"])
+def test_participants_import_and_round_trip(fixture_db, tmp_path, filename):
+    import_and_round_trip(fixture_db, tmp_path, filename, 50000)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("filename", ["participants.csv", "participants.ndjson.gz"])
+def test_million_participants_import_and_round_trip(fixture_db, tmp_path, filename):
+    elapsed = import_and_round_trip(fixture_db, tmp_path, filename, MILLION)
+    assert elapsed < 180, f"/import {filename}, {MILLION} строк за {elapsed:.1f} с (под tracemalloc)"
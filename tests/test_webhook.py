@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.methods import DeleteWebhook, SendMessage, SetWebhook
+from aiohttp.test_utils import TestClient, TestServer
+
+from conftest import FakeSession, sent
+
+SECRET = "s3cret"
+
+START_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": 7, "type": "private"},
+        "from": {"id": 7, "is_bot": False, "first_name": "User"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}
+
+
+async def wait_for(condition, timeout=2):
+    # SimpleRequestHandler отвечает 200 сразу, апдейт обрабатывается в фоне
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+def test_secret_token_is_checked_and_update_reaches_handler(bot_main):
+    session = FakeSession()
+    bot = Bot("42:TEST", session=session)
+
+    async def scenario():
+        app = bot_main.create_webhook_app(bot, secret_token=SECRET)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post("/webhook", json=START_UPDATE)
+            assert response.status == 401
+            response = await client.post(
+                "/webhook", json=START_UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+            )
+            assert response.status == 401
+            assert not await wait_for(lambda: sent(session, SendMessage), timeout=0.2)
+
+            response = await client.post(
+                "/webhook", json=START_UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            )
+            assert response.status == 200
+            assert await wait_for(lambda: sent(session, SendMessage))
+
+    asyncio.run(scenario())
+    messages = sent(session, SendMessage)
+    assert len(messages) == 1
+    assert messages[0].chat_id == 7
+    assert "Добро пожаловать" in messages[0].text
+    # Без webhook_url вебхук в Telegram не регистрируется и не удаляется
+    assert sent(session, SetWebhook) == []
+    assert sent(session, DeleteWebhook) == []
+
+
+def test_webhook_is_registered_only_with_url(bot_main):
+    session = FakeSession()
+    bot = Bot("42:TEST", session=session)
+    url = "https://bot.example.com/hook"
+
+    async def scenario():
+        app = bot_main.create_webhook_app(bot, path="/hook", secret_token=SECRET, webhook_url=url)
+        async with TestClient(TestServer(app)):
+            registered = sent(session, SetWebhook)
+            assert sent(session, DeleteWebhook) == []
+        return registered
+
+    registered = asyncio.run(scenario())
+    assert len(registered) == 1
+    assert registered[0].url == url
+    assert registered[0].secret_token == SECRET
+    assert "message" in registered[0].allowed_updates
+    # Вебхук снимается при остановке приложения
+    assert len(sent(session, DeleteWebhook)) == 1
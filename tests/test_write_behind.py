@@ -0,0 +1,123 @@
+import asyncio
+import sqlite3
+
+from database import AsyncDatabase, VoteResult, VoteStatus, VoteWriteBehind
+
+
+class RecordingDatabase:
+    """Вместо базы запоминает пачки, которые ему отдала очередь"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def add_votes(self, votes):
+        self.batches.append(list(votes))
+        return [VoteResult(VoteStatus.NEW)] * len(votes)
+
+
+def vote(user_id):
+    return (user_id, 1, 1, None, None, None)
+
+
+def test_full_batch_is_written_without_waiting_for_interval():
+    async def scenario():
+        db = RecordingDatabase()
+        queue = VoteWriteBehind(db, batch_size=3, flush_interval_ms=10000)
+        started = asyncio.get_running_loop().time()
+        results = await asyncio.wait_for(asyncio.gather(*(queue.submit(vote(i)) for i in range(3))), 1)
+        elapsed = asyncio.get_running_loop().time() - started
+        await queue.close()
+        return db.batches, results, elapsed
+
+    batches, results, elapsed = asyncio.run(scenario())
+    assert batches == [[vote(0), vote(1), vote(2)]]
+    assert [result.status for result in results] == [VoteStatus.NEW] * 3
+    assert elapsed < 1
+
+
+def test_partial_batch_is_written_after_interval():
+    async def scenario():
+        db = RecordingDatabase()
+        queue = VoteWriteBehind(db, batch_size=100, flush_interval_ms=20)
+        first = await asyncio.gather(queue.submit(vote(0)), queue.submit(vote(1)))
+        second = await queue.submit(vote(2))
+        await queue.close()
+        return db.batches, first, second
+
+    batches, first, second = asyncio.run(scenario())
+    assert batches == [[vote(0), vote(1)], [vote(2)]]
+    assert len(first) == 2 and second.ok
+
+
+def test_close_drains_queued_votes():
+    async def scenario():
+        db = RecordingDatabase()
+        queue = VoteWriteBehind(db, batch_size=4, flush_interval_ms=10000)
+        pending = [asyncio.create_task(queue.submit(vote(i))) for i in range(10)]
+        await asyncio.sleep(0)
+        await queue.close()
+        return db.batches, pending
+
+    batches, pending = asyncio.run(scenario())
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert all(task.done() and task.result().ok for task in pending)
+
+
+async def open_write_behind(path, **options):
+    db = AsyncDatabase(path, write_behind=True, **options)
+    nomination_id, _ = (await db.get_nominations())[0]
+    participants = [pid for pid, _ in await db.get_participants(nomination_id)]
+    while len(participants) < 2:
+        participants.append(await db.add_participant(nomination_id, f"Участник {len(participants)}"))
+    return db, nomination_id, participants
+
+
+def test_statuses_within_one_batch(fixture_db):
+    async def scenario():
+        db, nomination_id, (first, second, *_) = await open_write_behind(fixture_db, batch_size=10)
+        user_id = 10 ** 12
+        results = await asyncio.gather(
+            db.add_vote(user_id, nomination_id, first),
+            db.add_vote(user_id, nomination_id, second),
+            db.add_vote(user_id, nomination_id, second),
+        )
+        mismatches = await db.check_tally()
+        await db.close()
+        return results, mismatches, second
+
+    results, mismatches, second = asyncio.run(scenario())
+    assert [result.status for result in results] == [VoteStatus.NEW, VoteStatus.CHANGED, VoteStatus.UNCHANGED]
+    assert results[1].previous_participant_id != second
+    assert results[2].previous_participant_id == second
+    assert mismatches == []
+
+
+def test_delete_participant_waits_for_queued_votes(fixture_db):
+    async def scenario():
+        db, nomination_id, (participant_id, *_) = await open_write_behind(
+            fixture_db, batch_size=10, flush_interval_ms=50
+        )
+        total_before = await db.get_total_votes_count()
+        queued = [asyncio.create_task(db.add_vote(10 ** 12 + i, nomination_id, participant_id)) for i in range(100)]
+        await asyncio.sleep(0)
+        await db.delete_participant(participant_id)
+        # Голос, пришедший после удаления, не пишется
+        late = await db.add_vote(2 * 10 ** 12, nomination_id, participant_id)
+        results = [await task for task in queued]
+        state = await db.get_total_votes_count(), await db.check_tally()
+        await db.close()
+        return results, late, total_before, state, participant_id
+
+    results, late, total_before, (total, mismatches), participant_id = asyncio.run(scenario())
+    # Голоса из очереди записаны до удаления и удалены вместе с участником
+    assert [result.status for result in results] == [VoteStatus.NEW] * 100
+    assert late.status is VoteStatus.FAILED
+    assert mismatches == []
+    conn = sqlite3.connect(fixture_db)
+    try:
+        orphans = conn.execute("SELECT COUNT(*) FROM votes WHERE participant_id = ?", (participant_id,)).fetchone()[0]
+        in_db = conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+    finally:
+        conn.close()
+    assert orphans == 0
+    assert total == in_db <= total_before
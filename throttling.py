@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+# Группы хендлеров по тексту кнопки или команде
+MESSAGE_GROUPS = {
+    "🗳️ Голосовать": "vote",
+    "🏆 Результаты": "results",
+    "📊 Мои голоса": "results",
+    "📊 Статистика": "admin",
+    "👥 Кто голосовал": "admin",
+    "/export": "admin",
+    "/import": "admin",
+    "/check_tally": "admin",
+    "/query_plans": "admin",
+    "/live": "admin",
+    "/backup": "admin",
+}
+
+# Группы по префиксу callback_data (часть до первого ":")
+CALLBACK_GROUPS = {
+    "vote_nom": "vote",
+    "vote_part": "vote",
+    "back_to_nominations": "vote",
+    "voters": "admin",
+    "admin_nom": "admin",
+    "admin_del_part": "admin",
+}
+
+# Лимиты по умолчанию: группа -> (токенов в секунду, размер корзины)
+DEFAULT_LIMITS = {
+    "vote": (2.0, 5),
+    "results": (0.5, 3),
+    "admin": (0.5, 3),
+}
+
+
+def classify(event):
+    """Группа лимита для сообщения или callback, None - без ограничений"""
+    if isinstance(event, CallbackQuery):
+        return CALLBACK_GROUPS.get((event.data or "").split(":", 1)[0])
+    if isinstance(event, Message) and event.text:
+        return MESSAGE_GROUPS.get(event.text.split(maxsplit=1)[0] if event.text.startswith("/") else event.text)
+    return None
+
+
+class RateLimiter:
+    """Корзины токенов на пару (группа, пользователь).
+
+    Корзина хранит два числа: сколько токенов осталось и когда она обновлялась.
+    Корзины лежат в порядке последнего обращения; простаивавшие дольше времени
+    полного восполнения ничем не отличаются от новых и удаляются с начала очереди,
+    а всего хранится не больше maxsize корзин.
+    """
+
+    def __init__(self, limits=None, maxsize=100000, clock=time.monotonic):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.maxsize = maxsize
+        self._clock = clock
+        # (группа, user_id) -> [токены, время обновления]
+        self._buckets = OrderedDict()
+        # Сколько простаивать, чтобы корзина заполнилась целиком
+        self._idle = max((burst / rate for rate, burst in self.limits.values()), default=0)
+        self.allowed = 0
+        self.throttled = dict.fromkeys(self.limits, 0)
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key = next(iter(buckets))
+            if len(buckets) <= self.maxsize and now - buckets[key][1] < self._idle:
+                break
+            del buckets[key]
+
+    def allow(self, group, user_id):
+        """Списывает токен, если он есть; False - запрос нужно отбросить"""
+        rate, burst = self.limits[group]
+        now = self._clock()
+        key = (group, user_id)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        self._evict(now)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return True
+        self.throttled[group] += 1
+        return False
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "throttled": dict(self.throttled),
+            "buckets": len(self._buckets),
+        }
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer-middleware для message и callback_query: отбрасывает запросы сверх лимита
+    до фильтров и хендлеров. На лишний callback бот отвечает только callback.answer,
+    лишние сообщения молча пропускаются.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    async def __call__(self, handler, event, data):
+        group = classify(event)
+        if group is None or group not in self.limiter.limits or event.from_user is None:
+            return await handler(event, data)
+
+        if self.limiter.allow(group, event.from_user.id):
+            return await handler(event, data)
+
+        if isinstance(event, CallbackQuery):
+            await event.answer("⏳ Слишком часто, подождите пару секунд")
+        return None